@@ -0,0 +1,132 @@
+# analysis/benchmark_keyword_pruning.py
+"""
+Benchmark MaxScore top-k keyword retrieval against exhaustive scoring.
+
+For every query MaxScore (PositionalIndex.rank with pruning forced on),
+PositionalIndex.rank_exhaustive and PositionalIndex.rank as shipped (which
+prunes only from search.keyword.prune_min_postings postings on) are run; the script reports
+how many postings MaxScore scored, the wall time of each, broken down by
+the number of postings a query touches, and checks that the top-k scores
+agree.
+
+Corpora:
+- sample:    chunks of the markdown notes in data/documents
+- synthetic: Zipf-distributed random text (--synthetic_docs chunks)
+
+Usage example:
+  python -m analysis.benchmark_keyword_pruning --k 10 --synthetic_docs 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from src.config import Config
+from src.indexer import DocumentIndexer
+from src.positional import PositionalIndex, tokenize
+
+
+def sample_corpus(documents_dir: str) -> List[str]:
+    indexer = DocumentIndexer(Config())
+    documents = indexer.index_directory(documents_dir)
+    return [chunk['content'] for doc in documents for chunk in indexer.chunk_document(doc)]
+
+
+def synthetic_corpus(num_docs: int, vocab_size: int, doc_length: int, seed: int) -> List[str]:
+    rng = np.random.default_rng(seed)
+    vocab = np.array([f"t{i}" for i in range(vocab_size)])
+    weights = 1.0 / np.arange(1, vocab_size + 1)
+    weights /= weights.sum()
+    return [' '.join(rng.choice(vocab, size=doc_length, p=weights)) for _ in range(num_docs)]
+
+
+def make_queries(index: PositionalIndex, texts: List[str], num_queries: int, seed: int) -> List[List[str]]:
+    """2-5 distinct terms of a random chunk, so frequent and rare terms mix"""
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < num_queries:
+        tokens = tokenize(rng.choice(texts))
+        if len(tokens) >= 5:
+            terms = sorted(set(tokens))
+            queries.append(rng.sample(terms, min(len(terms), rng.randint(2, 5))))
+    return queries
+
+
+# Upper ends of the postings-per-query buckets of the time breakdown
+BUCKETS = (1000, 10000, 30000, 100000, float('inf'))
+
+
+def timed(function, *args, **kwargs) -> Tuple[list, float]:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run(name: str, texts: List[str], k: int, num_queries: int, seed: int) -> Dict[str, float]:
+    index = PositionalIndex()
+    start = time.perf_counter()
+    index.build(texts)
+    build_time = time.perf_counter() - start
+
+    pruning = PositionalIndex(prune_min_postings=0)
+    pruning.postings, pruning.doc_lengths = index.postings, index.doc_lengths
+
+    queries = make_queries(index, texts, num_queries, seed)
+    totals = {'scored': 0, 'total': 0, 'mismatches': 0}
+    # bucket -> [queries, MaxScore, exhaustive, rank() seconds]
+    buckets = {limit: [0, 0.0, 0.0, 0.0] for limit in BUCKETS}
+
+    for terms in queries:
+        stats: Dict[str, int] = {}
+        pruned, pruned_time = timed(pruning.rank, terms, k, stats=stats)
+        exhaustive, exhaustive_time = timed(index.rank_exhaustive, terms, k)
+        _, shipped_time = timed(index.rank, terms, k)
+
+        totals['scored'] += stats['scored']
+        totals['total'] += stats['total']
+        if not np.allclose([s for _, s in pruned], [s for _, s in exhaustive]):
+            totals['mismatches'] += 1
+        bucket = buckets[next(limit for limit in BUCKETS if stats['total'] < limit)]
+        for i, seconds in enumerate((1, pruned_time, exhaustive_time, shipped_time)):
+            bucket[i] += seconds
+
+    skipped = 1 - totals['scored'] / max(totals['total'], 1)
+    print(f"[{name}] chunks={len(texts)} terms={len(index.postings.terms)} "
+          f"build={build_time:.2f}s queries={len(queries)} k={k}")
+    print(f"  postings scored: MaxScore {totals['scored']} / exhaustive {totals['total']} "
+          f"({skipped:.1%} skipped)")
+    print("  ms per query by postings per query: MaxScore / exhaustive / rank()")
+    low = 0
+    for limit, (count, pruned_time, exhaustive_time, shipped_time) in buckets.items():
+        if count:
+            print(f"    {low:>6}-{limit:<6} ({count:>3} queries): {1000 * pruned_time / count:.2f} / "
+                  f"{1000 * exhaustive_time / count:.2f} / {1000 * shipped_time / count:.2f}")
+        low = limit
+    print(f"  top-k score mismatches: {totals['mismatches']}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--documents", default="data/documents", help="Sample markdown directory.")
+    parser.add_argument("--k", type=int, default=10, help="Results per query.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per corpus.")
+    parser.add_argument("--synthetic_docs", type=int, default=20000, help="Synthetic corpus size (chunks).")
+    parser.add_argument("--vocab_size", type=int, default=50000, help="Synthetic vocabulary size.")
+    parser.add_argument("--doc_length", type=int, default=200, help="Synthetic chunk length (tokens).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    run("sample", sample_corpus(args.documents), args.k, args.queries, args.seed)
+    run("synthetic",
+        synthetic_corpus(args.synthetic_docs, args.vocab_size, args.doc_length, args.seed),
+        args.k, args.queries, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,9 @@ from datetime import date, datetime
 import json
 import sys
 import os
+import threading
+import time
+import argparse
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent))
@@ -16,7 +19,12 @@ from src.config import Config
 from src.indexer import DocumentIndexer
 from src.search import HybridSearch
 from src.clustering import AutoClusterer
+from src.cluster_cache import FitCache
+from src.partitions import load_centroids
 from src.rag import RAGSystem
+from src.jobs import JobManager
+from src.index_store import IndexStore, IndexHandle
+from src.server import serve_prefork
 
 
 # Custom JSON encoder for date/datetime objects
@@ -36,23 +44,138 @@ app.json_encoder = DateTimeEncoder
 
 # Initialize components
 config = Config()
-indexer = DocumentIndexer(config)
-search_engine = None
-rag_system = None
+
+# The live index (engine, RAG system and the documents it was built from) is
+# published through a reference-counted handle: requests pin a generation for
+# their duration and a rebuild swaps in a new one without tearing readers
+index_handle = IndexHandle()
+index_root = Path(__file__).parent / "data" / "index"
+cluster_root = Path(__file__).parent / "data" / "clusters"
+index_store = IndexStore(index_root, keep_versions=config.get('index.keep_versions', 3))
+# Earlier clustering results: switching algorithms back and forth in the UI
+# loads them instead of clustering again
+fit_cache = (FitCache(Path(__file__).parent / "data" / "cluster_cache",
+                      config.get('clustering.cache.max_entries', 8))
+             if config.get('clustering.cache.enabled', True) else None)
+
+# Background indexing jobs; status is persisted so every worker can report it
+jobs = JobManager(state_dir=index_root / "jobs")
+INDEX_STAGES = ['files_parsed', 'chunks_embedded', 'index_written']
+
+# Seconds between checks for index versions published by other processes
+INDEX_SYNC_INTERVAL = config.get('server.index_sync_interval', 2.0)
+_sync_lock = threading.Lock()
+_last_sync = 0.0
+
+# Embedding model, reranker and query router shared by every engine this
+# process builds
+_embedding_model = None
+_reranker = None
+_router = None
+
+
+def new_search_engine():
+    """Create an empty engine that reuses the already loaded models"""
+    global _embedding_model, _reranker, _router
+    engine = HybridSearch(config, model=_embedding_model, reranker=_reranker, router=_router)
+    if engine.semantic_search is not None:
+        _embedding_model = engine.semantic_search.model
+    _reranker = engine.reranker
+    _router = engine.router
+    return engine
+
+
+def attach_partitions(engine):
+    """Partition an engine's chunks around the saved cluster centroids"""
+    try:
+        engine.set_partitions(load_centroids(cluster_root))
+    except ValueError as e:
+        print(f"Warning: Cluster partitions not used: {e}")
+
+
+def clustering_documents(documents):
+    """Indexed documents in the form AutoClusterer takes"""
+    return [
+        {
+            'content': doc.content,
+            'metadata': {
+                'title': doc.title,
+                'path': doc.path,
+                'tags': doc.tags
+            },
+            'minhash': doc.minhash
+        }
+        for doc in documents
+    ]
+
+
+def update_clusters(documents):
+    """Assign new documents to the saved clusters (refitting once due)"""
+    if not (cluster_root / "clusters.json").exists():
+        return
+    try:
+        clusterer = AutoClusterer(config)
+        clusterer.model = _embedding_model
+        clusterer.fit_cache = fit_cache
+        clusterer.load(str(cluster_root))
+        result = clusterer.update(clustering_documents(documents))
+        clusterer.save(str(cluster_root))
+        if result['reclustered']:
+            print(f"✓ Reclustered {len(documents)} documents into {result['num_clusters']} clusters")
+        elif result['assigned']:
+            print(f"✓ Assigned {result['assigned']} new documents to clusters "
+                  f"({clusterer.pending_documents} pending before a refit)")
+    except Exception as e:
+        print(f"Warning: Could not update clusters: {e}")
+
+
+def load_generation(path):
+    """Load a published index version and swap it in"""
+    loaded_indexer = DocumentIndexer(config)
+    loaded_indexer.load_index(path / "documents.json")
+    loaded_engine = new_search_engine()
+    loaded_engine.load(str(path))
+    attach_partitions(loaded_engine)
+    index_handle.swap(loaded_engine, RAGSystem(config, loaded_engine),
+                      loaded_indexer, path)
+
 
 # Load index if exists
-index_path = Path(__file__).parent / "data" / "index"
-if (index_path / "documents.json").exists():
+current_path = index_store.current()
+if current_path is not None and (current_path / "documents.json").exists():
     try:
-        indexer.load_index(index_path / "documents.json")
-        search_engine = HybridSearch(config)
-        search_engine.load(str(index_path))
-        rag_system = RAGSystem(config, search_engine)
+        load_generation(current_path)
         print("✓ Loaded existing index")
     except Exception as e:
         print(f"Warning: Could not load index: {e}")
 
 
+@app.before_request
+def sync_published_index():
+    """Pick up index versions published by other processes (workers, CLI)"""
+    global _last_sync
+    now = time.monotonic()
+    if now - _last_sync < INDEX_SYNC_INTERVAL or not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sync = now
+        path = index_store.current()
+        with index_handle.acquire() as gen:
+            live_path = gen.path if gen is not None else None
+        if path is not None and path != live_path and (path / "documents.json").exists():
+            load_generation(path)
+    except Exception as e:
+        print(f"Warning: Could not load published index: {e}")
+    finally:
+        _sync_lock.release()
+
+
+def live_documents():
+    """Documents of the currently published index generation"""
+    with index_handle.acquire() as gen:
+        return list(gen.indexer.documents) if gen is not None else []
+
+
 @app.route('/')
 def index():
     """Serve the main page"""
@@ -63,13 +186,15 @@ def index():
 def get_stats():
     """Get knowledge base statistics"""
     try:
-        if not indexer.documents:
-            return jsonify({
-                'success': False,
-                'message': 'No documents indexed yet'
-            })
-        
-        stats = indexer.get_statistics()
+        with index_handle.acquire() as gen:
+            if gen is None or not gen.indexer.documents:
+                return jsonify({
+                    'success': False,
+                    'message': 'No documents indexed yet'
+                })
+            
+            stats = gen.indexer.get_statistics()
+            stats['routing'] = gen.search_engine.router.metrics()
         return jsonify({
             'success': True,
             'stats': stats
@@ -81,73 +206,123 @@ def get_stats():
         }), 500
 
 
+def run_index_job(job, doc_path):
+    """
+    Build a fresh index in the background and swap it in when complete
+
+    Args:
+        job: Job used to report per-stage progress
+        doc_path: Directory containing the documents
+
+    Returns:
+        Job result with indexing statistics
+    """
+    # Start from the live document set; it is copied, never mutated
+    new_indexer = DocumentIndexer(config)
+    with index_handle.acquire() as gen:
+        if gen is not None:
+            new_indexer.documents = list(gen.indexer.documents)
+
+    # Stage 1: parse files
+    job.start_stage('files_parsed')
+    documents = new_indexer.index_directory(
+        doc_path, recursive=True, progress=job.progress_callback('files_parsed'))
+    job.finish_stage('files_parsed')
+
+    if not documents:
+        raise ValueError('No documents found')
+
+    # Prepare chunks
+    all_chunks = []
+    for doc in documents:
+        chunks = new_indexer.chunk_document(doc)
+        all_chunks.extend(chunks)
+
+    # Stage 2: embed chunks
+    job.start_stage('chunks_embedded', total=len(all_chunks))
+    new_engine = new_search_engine()
+    new_engine.index(all_chunks, progress=job.progress_callback('chunks_embedded'))
+    job.finish_stage('chunks_embedded')
+
+    # Stage 3: write index into a fresh version directory
+    job.start_stage('index_written', total=1)
+    version_path = index_store.new_version()
+    new_indexer.save_index(version_path / "documents.json")
+    new_engine.save(str(version_path))
+    job.finish_stage('index_written')
+
+    # Swap the new generation in only once everything is built, then publish
+    # it; holding the sync lock keeps sync_published_index from loading the
+    # version again (or the previous one) in between
+    update_clusters(new_indexer.documents)
+    attach_partitions(new_engine)
+    with _sync_lock:
+        index_handle.swap(new_engine, RAGSystem(config, new_engine), new_indexer, version_path)
+        index_store.publish(version_path)
+
+    return {
+        'message': f'Indexed {len(documents)} documents',
+        'stats': new_indexer.get_statistics()
+    }
+
+
 @app.route('/api/index', methods=['POST'])
 def index_documents():
-    """Index documents from directory"""
-    global search_engine, rag_system
-    
+    """Start a background indexing job"""
     try:
-        data = request.json
+        data = request.json or {}
         doc_path = data.get('path', './data/documents')
-        
-        # Index documents
-        documents = indexer.index_directory(doc_path, recursive=True)
-        
-        if not documents:
+
+        if not Path(doc_path).exists():
             return jsonify({
                 'success': False,
-                'message': 'No documents found'
+                'message': f'Directory does not exist: {doc_path}'
             })
-        
-        # Save index
-        index_path = Path(__file__).parent / "data" / "index"
-        indexer.save_index(index_path / "documents.json")
-        
-        # Prepare chunks
-        all_chunks = []
-        for doc in documents:
-            chunks = indexer.chunk_document(doc)
-            all_chunks.extend(chunks)
-        
-        # Build search engine
-        search_engine = HybridSearch(config)
-        search_engine.index(all_chunks)
-        search_engine.save(str(index_path))
-        
-        # Initialize RAG
-        rag_system = RAGSystem(config, search_engine)
-        
-        stats = indexer.get_statistics()
-        
+
+        # Only one indexing job at a time; hand back the running one
+        job = jobs.submit_if_idle('index', INDEX_STAGES, run_index_job, doc_path)
+
         return jsonify({
             'success': True,
-            'message': f'Indexed {len(documents)} documents',
-            'stats': stats
-        })
-        
+            'job_id': job.id,
+            'status_url': f'/api/index/jobs/{job.id}'
+        }), 202
+
     except Exception as e:
-        import traceback
-        traceback.print_exc()
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+@app.route('/api/index/jobs/<job_id>', methods=['GET'])
+def index_job_status(job_id):
+    """Get progress of an indexing job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': f'Unknown job: {job_id}'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'job': job.to_dict()
+    })
+
+
 @app.route('/api/search', methods=['POST'])
 def search():
     """Search documents"""
     try:
-        if not search_engine:
-            return jsonify({
-                'success': False,
-                'message': 'Please index documents first'
-            })
-        
         data = request.json
         query = data.get('query', '')
         mode = data.get('mode', 'hybrid')
         max_results = data.get('max_results', 10)
+        filters = data.get('filters')
+        # The web UI lists documents, so this endpoint collapses by default
+        collapse = data.get('collapse', True)
+        n_probe = data.get('n_probe')
         
         if not query:
             return jsonify({
@@ -155,8 +330,24 @@ def search():
                 'message': 'Query cannot be empty'
             })
         
-        # Perform search
-        results = search_engine.search(query, mode=mode, max_results=max_results)
+        # Perform search against a pinned index generation
+        with index_handle.acquire() as gen:
+            if gen is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Please index documents first'
+                })
+            
+            try:
+                results = gen.search_engine.search(query, mode=mode, max_results=max_results,
+                                                   filters=filters, collapse=collapse,
+                                                   n_probe=n_probe)
+                gen.search_engine.highlight(query, results)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
         
         # Format results
         formatted_results = []
@@ -177,9 +368,11 @@ def search():
             formatted_results.append({
                 'title': safe_metadata.get('title', 'Untitled'),
                 'path': safe_metadata.get('path', ''),
-                'content': doc.get('content', '')[:300] + '...',
+                'content': result['snippet'],
+                'highlights': result['highlights'],
                 'score': result['score'],
-                'tags': safe_metadata.get('tags', [])
+                'tags': safe_metadata.get('tags', []),
+                'matched_chunks': result.get('matched_chunks', 1)
             })
         
         return jsonify({
@@ -195,11 +388,29 @@ def search():
         }), 500
 
 
+@app.route('/api/suggest', methods=['GET'])
+def suggest():
+    """Typeahead completions for the search box"""
+    prefix = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    
+    with index_handle.acquire() as gen:
+        if gen is None:
+            return jsonify({'success': True, 'suggestions': []})
+        suggestions = gen.search_engine.suggest(prefix, limit)
+    
+    return jsonify({
+        'success': True,
+        'suggestions': suggestions
+    })
+
+
 @app.route('/api/cluster', methods=['POST'])
 def cluster():
     """Cluster documents"""
     try:
-        if not indexer.documents:
+        documents = live_documents()
+        if not documents:
             return jsonify({
                 'success': False,
                 'message': 'Please index documents first'
@@ -211,27 +422,18 @@ def cluster():
         # Update config
         config.set('clustering.algorithm', algorithm)
         
-        # Prepare documents
-        docs_for_clustering = [
-            {
-                'content': doc.content,
-                'metadata': {
-                    'title': doc.title,
-                    'path': doc.path,
-                    'tags': doc.tags
-                }
-            }
-            for doc in indexer.documents
-        ]
-        
         # Cluster
         clusterer = AutoClusterer(config)
-        result = clusterer.fit(docs_for_clustering)
+        clusterer.model = _embedding_model
+        clusterer.fit_cache = fit_cache
+        result = clusterer.fit(clustering_documents(documents))
         
         # Save clusters to disk
-        cluster_path = Path(__file__).parent / "data" / "clusters"
-        clusterer.save(str(cluster_path))
-        print(f"✓ Clusters saved to: {cluster_path}")
+        clusterer.save(str(cluster_root))
+        print(f"✓ Clusters saved to: {cluster_root}")
+        with index_handle.acquire() as gen:
+            if gen is not None:
+                attach_partitions(gen.search_engine)
         
         # Format clusters
         formatted_clusters = []
@@ -254,7 +456,8 @@ def cluster():
         return jsonify({
             'success': True,
             'clusters': formatted_clusters,
-            'count': len(formatted_clusters)
+            'count': len(formatted_clusters),
+            'cached': result.get('cached', False)
         })
         
     except Exception as e:
@@ -268,7 +471,7 @@ def cluster():
 def get_clusters():
     """Get saved clusters"""
     try:
-        cluster_path = Path(__file__).parent / "data" / "clusters" / "clusters.json"
+        cluster_path = cluster_root / "clusters.json"
         
         if not cluster_path.exists():
             return jsonify({
@@ -282,14 +485,15 @@ def get_clusters():
             cluster_data = json.load(f)
         
         # Format clusters for frontend
+        documents = live_documents()
         formatted_clusters = []
         for cluster in cluster_data.get('clusters', []):
             # Get sample documents from doc_indices
             sample_docs = []
             doc_indices = cluster.get('doc_indices', [])[:5]  # Get first 5
             for idx in doc_indices:
-                if idx < len(indexer.documents):
-                    doc = indexer.documents[idx]
+                if idx < len(documents):
+                    doc = documents[idx]
                     sample_docs.append({
                         'title': doc.title,
                         'path': doc.path
@@ -322,12 +526,6 @@ def get_clusters():
 def ask():
     """Ask a question using RAG"""
     try:
-        if not rag_system:
-            return jsonify({
-                'success': False,
-                'message': 'Please index documents first'
-            })
-        
         data = request.json
         question = data.get('question', '')
         mode = data.get('mode', 'hybrid')
@@ -338,8 +536,15 @@ def ask():
                 'message': 'Question cannot be empty'
             })
         
-        # Ask question
-        result = rag_system.ask(question, search_mode=mode)
+        # Ask question against a pinned index generation
+        with index_handle.acquire() as gen:
+            if gen is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Please index documents first'
+                })
+            
+            result = gen.rag_system.ask(question, search_mode=mode)
         
         if not result['success']:
             return jsonify(result)
@@ -360,11 +565,24 @@ def ask():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='QuickHelp Web UI')
+    parser.add_argument('--host', default=config.get('server.host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=config.get('server.port', 5000))
+    parser.add_argument('--workers', type=int, default=config.get('server.workers', 1),
+                        help='Worker processes; more than 1 enables pre-fork serving')
+    args = parser.parse_args()
+    
     print("\n" + "="*60)
     print("  QuickHelp Web UI")
     print("="*60)
     print("\n✓ Starting server...")
-    print("✓ Open browser at: http://127.0.0.1:5000")
+    print(f"✓ Open browser at: http://{args.host}:{args.port}")
     print("\nPress Ctrl+C to stop\n")
     
-    app.run(debug=True, host='127.0.0.1', port=5000)
+    if args.workers > 1:
+        # Load the model in the parent so workers share its pages
+        serve_prefork(app, host=args.host, port=args.port, workers=args.workers,
+                      torch_threads=config.get('server.torch_threads', 1),
+                      before_fork=new_search_engine)
+    else:
+        app.run(debug=True, host=args.host, port=args.port)
@@ -12,6 +12,7 @@ from src.indexer import DocumentIndexer
 from src.search import HybridSearch
 from src.clustering import AutoClusterer
 from src.rag import RAGSystem
+from src.index_store import IndexStore
 
 
 def print_section(title):
@@ -52,8 +53,9 @@ def main():
     print(f"  Average words per document: {stats['avg_words_per_doc']:.1f}")
     print(f"  Unique tags: {stats['unique_tags']}")
     
-    # Save index
-    index_path = Path(__file__).parent / "data" / "index"
+    # Save index into a new version directory (published after the search index)
+    store = IndexStore(Path(__file__).parent / "data" / "index")
+    index_path = store.new_version()
     indexer.save_index(index_path / "documents.json")
     print(f"\n✓ Index saved to: {index_path}")
     
@@ -75,6 +77,7 @@ def main():
     
     # Save search index
     search_engine.save(str(index_path))
+    store.publish(index_path)
     print("✓ Search index built and saved")
     
     # Perform searches
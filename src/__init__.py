@@ -1,15 +1,20 @@
 """
 QuickHelp - Intelligent Knowledge Base with Auto-Clustering
 """
+import importlib
 
 __version__ = "0.1.0"
 __author__ = "QuickHelp Team"
 
-from .config import Config
-from .indexer import DocumentIndexer
-from .search import HybridSearch
-from .clustering import AutoClusterer
-from .rag import RAGSystem
+# Public classes are resolved on first access so that importing a light
+# submodule (e.g. src.config) does not pull in torch, faiss or sklearn
+_LAZY_EXPORTS = {
+    "Config": ".config",
+    "DocumentIndexer": ".indexer",
+    "HybridSearch": ".search",
+    "AutoClusterer": ".clustering",
+    "RAGSystem": ".rag",
+}
 
 __all__ = [
     "Config",
@@ -18,3 +23,16 @@ __all__ = [
     "AutoClusterer",
     "RAGSystem",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
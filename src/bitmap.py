@@ -0,0 +1,227 @@
+"""
+Compressed sets of chunk ids
+Roaring-style layout: ids are split by their high 16 bits into containers
+holding the low 16 bits, either as a sorted uint16 array (sparse) or as a
+65536-bit bitset (dense). Set operations loop over containers, never over
+ids, and each container operation is a NumPy call
+"""
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Containers above this many ids are stored as bitsets (8 KB either way)
+ARRAY_MAX = 4096
+WORDS = 1024  # uint64 words per bitset container
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.bitwise_count(words).sum())
+else:
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+def _to_bitset(low: np.ndarray) -> np.ndarray:
+    bits = np.zeros(1 << 16, dtype=bool)
+    bits[low] = True
+    return np.packbits(bits, bitorder='little').view(np.uint64)
+
+
+def _to_array(words: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little')).astype(np.uint16)
+
+
+def _contains(words: np.ndarray, low: np.ndarray) -> np.ndarray:
+    """Which of the low ids are set in a bitset"""
+    low = low.astype(np.uint64)
+    return ((words[low >> np.uint64(6)] >> (low & np.uint64(63))) & np.uint64(1)).astype(bool)
+
+
+def _pack(words: np.ndarray) -> Optional[np.ndarray]:
+    """A bitset as the smaller container type, None if empty"""
+    count = _popcount(words)
+    if count == 0:
+        return None
+    return _to_array(words) if count <= ARRAY_MAX else words
+
+
+def _is_bitset(container: np.ndarray) -> bool:
+    return container.dtype == np.uint64
+
+
+def _and(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if _is_bitset(a) and _is_bitset(b):
+        return _pack(a & b)
+    if _is_bitset(a):
+        a, b = b, a
+    if _is_bitset(b):
+        result = a[_contains(b, a)]
+    else:
+        result = np.intersect1d(a, b, assume_unique=True)
+    return result if len(result) else None
+
+
+def _andnot(a: np.ndarray, b: np.ndarray) -> Optional[np.ndarray]:
+    if _is_bitset(a):
+        return _pack(a & ~(b if _is_bitset(b) else _to_bitset(b)))
+    if _is_bitset(b):
+        result = a[~_contains(b, a)]
+    else:
+        result = np.setdiff1d(a, b, assume_unique=True)
+    return result if len(result) else None
+
+
+def _count(container: np.ndarray) -> int:
+    return _popcount(container) if _is_bitset(container) else len(container)
+
+
+class Bitmap:
+    """
+    Immutable set of non-negative ids (chunk indices)
+
+    Supports & (and), | (or), - (and not), len() (cardinality) and
+    conversion to and from sorted id arrays and boolean masks.
+    """
+
+    __slots__ = ('keys', 'containers')
+
+    def __init__(self, keys: Sequence[int] = (), containers: Sequence[np.ndarray] = ()):
+        self.keys: List[int] = list(keys)
+        self.containers: List[np.ndarray] = list(containers)
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> 'Bitmap':
+        """Build from ids in any order (duplicates allowed)"""
+        ids = np.unique(np.fromiter(ids, dtype=np.int64) if not isinstance(ids, np.ndarray)
+                        else ids.astype(np.int64, copy=False))
+        if len(ids) and ids[0] < 0:
+            raise ValueError("Bitmap ids must be non-negative")
+
+        high = ids >> 16
+        keys, starts = np.unique(high, return_index=True)
+        bounds = np.append(starts, len(ids))
+        containers = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            low = (ids[start:end] & 0xFFFF).astype(np.uint16)
+            containers.append(low if len(low) <= ARRAY_MAX else _to_bitset(low))
+        return cls(keys.tolist(), containers)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> 'Bitmap':
+        """Build from a boolean array (position i set = id i in the set)"""
+        return cls.from_ids(np.flatnonzero(mask))
+
+    @classmethod
+    def range(cls, stop: int) -> 'Bitmap':
+        """Every id in [0, stop)"""
+        return cls.from_ids(np.arange(stop))
+
+    @classmethod
+    def union_all(cls, bitmaps: Iterable['Bitmap']) -> 'Bitmap':
+        """Union of many bitmaps, merging each key's containers once"""
+        by_key = {}
+        for bitmap in bitmaps:
+            for key, container in zip(bitmap.keys, bitmap.containers):
+                by_key.setdefault(key, []).append(container)
+
+        keys, containers = [], []
+        for key in sorted(by_key):
+            parts = by_key[key]
+            if len(parts) == 1:
+                merged = parts[0]
+            elif all(not _is_bitset(part) for part in parts) and sum(map(len, parts)) <= ARRAY_MAX:
+                merged = np.unique(np.concatenate(parts))
+            else:
+                merged = np.zeros(WORDS, dtype=np.uint64)
+                for part in parts:
+                    merged |= part if _is_bitset(part) else _to_bitset(part)
+            keys.append(key)
+            containers.append(merged)
+        return cls(keys, containers)
+
+    def _pairs(self, other: 'Bitmap') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Shared keys with their container positions in self and other"""
+        return np.intersect1d(np.asarray(self.keys, dtype=np.int64),
+                              np.asarray(other.keys, dtype=np.int64),
+                              assume_unique=True, return_indices=True)
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        shared, mine, theirs = self._pairs(other)
+        keys, containers = [], []
+        for key, i, j in zip(shared.tolist(), mine.tolist(), theirs.tolist()):
+            container = _and(self.containers[i], other.containers[j])
+            if container is not None:
+                keys.append(key)
+                containers.append(container)
+        return Bitmap(keys, containers)
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        return Bitmap.union_all((self, other))
+
+    def __sub__(self, other: 'Bitmap') -> 'Bitmap':
+        theirs = dict(zip(other.keys, other.containers))
+        keys, containers = [], []
+        for key, container in zip(self.keys, self.containers):
+            if key in theirs:
+                container = _andnot(container, theirs[key])
+                if container is None:
+                    continue
+            keys.append(key)
+            containers.append(container)
+        return Bitmap(keys, containers)
+
+    def andnot(self, other: 'Bitmap') -> 'Bitmap':
+        return self - other
+
+    def __len__(self) -> int:
+        return sum(_count(container) for container in self.containers)
+
+    def __bool__(self) -> bool:
+        return bool(self.containers)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Bitmap) and np.array_equal(self.to_array(), other.to_array())
+
+    def __contains__(self, idx: int) -> bool:
+        return bool(self.contains(np.asarray([idx]))[0])
+
+    def __iter__(self):
+        return iter(self.to_array().tolist())
+
+    def __repr__(self) -> str:
+        return f"Bitmap({len(self)} ids)"
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Vectorized membership test"""
+        ids = np.asarray(ids, dtype=np.int64)
+        result = np.zeros(len(ids), dtype=bool)
+        high = ids >> 16
+        for key, container in zip(self.keys, self.containers):
+            where = np.flatnonzero(high == key)
+            if not len(where):
+                continue
+            low = (ids[where] & 0xFFFF).astype(np.uint16)
+            if _is_bitset(container):
+                result[where] = _contains(container, low)
+            else:
+                found = np.searchsorted(container, low)
+                result[where] = container[np.minimum(found, len(container) - 1)] == low
+        return result
+
+    def to_array(self) -> np.ndarray:
+        """Sorted ids as int64"""
+        parts = [(np.int64(key) << 16) + (_to_array(c) if _is_bitset(c) else c).astype(np.int64)
+                 for key, c in zip(self.keys, self.containers)]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def to_mask(self, size: int) -> np.ndarray:
+        """Boolean array of length size (ids >= size are dropped)"""
+        mask = np.zeros(size, dtype=bool)
+        ids = self.to_array()
+        mask[ids[ids < size]] = True
+        return mask
+
+    @property
+    def nbytes(self) -> int:
+        return sum(container.nbytes for container in self.containers)
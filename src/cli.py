@@ -6,17 +6,19 @@ from pathlib import Path
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
-from rich.markdown import Markdown
+from rich.text import Text
 import sys
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Only light modules are imported here; the search engine, clusterer and RAG
+# system (torch, faiss, sklearn, hdbscan, openai...) are imported inside the
+# commands that need them so `stats` and `--help` start instantly
 from src.config import Config
 from src.indexer import DocumentIndexer
-from src.search import HybridSearch
-from src.clustering import AutoClusterer
-from src.rag import RAGSystem
+from src.index_store import IndexStore, resolve_index_path
+from src.daemon import QueryDaemon, DaemonClient
 
 console = Console()
 
@@ -54,9 +56,10 @@ def index(path, output, recursive):
             console.print("[yellow]No documents found![/yellow]")
             return
         
-        # Save index
-        index_path = Path(output)
-        indexer.save_index(index_path / "documents.json")
+        # Write into a fresh version directory; it is published once complete
+        store = IndexStore(output, keep_versions=config.get('index.keep_versions', 3))
+        version_path = store.new_version()
+        indexer.save_index(version_path / "documents.json")
         
         # Get statistics
         stats = indexer.get_statistics()
@@ -73,10 +76,14 @@ def index(path, output, recursive):
         table.add_row("Avg Words/Doc", f"{stats['avg_words_per_doc']:.1f}")
         table.add_row("Unique Tags", str(stats['unique_tags']))
         table.add_row("Formats", ", ".join(stats['formats']))
+        if indexer.minhash_enabled and not indexer.skip_near_duplicates:
+            table.add_row("Near-Duplicates", str(len(indexer.near_duplicates())))
         
         console.print(table)
         
         # Create search index
+        from src.search import HybridSearch
+        
         console.print("\n[bold blue]Building search index...[/bold blue]")
         search_engine = HybridSearch(config)
         
@@ -87,9 +94,10 @@ def index(path, output, recursive):
             all_chunks.extend(chunks)
         
         search_engine.index(all_chunks)
-        search_engine.save(output)
+        search_engine.save(version_path)
+        store.publish(version_path)
         
-        console.print(f"[green]✓ Search index saved to {output}[/green]")
+        console.print(f"[green]✓ Search index saved to {version_path}[/green]")
         
     except Exception as e:
         console.print(f"[red]Error: {e}[/red]")
@@ -98,25 +106,62 @@ def index(path, output, recursive):
 
 @cli.command()
 @click.argument('query')
-@click.option('--mode', '-m', type=click.Choice(['keyword', 'semantic', 'hybrid']), 
-              default='hybrid', help='Search mode')
+@click.option('--mode', '-m', type=click.Choice(['auto', 'keyword', 'semantic', 'hybrid']), 
+              default='hybrid', help='Search mode (auto picks one per query)')
 @click.option('--max-results', '-n', default=10, help='Maximum number of results')
 @click.option('--index-path', default='./data/index', help='Path to search index')
-def search(query, mode, max_results, index_path):
+@click.option('--daemon/--no-daemon', default=True, help='Use a running `serve` daemon if available')
+@click.option('--tag', '-t', 'tags', multiple=True, help='Only chunks with this tag (repeatable, any of)')
+@click.option('--field', '-f', 'fields', multiple=True, metavar='KEY=VALUE',
+              help='Only chunks whose frontmatter KEY equals VALUE (repeatable)')
+@click.option('--since', help='Only documents updated on or after this date (YYYY-MM-DD)')
+@click.option('--until', help='Only documents updated on or before this date (YYYY-MM-DD)')
+def search(query, mode, max_results, index_path, daemon, tags, fields, since, until):
     """Search the knowledge base"""
     console.print(f"[bold blue]Searching for:[/bold blue] {query}")
     console.print(f"[dim]Mode: {mode}[/dim]\n")
     
+    filters = {}
+    if tags:
+        filters['tags'] = list(tags)
+    for field in fields:
+        key, sep, value = field.partition('=')
+        if not sep:
+            raise click.BadParameter(f"expected KEY=VALUE, got {field!r}", param_hint='--field')
+        filters.setdefault(key, []).append(value)
+    if since or until:
+        filters['updated_at'] = {'from': since, 'to': until}
+    filters = filters or None
+    
     try:
-        # Load config
-        config = Config()
-        
-        # Load search engine
-        search_engine = HybridSearch(config)
-        search_engine.load(index_path)
-        
-        # Perform search
-        results = search_engine.search(query, mode=mode, max_results=max_results)
+        # Prefer the warm daemon; fall back to loading the index in-process
+        results = None
+        client = DaemonClient.connect(index_path) if daemon else None
+        if client is not None:
+            try:
+                results = client.search(query, mode=mode, max_results=max_results, filters=filters)
+            except OSError:
+                # Unreachable (connection refused or timed out)
+                results = None
+            except RuntimeError as e:
+                # The daemon's own error; loading in-process would only repeat it
+                console.print(f"[red]Error: {e}[/red]")
+                return
+        
+        if results is None:
+            from src.search import HybridSearch
+            
+            # Load config
+            config = Config()
+            
+            # Load search engine
+            search_engine = HybridSearch(config)
+            search_engine.load(resolve_index_path(index_path))
+            
+            # Perform search
+            results = search_engine.search(query, mode=mode, max_results=max_results,
+                                           filters=filters)
+            search_engine.highlight(query, results)
         
         if not results:
             console.print("[yellow]No results found[/yellow]")
@@ -135,14 +180,17 @@ def search(query, mode, max_results, index_path):
             path = metadata.get('path', '')
             tags = metadata.get('tags', [])
             
-            # Create panel
-            content_preview = doc.get('content', '')[:200] + "..."
+            # Create panel, with the query's matches highlighted
+            content_preview = Text(result.get('snippet') or doc.get('content', '')[:200] + "...")
+            for start, end in result.get('highlights', []):
+                content_preview.stylize("bold yellow", start, end)
             
             panel_content = f"[bold]{title}[/bold]\n"
             panel_content += f"[dim]Path: {path}[/dim]\n"
             if tags:
                 panel_content += f"[dim]Tags: {', '.join(tags)}[/dim]\n"
-            panel_content += f"\n{content_preview}"
+            panel_content = Text.from_markup(panel_content + "\n")
+            panel_content.append_text(content_preview)
             
             panel = Panel(
                 panel_content,
@@ -159,9 +207,12 @@ def search(query, mode, max_results, index_path):
 @cli.command()
 @click.option('--index-path', default='./data/index', help='Path to index')
 @click.option('--output', default='./data/clusters', help='Output directory for clusters')
-@click.option('--algorithm', type=click.Choice(['kmeans', 'hierarchical', 'hdbscan']),
+@click.option('--algorithm', type=click.Choice(['kmeans', 'minibatch_kmeans', 'birch',
+                                                 'hierarchical', 'hdbscan']),
               default='hdbscan', help='Clustering algorithm')
-def cluster(index_path, output, algorithm):
+@click.option('--full', is_flag=True,
+              help='Refit every document instead of assigning new ones to the saved clusters')
+def cluster(index_path, output, algorithm, full):
     """Automatically cluster documents into categories"""
     console.print("[bold blue]Auto-clustering documents...[/bold blue]")
     
@@ -172,7 +223,7 @@ def cluster(index_path, output, algorithm):
         
         # Load documents
         indexer = DocumentIndexer(config)
-        indexer.load_index(Path(index_path) / "documents.json")
+        indexer.load_index(resolve_index_path(index_path) / "documents.json")
         
         if not indexer.documents:
             console.print("[yellow]No documents found in index. Run 'index' command first.[/yellow]")
@@ -186,21 +237,42 @@ def cluster(index_path, output, algorithm):
                     'title': doc.title,
                     'path': doc.path,
                     'tags': doc.tags
-                }
+                },
+                'minhash': doc.minhash
             }
             for doc in indexer.documents
         ]
         
         # Perform clustering
+        from src.clustering import AutoClusterer
+        
+        from src.cluster_cache import FitCache
+        
         clusterer = AutoClusterer(config)
-        result = clusterer.fit(docs_for_clustering)
+        output_path = Path(output)
+        if not full and (output_path / "clusters.json").exists():
+            clusterer.load(output_path)
+            if clusterer.algorithm != algorithm:
+                clusterer = AutoClusterer(config)
+        if config.get('clustering.cache.enabled', True):
+            clusterer.fit_cache = FitCache(output_path.parent / "cluster_cache",
+                                           config.get('clustering.cache.max_entries', 8))
+        # Fits when nothing was loaded, otherwise assigns new documents
+        result = clusterer.update(docs_for_clustering)
         
         # Save results
-        output_path = Path(output)
         clusterer.save(output_path)
         
         # Display results
-        console.print(f"\n[green]✓ Created {result['num_clusters']} clusters[/green]\n")
+        if result['reclustered']:
+            cached = " (cached result)" if result.get('cached') else ""
+            console.print(f"\n[green]✓ Created {result['num_clusters']} clusters{cached}[/green]\n")
+        else:
+            console.print(f"\n[green]✓ Assigned {result['assigned']} new documents to "
+                          f"{result['num_clusters']} clusters[/green]")
+            console.print(f"[dim]{clusterer.pending_documents} assigned since the last full fit "
+                          f"(refit at {clusterer.recluster_threshold}, drift {clusterer.drift:.3f}); "
+                          f"use --full to refit now[/dim]\n")
         
         summary = clusterer.get_cluster_summary()
         console.print(Panel(summary, title="Cluster Summary", border_style="green"))
@@ -214,27 +286,45 @@ def cluster(index_path, output, algorithm):
 
 @cli.command()
 @click.argument('question')
-@click.option('--mode', '-m', type=click.Choice(['keyword', 'semantic', 'hybrid']),
-              default='hybrid', help='Search mode')
+@click.option('--mode', '-m', type=click.Choice(['auto', 'keyword', 'semantic', 'hybrid']),
+              default='hybrid', help='Search mode (auto picks one per query)')
 @click.option('--index-path', default='./data/index', help='Path to search index')
-def ask(question, mode, index_path):
+@click.option('--daemon/--no-daemon', default=True, help='Use a running `serve` daemon if available')
+def ask(question, mode, index_path, daemon):
     """Ask a question about your documents"""
     console.print(f"[bold blue]Question:[/bold blue] {question}\n")
     
     try:
-        # Load config
-        config = Config()
-        
-        # Load search engine
-        search_engine = HybridSearch(config)
-        search_engine.load(index_path)
-        
-        # Create RAG system
-        rag_system = RAGSystem(config, search_engine)
-        
-        # Ask question
-        with console.status("[bold blue]Thinking...[/bold blue]"):
-            result = rag_system.ask(question, search_mode=mode)
+        # Prefer the warm daemon; fall back to loading the index in-process
+        result = None
+        client = DaemonClient.connect(index_path) if daemon else None
+        if client is not None:
+            try:
+                with console.status("[bold blue]Thinking...[/bold blue]"):
+                    result = client.ask(question, mode=mode)
+            except OSError:
+                result = None
+            except RuntimeError as e:
+                console.print(f"[red]Error: {e}[/red]")
+                return
+        
+        if result is None:
+            from src.search import HybridSearch
+            from src.rag import RAGSystem
+            
+            # Load config
+            config = Config()
+            
+            # Load search engine
+            search_engine = HybridSearch(config)
+            search_engine.load(resolve_index_path(index_path))
+            
+            # Create RAG system
+            rag_system = RAGSystem(config, search_engine)
+            
+            # Ask question
+            with console.status("[bold blue]Thinking...[/bold blue]"):
+                result = rag_system.ask(question, search_mode=mode)
         
         if not result['success']:
             console.print(f"[yellow]{result['answer']}[/yellow]")
@@ -267,6 +357,32 @@ def ask(question, mode, index_path):
         raise
 
 
+@cli.command()
+@click.option('--index-path', default='./data/index', help='Path to search index')
+@click.option('--port', default=None, type=int, help='Loopback port (default: daemon.port in config)')
+def serve(index_path, port):
+    """Keep the search engine warm for fast `search` and `ask` commands"""
+    config = Config()
+    if port is None:
+        port = config.get('daemon.port', 8765)
+    
+    if DaemonClient.connect(index_path) is not None:
+        console.print("[yellow]A daemon is already serving this index[/yellow]")
+        return
+    
+    daemon = QueryDaemon(config, index_path, port=port)
+    with console.status("[bold blue]Loading search engine...[/bold blue]"):
+        loaded = daemon.load()
+    if not loaded:
+        console.print("[yellow]No index found yet; it will be loaded once published.[/yellow]")
+    
+    console.print(f"[green]✓ Serving queries on 127.0.0.1:{port}[/green] [dim](Ctrl+C to stop)[/dim]")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        console.print("\n[dim]Daemon stopped[/dim]")
+
+
 @cli.command()
 @click.option('--index-path', default='./data/index', help='Path to index')
 def stats(index_path):
@@ -277,7 +393,7 @@ def stats(index_path):
         
         # Load documents
         indexer = DocumentIndexer(config)
-        indexer.load_index(Path(index_path) / "documents.json")
+        indexer.load_index(resolve_index_path(index_path) / "documents.json")
         
         if not indexer.documents:
             console.print("[yellow]No documents found in index.[/yellow]")
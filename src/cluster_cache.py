@@ -0,0 +1,100 @@
+"""
+On-disk cache of clustering results
+A fit is keyed by a fingerprint of its inputs (embeddings, documents,
+algorithm and parameters); a repeated fit, e.g. toggling back to an
+algorithm in the web UI, loads the saved result instead of clustering again
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+
+# Written last, so an entry without it is incomplete
+COMPLETE_FILE = "complete"
+
+
+def _touch(path: Path):
+    # Explicit nanosecond times: filesystem clocks are too coarse to order
+    # entries written in quick succession
+    path.touch()
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def fingerprint(*parts: Any) -> str:
+    """SHA-256 of JSON-serializable parts (bytes are hashed as they are)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, (bytes, bytearray, memoryview)):
+            digest.update(bytes(part))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class FitCache:
+    """
+    Clustering results in per-key directories, least recently used evicted
+
+    Recency is the modification time of an entry's COMPLETE_FILE, touched
+    on every hit, so it survives restarts and is shared by processes
+    using the same directory.
+    """
+
+    def __init__(self, path: Union[str, Path], max_entries: int = 8):
+        """
+        Args:
+            path: Cache directory
+            max_entries: Results kept
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Path]:
+        """Directory of a cached result, or None on a miss"""
+        entry = self.path / key
+        marker = entry / COMPLETE_FILE
+        with self._lock:
+            if not marker.exists():
+                return None
+            _touch(marker)
+        return entry
+
+    def put(self, key: str, write: Callable[[Path], None]):
+        """
+        Store a result
+
+        Args:
+            key: Cache key
+            write: Called with an empty directory to write the result into
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        staging = self.path / f".{key}.{uuid.uuid4().hex}"
+        staging.mkdir()
+        try:
+            write(staging)
+            with self._lock:
+                _touch(staging / COMPLETE_FILE)
+                shutil.rmtree(self.path / key, ignore_errors=True)
+                os.replace(staging, self.path / key)
+                self._evict()
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _evict(self):
+        entries = [(marker.stat().st_mtime_ns, marker.parent)
+                   for marker in self.path.glob(f"[!.]*/{COMPLETE_FILE}")]
+        entries.sort()
+        for _, entry in entries[:max(0, len(entries) - self.max_entries)]:
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.path.glob(f"[!.]*/{COMPLETE_FILE}"))
@@ -4,34 +4,46 @@ Automatically discovers and groups related documents
 """
 import numpy as np
 from typing import List, Dict, Any, Optional
-from collections import Counter
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
 import pickle
 import json
 import hashlib
 import re
+import threading
+import time
 
-try:
-    from sklearn.cluster import KMeans, AgglomerativeClustering
-    from sklearn.preprocessing import normalize
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    import hdbscan
-    from sentence_transformers import SentenceTransformer
-except ImportError:
-    KMeans = None
-    AgglomerativeClustering = None
-    normalize = None
-    TfidfVectorizer = None
-    hdbscan = None
-    SentenceTransformer = None
+from . import minhash, textclean
+from .lazy import optional_import
+from .cluster_cache import FitCache, fingerprint
+from .partitions import CENTROIDS_FILE
 
 
 class AutoClusterer:
     """
     Automatically clusters documents based on semantic similarity
     Helps organize scattered notes into meaningful categories
+
+    New documents are placed into the existing clusters by assign() (or
+    update()); a full fit is only due once recluster_threshold documents
+    were assigned, or earlier when they fit the clusters clearly worse than
+    the fitted documents did (drift).
     """
 
+    # Assigned documents needed before drift alone can trigger a refit
+    DRIFT_MIN_DOCUMENTS = 10
+
+    # Domain-generic words that make poor cluster names
+    NAMING_STOPWORDS = frozenset({
+        'document', 'documents', 'based', 'cluster', 'clustering', 'data', 'text',
+        'note', 'notes', 'example', 'examples', 'introduction', 'overview'
+    })
+    # Fitted TF-IDF matrices kept per corpus (shared by all instances)
+    TFIDF_CACHE_SIZE = 2
+    _tfidf_cache: "OrderedDict[str, tuple]" = OrderedDict()
+    _tfidf_lock = threading.Lock()
+
     def __init__(self, config):
         self.config = config
         self.algorithm = config.get('clustering.algorithm', 'hdbscan')
@@ -44,26 +56,60 @@ class AutoClusterer:
         self.representation_max_chars = config.get('clustering.representation_max_chars', 1000)
 
         self.enable_dedup = config.get('clustering.dedup', True)
+        self.dedup_threshold = config.get('clustering.dedup_threshold', 0.9)
         self.enable_text_clean = config.get('clustering.text_clean', True)
         self.enable_tfidf_naming = config.get('clustering.tfidf_naming', True)
 
-        # Initialize embedding model
-        if SentenceTransformer:
-            model_name = config.get('search.semantic.model',
-                                    'sentence-transformers/all-MiniLM-L6-v2')
-            self.model = SentenceTransformer(model_name)
-        else:
-            self.model = None
+        self.recluster_threshold = config.get('clustering.recluster_threshold', 50)
+        self.recluster_drift = config.get('clustering.recluster_drift', 0.15)
+        self.assign_min_similarity = config.get('clustering.assign_min_similarity', 0.5)
+
+        # Embedding model is loaded on first use (not needed when embeddings are passed in)
+        self._model = None
+        # Results of earlier fits (set by callers with a cache directory);
+        # None always clusters
+        self.fit_cache: Optional[FitCache] = None
 
         self.documents: List[Dict[str, Any]] = []
         self.embeddings: Optional[np.ndarray] = None
         self.clusters: Optional[List[Dict[str, Any]]] = None
         self.cluster_labels: Optional[np.ndarray] = None
+        # Normalized mean embedding of each cluster (noise excluded), row i
+        # belonging to cluster centroid_ids[i]
+        self.centroids: Optional[np.ndarray] = None
+        self.centroid_ids: Optional[np.ndarray] = None
+        self._hdbscan_model = None
+        # PCA/UMAP model when HDBSCAN ran on reduced embeddings
+        self._reducer = None
+        # Seconds spent in each phase of the last fit
+        self.timings: Dict[str, float] = {}
+
+        # Identity of each clustered document (see _doc_key), to tell new ones
+        self.doc_keys: List[str] = []
+        # Mean similarity of the fitted documents to their centroid, and the
+        # documents assigned since the fit with their summed similarity
+        self.cohesion: Optional[float] = None
+        self.pending_documents = 0
+        self.pending_similarity = 0.0
 
         # For naming
         self._embed_texts: List[str] = []   # representation for embedding
         self._name_texts: List[str] = []    # representation for TF-IDF naming (exclude tag_ tokens)
 
+    @property
+    def model(self):
+        if self._model is None:
+            sentence_transformers = optional_import('sentence_transformers')
+            if sentence_transformers:
+                model_name = self.config.get('search.semantic.model',
+                                             'sentence-transformers/all-MiniLM-L6-v2')
+                self._model = sentence_transformers.SentenceTransformer(model_name)
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
+
     # -------------------------
     # Main API
     # -------------------------
@@ -72,53 +118,254 @@ class AutoClusterer:
             return {'clusters': [], 'labels': [], 'num_clusters': 0}
 
         docs = list(documents)
+        # Only an HDBSCAN fit below leaves a model for assign()
+        self._hdbscan_model = None
 
         # 1) Strong dedupe to handle re-index + timestamp differences
         if self.enable_dedup:
             docs = self._dedupe_documents(docs)
 
         self.documents = docs
+        self.doc_keys = [self._doc_key(doc) for doc in docs]
+        self.timings = {}
 
         # 2) Build texts for embedding & naming
         self._embed_texts = [self._build_embedding_text(doc) for doc in self.documents]
         self._name_texts = [self._build_naming_text(doc) for doc in self.documents]
 
+        # A fit of the same inputs is loaded instead of recomputed
+        cache_key = self._fit_key(embeddings) if self.fit_cache is not None else None
+        if cache_key is not None:
+            entry = self.fit_cache.get(cache_key)
+            if entry is not None:
+                with self._phase('cache'):
+                    self._load_cached(entry)
+                print(f"Loaded cached {self.algorithm} clustering")
+                return {
+                    'clusters': self.clusters,
+                    'labels': self.cluster_labels,
+                    'num_clusters': len(self.clusters),
+                    'timings': dict(self.timings),
+                    'cached': True
+                }
+
         # 3) Embeddings
         if embeddings is None:
             if not self.model:
                 raise ValueError("SentenceTransformer model not available")
             print(f"Generating embeddings for {len(self.documents)} documents...")
-            self.embeddings = self.model.encode(self._embed_texts, show_progress_bar=True)
+            with self._phase('embed'):
+                self.embeddings = self.model.encode(self._embed_texts, show_progress_bar=True)
         else:
             self.embeddings = embeddings
 
         # 4) Normalize
-        if normalize is None:
+        preprocessing = optional_import('sklearn.preprocessing')
+        if preprocessing is None:
             raise ImportError("scikit-learn not installed (normalize unavailable)")
-        self.embeddings = normalize(self.embeddings)
+        self.embeddings = preprocessing.normalize(self.embeddings)
 
         # 5) Clustering
         print(f"Clustering with {self.algorithm}...")
+        self._reducer = None
+        start = time.perf_counter()
         if self.algorithm == 'kmeans':
             self.cluster_labels = self._kmeans_cluster()
+        elif self.algorithm == 'minibatch_kmeans':
+            self.cluster_labels = self._minibatch_kmeans_cluster()
+        elif self.algorithm == 'birch':
+            self.cluster_labels = self._birch_cluster()
         elif self.algorithm == 'hierarchical':
             self.cluster_labels = self._hierarchical_cluster()
         elif self.algorithm == 'hdbscan':
             self.cluster_labels = self._hdbscan_cluster()
         else:
             raise ValueError(f"Unknown clustering algorithm: {self.algorithm}")
+        self.timings['cluster'] = time.perf_counter() - start
 
         # 6) Organize results
-        self.clusters = self._organize_clusters()
+        with self._phase('organize'):
+            self.clusters = self._organize_clusters()
+            self._compute_centroids()
+            self.cohesion = self._cohesion()
+        self.pending_documents = 0
+        self.pending_similarity = 0.0
 
         # 7) Name clusters
         if self.config.get('clustering.auto_naming', True):
-            self._name_clusters()
+            with self._phase('naming'):
+                self._name_clusters()
 
+        print("Phase timings: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items()))
+        if cache_key is not None:
+            self.fit_cache.put(cache_key, self.save)
         return {
             'clusters': self.clusters,
             'labels': self.cluster_labels,
-            'num_clusters': len(self.clusters)
+            'num_clusters': len(self.clusters),
+            'timings': dict(self.timings),
+            'cached': False
+        }
+
+    def _fit_key(self, embeddings: Optional[np.ndarray]) -> str:
+        """
+        Cache key of a fit: the embeddings (their bytes when passed in,
+        otherwise the model and the texts it will encode), the documents and
+        every clustering setting
+        """
+        if embeddings is not None:
+            embeddings = np.ascontiguousarray(embeddings)
+            source = (str(embeddings.dtype), embeddings.shape, embeddings.tobytes())
+        else:
+            source = (self.config.get('search.semantic.model'), self._embed_texts)
+        settings = {name: value for name, value in (self.config.get('clustering', {}) or {}).items()
+                    if name != 'cache'}
+        return fingerprint(*source, self.doc_keys, self._name_texts, self.algorithm, settings)
+
+    def _load_cached(self, entry: Path):
+        """Restore a cached fit of the current documents"""
+        self.load(entry)
+        for cluster in self.clusters:
+            cluster['documents'] = [self.documents[idx] for idx in cluster['doc_indices']]
+        # The phases of the cached fit did not run now
+        self.timings = {}
+
+    @contextmanager
+    def _phase(self, name: str):
+        """Record the seconds a block takes in self.timings"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def assign(self, documents: List[Dict[str, Any]],
+               embeddings: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Place new documents into the existing clusters without refitting
+
+        HDBSCAN clusterings use hdbscan.approximate_predict; otherwise each
+        document joins the cluster with the closest centroid, or the noise
+        cluster (-1) when no centroid reaches clustering.assign_min_similarity.
+
+        Args:
+            documents: Documents not clustered yet
+            embeddings: Their embeddings (encoded when not given)
+
+        Returns:
+            Cluster label of each document
+        """
+        if self.centroids is None:
+            raise ValueError("No clusters to assign to; run fit() first")
+        docs = list(documents)
+        if not docs:
+            return np.zeros(0, dtype=np.int64)
+
+        if embeddings is None:
+            if not self.model:
+                raise ValueError("SentenceTransformer model not available")
+            embeddings = self.model.encode([self._build_embedding_text(doc) for doc in docs],
+                                           show_progress_bar=False)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        embeddings = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12)
+
+        if len(self.centroids):
+            similarities = embeddings @ self.centroids.T
+            nearest = np.argmax(similarities, axis=1)
+            best = similarities[np.arange(len(docs)), nearest]
+            labels = np.where(best >= self.assign_min_similarity, self.centroid_ids[nearest], -1)
+        else:
+            best = np.zeros(len(docs), dtype=np.float32)
+            labels = np.full(len(docs), -1, dtype=np.int64)
+
+        hdbscan = optional_import('hdbscan') if self._hdbscan_model is not None else None
+        if hdbscan is not None:
+            try:
+                labels, _ = hdbscan.approximate_predict(self._hdbscan_model, self._project(embeddings))
+            except Exception:
+                pass  # keep the nearest-centroid labels
+        labels = np.asarray(labels, dtype=np.int64)
+
+        # Append to the clustering
+        start = len(self.doc_keys)
+        self.doc_keys.extend(self._doc_key(doc) for doc in docs)
+        if len(self.documents) == start:
+            self.documents.extend(docs)
+        self.embeddings = embeddings if self.embeddings is None or not len(self.embeddings) \
+            else np.vstack([self.embeddings, embeddings.astype(self.embeddings.dtype)])
+        self.cluster_labels = np.concatenate([np.asarray(self.cluster_labels, dtype=np.int64), labels])
+
+        by_id = {cluster['id']: cluster for cluster in self.clusters}
+        for offset, (doc, label) in enumerate(zip(docs, labels.tolist())):
+            cluster = by_id.get(label)
+            if cluster is None:
+                cluster = {'id': label, 'name': "Uncategorized", 'size': 0, 'documents': [],
+                           'doc_indices': [], 'common_tags': [], 'keywords': []}
+                self.clusters.append(cluster)
+                by_id[label] = cluster
+            cluster['doc_indices'].append(start + offset)
+            if 'documents' in cluster:
+                cluster['documents'].append(doc)
+            cluster['size'] += 1
+        self._compute_centroids()
+
+        self.pending_documents += len(docs)
+        self.pending_similarity += float(best.sum())
+        return labels
+
+    @property
+    def drift(self) -> float:
+        """How much less the assigned documents resemble their clusters than the fitted ones"""
+        if not self.pending_documents or self.cohesion is None:
+            return 0.0
+        return self.cohesion - self.pending_similarity / self.pending_documents
+
+    def needs_recluster(self) -> bool:
+        """Whether enough documents were assigned (or they drifted enough) for a full fit"""
+        if self.pending_documents >= self.recluster_threshold:
+            return True
+        return self.pending_documents >= self.DRIFT_MIN_DOCUMENTS and self.drift >= self.recluster_drift
+
+    def update(self, documents: List[Dict[str, Any]],
+               embeddings: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Bring the clustering up to date with a corpus
+
+        Documents not clustered yet are assigned; the whole corpus is refit
+        when that makes a refit due (or nothing was fitted yet).
+
+        Args:
+            documents: The whole corpus
+            embeddings: Embeddings of the whole corpus (encoded when needed otherwise)
+
+        Returns:
+            fit()-style result with 'assigned' (documents assigned) and
+            'reclustered' (whether a full fit ran)
+        """
+        docs = list(documents)
+        if self.centroids is None:
+            return dict(self.fit(docs, embeddings), assigned=0, reclustered=True)
+
+        # Duplicates that fit() would drop are not new either
+        kept = {id(doc) for doc in self._dedupe_documents(docs)} if self.enable_dedup else None
+        known = set(self.doc_keys)
+        new = []
+        for i, doc in enumerate(docs):
+            key = self._doc_key(doc)
+            if key not in known and (kept is None or id(doc) in kept):
+                known.add(key)
+                new.append(i)
+        if new:
+            self.assign([docs[i] for i in new], embeddings[new] if embeddings is not None else None)
+
+        if self.needs_recluster():
+            return dict(self.fit(docs, embeddings), assigned=len(new), reclustered=True)
+        return {
+            'clusters': self.clusters,
+            'labels': self.cluster_labels,
+            'num_clusters': len(self.clusters),
+            'assigned': len(new),
+            'reclustered': False
         }
 
     # -------------------------
@@ -141,20 +388,85 @@ class AutoClusterer:
         return max(2, n_clusters)
 
     def _kmeans_cluster(self) -> np.ndarray:
-        if KMeans is None:
+        cluster = optional_import('sklearn.cluster')
+        if cluster is None:
             raise ImportError("scikit-learn not installed")
         n_clusters = self._effective_n_clusters()
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+        kmeans = cluster.KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
         return kmeans.fit_predict(self.embeddings)
 
+    def _batches(self, batch_size: int, shuffle: bool = False, seed: int = 42):
+        """Embeddings batch by batch (in random order when shuffle is set)"""
+        if not shuffle:
+            for start in range(0, len(self.embeddings), batch_size):
+                yield self.embeddings[start:start + batch_size]
+            return
+        # Documents arrive grouped by folder, so ordered batches would start
+        # the centres in a single topic
+        order = np.random.RandomState(seed).permutation(len(self.embeddings))
+        for start in range(0, len(order), batch_size):
+            yield self.embeddings[np.sort(order[start:start + batch_size])]
+
+    def _minibatch_kmeans_cluster(self) -> np.ndarray:
+        """K-Means fitted with partial_fit, one batch of embeddings at a time"""
+        cluster = optional_import('sklearn.cluster')
+        if cluster is None:
+            raise ImportError("scikit-learn not installed")
+        n_clusters = self._effective_n_clusters()
+        batch_size = max(int(self.config.get('clustering.minibatch_kmeans.batch_size', 1024)), n_clusters)
+        kmeans = cluster.MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size,
+                                         random_state=42, n_init='auto')
+        for epoch in range(int(self.config.get('clustering.minibatch_kmeans.epochs', 3))):
+            for batch in self._batches(batch_size, shuffle=True, seed=epoch):
+                # The first call initializes the centres, so it needs enough points
+                if len(batch) >= n_clusters or hasattr(kmeans, 'cluster_centers_'):
+                    kmeans.partial_fit(batch)
+        return np.concatenate([kmeans.predict(batch) for batch in self._batches(batch_size)])
+
+    def _birch_cluster(self) -> np.ndarray:
+        """
+        BIRCH: one pass builds a CF-tree of subclusters (memory bounded by
+        threshold and branching_factor), which are then grouped into
+        n_clusters with agglomerative clustering
+        """
+        cluster = optional_import('sklearn.cluster')
+        if cluster is None:
+            raise ImportError("scikit-learn not installed")
+        birch = cluster.Birch(threshold=self.config.get('clustering.birch.threshold', 0.5),
+                              branching_factor=self.config.get('clustering.birch.branching_factor', 50),
+                              n_clusters=None)
+        batch_size = int(self.config.get('clustering.birch.batch_size', 4096))
+        for batch in self._batches(batch_size):
+            birch.partial_fit(batch)
+        # Group the subclusters once all of them are known
+        birch.set_params(n_clusters=self._effective_n_clusters())
+        birch.partial_fit()
+        return np.concatenate([birch.predict(batch) for batch in self._batches(batch_size)])
+
     def _hierarchical_cluster(self) -> np.ndarray:
-        if AgglomerativeClustering is None:
+        """
+        Ward linkage; beyond clustering.hierarchical.connectivity_min_documents
+        merges are restricted to a sparse k-nearest-neighbour graph, which
+        keeps memory linear instead of quadratic in the number of documents
+        """
+        cluster = optional_import('sklearn.cluster')
+        if cluster is None:
             raise ImportError("scikit-learn not installed")
         n_clusters = self._effective_n_clusters()
-        clustering = AgglomerativeClustering(n_clusters=n_clusters, linkage='ward')
+        connectivity = None
+        min_documents = self.config.get('clustering.hierarchical.connectivity_min_documents', 2000)
+        if min_documents and len(self.embeddings) >= min_documents:
+            neighbors = optional_import('sklearn.neighbors')
+            n_neighbors = min(int(self.config.get('clustering.hierarchical.n_neighbors', 15)),
+                              len(self.embeddings) - 1)
+            connectivity = neighbors.kneighbors_graph(self.embeddings, n_neighbors=n_neighbors,
+                                                      include_self=False)
+        clustering = cluster.AgglomerativeClustering(n_clusters=n_clusters, linkage='ward',
+                                                     connectivity=connectivity)
         return clustering.fit_predict(self.embeddings)
 
     def _hdbscan_cluster(self) -> np.ndarray:
+        hdbscan = optional_import('hdbscan')
         if hdbscan is None:
             raise ImportError("hdbscan not installed")
 
@@ -164,22 +476,136 @@ class AutoClusterer:
             min_samples = max(3, min_cluster_size // 2)
 
         metric = self.metric or 'cosine'
+        # On unit-length vectors euclidean distance orders pairs as cosine
+        # does, and unlike cosine it is tree-accelerated
+        if metric == 'cosine':
+            metric = 'euclidean'
+
+        points = self.embeddings
+        method = self.config.get('clustering.hdbscan.reduce', None)
+        if method:
+            with self._phase('reduce'):
+                points = self._reduce(points, method)
+
+        if self.config.get('clustering.hdbscan.knn_graph', False):
+            n_neighbors = max(int(self.config.get('clustering.hdbscan.n_neighbors', 30)), min_samples + 1)
+            with self._phase('knn_graph'):
+                graph = self._knn_graph(points, n_neighbors)
+            with self._phase('hdbscan'):
+                clusterer = hdbscan.HDBSCAN(
+                    min_cluster_size=min_cluster_size,
+                    min_samples=min_samples,
+                    metric='precomputed'
+                )
+                # No prediction data for precomputed distances: assign() uses centroids
+                return clusterer.fit_predict(graph)
 
         try:
-            clusterer = hdbscan.HDBSCAN(
-                min_cluster_size=min_cluster_size,
-                min_samples=min_samples,
-                metric=metric
-            )
-            return clusterer.fit_predict(self.embeddings)
+            with self._phase('hdbscan'):
+                clusterer = hdbscan.HDBSCAN(
+                    min_cluster_size=min_cluster_size,
+                    min_samples=min_samples,
+                    metric=metric,
+                    prediction_data=True
+                )
+                labels = clusterer.fit_predict(points)
         except Exception:
             # fallback for older/stricter installs
+            self.timings.pop('hdbscan', None)
             clusterer = hdbscan.HDBSCAN(
                 min_cluster_size=min_cluster_size,
                 min_samples=min_samples,
-                metric='euclidean'
+                metric='euclidean',
+                prediction_data=True
             )
-            return clusterer.fit_predict(self.embeddings)
+            labels = clusterer.fit_predict(points)
+        # Kept for assign()
+        self._hdbscan_model = clusterer
+        return labels
+
+    def _reduce(self, points: np.ndarray, method: str) -> np.ndarray:
+        """Project embeddings to clustering.hdbscan.n_components dimensions (PCA or UMAP)"""
+        n_components = min(int(self.config.get('clustering.hdbscan.n_components', 32)),
+                           points.shape[1], len(points) - 1)
+        if method == 'pca':
+            decomposition = optional_import('sklearn.decomposition')
+            if decomposition is None:
+                raise ImportError("scikit-learn not installed")
+            reducer = decomposition.PCA(n_components=n_components, random_state=42)
+        elif method == 'umap':
+            umap = optional_import('umap')
+            if umap is None:
+                raise ImportError("umap-learn not installed")
+            reducer = umap.UMAP(n_components=n_components, metric='cosine', min_dist=0.0,
+                                n_neighbors=int(self.config.get('clustering.hdbscan.n_neighbors', 30)),
+                                random_state=42)
+        else:
+            raise ValueError(f"Unknown reduction: {method} (expected pca or umap)")
+        reduced = reducer.fit_transform(points)
+        # Kept so assign() can project new documents the same way
+        self._reducer = reducer
+        return self._unit(reduced)
+
+    def _unit(self, points: np.ndarray) -> np.ndarray:
+        """
+        Projections are not unit length; rescale them so that euclidean
+        distance keeps standing in for cosine
+        """
+        points = np.ascontiguousarray(points, dtype=np.float32)
+        if (self.metric or 'cosine') == 'cosine':
+            points /= np.linalg.norm(points, axis=1, keepdims=True) + 1e-12
+        return points
+
+    def _project(self, embeddings: np.ndarray) -> np.ndarray:
+        """Embeddings in the space HDBSCAN was fitted in"""
+        if self._reducer is None:
+            return embeddings
+        return self._unit(self._reducer.transform(embeddings))
+
+    def _knn_graph(self, points: np.ndarray, n_neighbors: int):
+        """
+        Sparse symmetric graph of euclidean distances to each point's
+        n_neighbors nearest neighbours, found with FAISS (HNSW from
+        clustering.hdbscan.approximate_min_documents points on)
+
+        HDBSCAN needs a connected graph, so separate components are joined
+        by the minimum spanning tree over one representative of each.
+        """
+        faiss = optional_import('faiss')
+        if faiss is None:
+            raise ImportError("faiss not installed")
+        sparse = optional_import('scipy.sparse')
+        csgraph = optional_import('scipy.sparse.csgraph')
+
+        points = np.ascontiguousarray(points, dtype=np.float32)
+        n, dim = points.shape
+        k = min(n_neighbors, n - 1)
+        if n >= self.config.get('clustering.hdbscan.approximate_min_documents', 20000):
+            index = faiss.IndexHNSWFlat(dim, 32)
+            index.hnsw.efSearch = max(64, 2 * k)
+        else:
+            index = faiss.IndexFlatL2(dim)
+        index.add(points)
+        distances, neighbors = index.search(points, k + 1)
+
+        # Drop each point itself (and missing neighbours, returned as -1)
+        rows = np.repeat(np.arange(n), k + 1)
+        neighbors, distances = neighbors.ravel(), np.sqrt(np.maximum(distances.ravel(), 0))
+        keep = (neighbors >= 0) & (neighbors != rows)
+        graph = sparse.csr_matrix((distances[keep], (rows[keep], neighbors[keep])), shape=(n, n))
+        graph = graph.maximum(graph.T)
+
+        count, components = csgraph.connected_components(graph, directed=False)
+        if count > 1:
+            representatives = np.unique(components, return_index=True)[1]
+            between = points[representatives]
+            gaps = np.sqrt(np.maximum(((between[:, None, :] - between[None, :, :]) ** 2).sum(-1), 1e-12))
+            np.fill_diagonal(gaps, 0)
+            tree = csgraph.minimum_spanning_tree(gaps).tocoo()
+            bridges = sparse.csr_matrix((tree.data, (representatives[tree.row], representatives[tree.col])),
+                                        shape=(n, n))
+            graph = graph.maximum(bridges).maximum(bridges.T)
+        return graph.tocsr()
 
     # -------------------------
     # Organize clusters
@@ -217,6 +643,32 @@ class AutoClusterer:
         clusters.sort(key=lambda c: (c['id'] == -1, -c['size']))
         return clusters
 
+    def _compute_centroids(self):
+        labels = np.asarray(self.cluster_labels)
+        clustered = labels != -1
+        ids, inverse = np.unique(labels[clustered], return_inverse=True)
+        sums = np.zeros((len(ids), self.embeddings.shape[1]), dtype=np.float64)
+        np.add.at(sums, inverse, self.embeddings[clustered])
+        sums /= np.linalg.norm(sums, axis=1, keepdims=True) + 1e-12
+        self.centroids = sums.astype(np.float32)
+        self.centroid_ids = ids.astype(np.int64)
+
+    def _cohesion(self) -> Optional[float]:
+        labels = np.asarray(self.cluster_labels)
+        clustered = np.flatnonzero(labels != -1)
+        if not len(clustered):
+            return None
+        rows = np.searchsorted(self.centroid_ids, labels[clustered])
+        similarities = np.einsum('ij,ij->i', self.embeddings[clustered], self.centroids[rows])
+        return float(similarities.mean())
+
+    def _doc_key(self, doc: Dict[str, Any]) -> str:
+        """Path of a document, or a hash of its content when it has none"""
+        path = ((doc.get('metadata', {}) or {}).get('path', '') or '').strip().lower()
+        if path:
+            return path
+        return 'md5:' + hashlib.md5((doc.get('content', '') or '').encode('utf-8')).hexdigest()
+
     # -------------------------
     # Naming strategy
     # -------------------------
@@ -233,7 +685,8 @@ class AutoClusterer:
                 c['name'] = "Uncategorized"
 
         # Prefer TF-IDF if available
-        if self.enable_tfidf_naming and TfidfVectorizer is not None and self._name_texts:
+        if self.enable_tfidf_naming and self._name_texts \
+                and optional_import('sklearn.feature_extraction.text') is not None:
             try:
                 self._name_clusters_tfidf()
                 return
@@ -243,44 +696,67 @@ class AutoClusterer:
         # Fallback to a safer counter method
         self._name_clusters_counter_fallback()
 
-    def _name_clusters_tfidf(self):
-        # Add a few domain-generic stopwords to avoid "documents/based/cluster"
-        extra_stop = {
-            'document', 'documents', 'based', 'cluster', 'clustering', 'data', 'text',
-            'note', 'notes', 'example', 'examples', 'introduction', 'overview'
-        }
+    def _tfidf(self):
+        """
+        TF-IDF matrix and vocabulary of the naming texts
 
-        vectorizer = TfidfVectorizer(
+        Reclustering the same documents (another algorithm, a refit) reuses
+        the fitted matrix instead of vectorizing the corpus again.
+        """
+        fingerprint = hashlib.md5('\0'.join(self._name_texts).encode('utf-8')).hexdigest()
+        with AutoClusterer._tfidf_lock:
+            cached = AutoClusterer._tfidf_cache.get(fingerprint)
+            if cached is not None:
+                AutoClusterer._tfidf_cache.move_to_end(fingerprint)
+                return cached
+
+        text = optional_import('sklearn.feature_extraction.text')
+        vectorizer = text.TfidfVectorizer(
             stop_words="english",
             max_features=20000,
             ngram_range=(1, 2),
             min_df=2
         )
-        X = vectorizer.fit_transform(self._name_texts)
+        X = vectorizer.fit_transform(self._name_texts).tocsr()
         vocab = np.array(vectorizer.get_feature_names_out())
+        # Terms never used as keywords: extra stopwords and leftover tag_ tokens
+        excluded = np.array([term in self.NAMING_STOPWORDS or term.startswith("tag_") for term in vocab],
+                            dtype=bool)
 
-        for cluster in self.clusters:
-            idxs = cluster.get('doc_indices', [])
-            if not idxs:
+        with AutoClusterer._tfidf_lock:
+            AutoClusterer._tfidf_cache[fingerprint] = (X, vocab, excluded)
+            while len(AutoClusterer._tfidf_cache) > self.TFIDF_CACHE_SIZE:
+                AutoClusterer._tfidf_cache.popitem(last=False)
+        return X, vocab, excluded
+
+    def _name_clusters_tfidf(self):
+        sparse = optional_import('scipy.sparse')
+        X, vocab, excluded = self._tfidf()
+
+        # Every cluster's mean TF-IDF vector in one product: row i of the
+        # indicator matrix holds 1/size at the documents of cluster i
+        sizes = np.array([len(cluster.get('doc_indices', [])) for cluster in self.clusters])
+        rows = np.repeat(np.arange(len(self.clusters)), sizes)
+        cols = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                              [np.asarray(cluster.get('doc_indices', []), dtype=np.int64)
+                               for cluster in self.clusters])
+        weights = np.repeat(1.0 / np.maximum(sizes, 1), sizes)
+        indicator = sparse.csr_matrix((weights, (rows, cols)), shape=(len(self.clusters), X.shape[0]))
+        means = (indicator @ X).tocsr()
+        means.data[excluded[means.indices]] = 0
+        means.eliminate_zeros()
+
+        for position, cluster in enumerate(self.clusters):
+            if not sizes[position]:
                 continue
 
-            mean_vec = X[idxs].mean(axis=0)
-            mean_vec = np.asarray(mean_vec).ravel()
-
-            top = mean_vec.argsort()[-20:][::-1]
-            keywords = []
-            for i in top:
-                if mean_vec[i] <= 0:
-                    break
-                kw = vocab[i]
-                # filter out extra stopwords + any leftover tag_ token
-                if kw.startswith("tag_"):
-                    continue
-                if kw in extra_stop:
-                    continue
-                keywords.append(kw)
-                if len(keywords) >= 10:
-                    break
+            # Top 10 terms among the cluster's non-zero ones
+            start, end = means.indptr[position], means.indptr[position + 1]
+            values, terms = means.data[start:end], means.indices[start:end]
+            if len(values) > 10:
+                top = np.argpartition(-values, 9)[:10]
+                values, terms = values[top], terms[top]
+            keywords = vocab[terms[np.argsort(-values, kind='stable')]].tolist()
 
             cluster['keywords'] = keywords
 
@@ -330,55 +806,6 @@ class AutoClusterer:
     # -------------------------
     # Text building & cleaning
     # -------------------------
-    def _clean_markdown(self, text: str) -> str:
-        if not text:
-            return ""
-        text = re.sub(r"^---.*?---\s*", "", text, flags=re.S)        # frontmatter
-        text = re.sub(r"```.*?```", " ", text, flags=re.S)           # fenced code
-        text = re.sub(r"`[^`]+`", " ", text)                         # inline code
-        text = re.sub(r"\[([^\]]+)\]\([^)]+\)", r"\1", text)         # md links
-        text = re.sub(r"\[\[([^\]]+)\]\]", r"\1", text)              # wiki links
-        text = re.sub(r"^\s*#{1,6}\s*", "", text, flags=re.M)        # headings
-        text = re.sub(r"^\s*[-*+]\s*", "", text, flags=re.M)         # bullets
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
-
-    def _strip_timestamps(self, text: str) -> str:
-        """
-        Remove timestamp-like tokens so repeated indexing with different timestamps
-        won't break content-hash dedupe.
-        """
-        if not text:
-            return ""
-
-        # ISO dates: 2026-01-07, 2026/01/07
-        text = re.sub(r"\b20\d{2}[-/]\d{1,2}[-/]\d{1,2}\b", " ", text)
-
-        # Times: 12:34, 12:34:56
-        text = re.sub(r"\b\d{1,2}:\d{2}(:\d{2})?\b", " ", text)
-
-        # Full timestamp: 2026-01-07T12:34:56 or 2026-01-07 12:34:56
-        text = re.sub(r"\b20\d{2}[-/]\d{1,2}[-/]\d{1,2}[T\s]\d{1,2}:\d{2}(:\d{2})?\b", " ", text)
-
-        # Unix-like long numbers (10-13 digits)
-        text = re.sub(r"\b\d{10,13}\b", " ", text)
-
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
-
-    def _normalize_title(self, title: str) -> str:
-        """
-        Normalize titles like:
-        'Agents - Function Calling (9)' -> 'Agents - Function Calling'
-        """
-        if not title:
-            return ""
-        t = title.strip()
-        t = re.sub(r"\s*\(\d+\)\s*$", "", t)   # remove trailing "(9)"
-        t = re.sub(r"\s*-\s*\d+\s*$", "", t)  # remove trailing "- 9"
-        t = re.sub(r"\s+", " ", t).strip()
-        return t.lower()
-
     def _build_embedding_text(self, doc: Dict[str, Any]) -> str:
         meta = doc.get('metadata', {}) or {}
         title = (meta.get('title', '') or '').strip()
@@ -387,7 +814,7 @@ class AutoClusterer:
 
         content = (doc.get('content', '') or '')
         if self.enable_text_clean:
-            content = self._clean_markdown(content)
+            content = textclean.clean_markdown(content)
 
         content = content[: int(self.representation_max_chars)]
         tags_str = " ".join([f"tag_{t}" for t in tags])
@@ -406,7 +833,7 @@ class AutoClusterer:
 
         content = (doc.get('content', '') or '')
         if self.enable_text_clean:
-            content = self._clean_markdown(content)
+            content = textclean.clean_markdown(content)
 
         content = content[: int(self.representation_max_chars)]
         rep = f"{title}. {content}".strip()
@@ -420,35 +847,30 @@ class AutoClusterer:
         Strong dedupe rules to handle:
         - repeated indexing producing multiple copies
         - timestamp differences in content
-        - titles with (1)(2)(9)
+        - small edits between copies of a note
 
         Strategy:
         - key1: normalized path (if present)
         - key2: canonical content hash (markdown-clean + strip timestamps)
-        - key3: normalized title + canonical prefix hash (helps when path missing)
+        - key3: MinHash/LSH near-duplicates at clustering.dedup_threshold
+          (the signature saved by the indexer, else one of the canonical text)
         """
+        num_perm = self.config.get('documents.near_duplicates.num_perm', minhash.NUM_PERM)
+        lsh = minhash.LSHIndex(self.dedup_threshold, num_perm)
         seen_paths = set()
         seen_canon_hash = set()
-        seen_title_prefix = set()
         uniq = []
 
         for d in documents:
             meta = d.get('metadata', {}) or {}
             path = (meta.get('path', '') or '').strip().lower()
-            title = (meta.get('title', '') or '')
 
-            raw = (d.get('content', '') or '').strip()
-            cleaned = self._clean_markdown(raw) if self.enable_text_clean else raw
-            canon = self._strip_timestamps(cleaned)
+            raw = d.get('content', '') or ''
+            canon = textclean.canonical(raw) if self.enable_text_clean else textclean.strip_timestamps(raw)
 
             # Canonical hash
             canon_hash = hashlib.md5(canon.encode('utf-8')).hexdigest() if canon else None
 
-            # Title+prefix hash (for cases where only tiny timestamp differs)
-            norm_title = self._normalize_title(title)
-            canon_prefix = canon[:800]  # enough to be stable, not too large
-            title_prefix_key = (norm_title, hashlib.md5(canon_prefix.encode('utf-8')).hexdigest() if canon_prefix else "")
-
             # path-based dedupe
             if path:
                 if path in seen_paths:
@@ -461,11 +883,15 @@ class AutoClusterer:
                     continue
                 seen_canon_hash.add(canon_hash)
 
-            # title+prefix dedupe (catches "same note, different timestamp, different file path")
-            if norm_title and title_prefix_key[1]:
-                if title_prefix_key in seen_title_prefix:
+            # near-duplicate dedupe (catches "same note, a few words edited";
+            # the indexer's signatures are of the same canonical text)
+            sig = d.get('minhash')
+            if sig is None or len(sig) != num_perm:
+                sig = minhash.signature(canon, num_perm)
+            if sig is not None:
+                if lsh.query(sig):
                     continue
-                seen_title_prefix.add(title_prefix_key)
+                lsh.add(len(uniq), sig)
 
             uniq.append(d)
 
@@ -497,20 +923,14 @@ class AutoClusterer:
     def find_similar_clusters(self, doc_index: int, top_k: int = 3) -> List[Dict[str, Any]]:
         if self.embeddings is None or not self.clusters:
             return []
+        if self.centroids is None:
+            self._compute_centroids()
 
-        doc_embedding = self.embeddings[doc_index]
-        similarities = []
-
-        for cluster in self.clusters:
-            if cluster['id'] == -1:
-                continue
-            cluster_embeddings = self.embeddings[cluster['doc_indices']]
-            cluster_center = np.mean(cluster_embeddings, axis=0)
-            similarity = float(np.dot(doc_embedding, cluster_center))
-            similarities.append({'cluster': cluster, 'similarity': similarity})
-
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        return similarities[:top_k]
+        by_id = {cluster['id']: cluster for cluster in self.clusters}
+        similarities = self.centroids @ self.embeddings[doc_index]
+        order = np.argsort(-similarities, kind='stable')[:top_k]
+        return [{'cluster': by_id[int(self.centroid_ids[i])], 'similarity': float(similarities[i])}
+                for i in order]
 
     def save(self, path: str):
         path = Path(path)
@@ -531,23 +951,49 @@ class AutoClusterer:
             json.dump({
                 'clusters': cluster_data,
                 'algorithm': self.algorithm,
-                'num_documents': len(self.documents)
+                'num_documents': len(self.doc_keys),
+                'cohesion': self.cohesion,
+                'pending_documents': self.pending_documents,
+                'pending_similarity': self.pending_similarity,
+                'timings': self.timings
             }, f, indent=2)
 
         with open(path / "cluster_data.pkl", 'wb') as f:
             pickle.dump({
                 'labels': self.cluster_labels,
-                'embeddings': self.embeddings
+                'embeddings': self.embeddings,
+                'centroid_ids': self.centroid_ids,
+                'doc_keys': self.doc_keys,
+                'hdbscan_model': self._hdbscan_model,
+                'reducer': self._reducer
             }, f)
 
+        # Centroids on their own, for search to partition chunks without
+        # unpickling every embedding
+        if self.centroids is not None:
+            np.save(path / CENTROIDS_FILE, self.centroids)
+
     def load(self, path: str):
         path = Path(path)
 
         with open(path / "clusters.json", 'r', encoding='utf-8') as f:
             data = json.load(f)
             self.clusters = data['clusters']
+            self.algorithm = data.get('algorithm', self.algorithm)
+            self.cohesion = data.get('cohesion')
+            self.pending_documents = data.get('pending_documents', 0)
+            self.pending_similarity = data.get('pending_similarity', 0.0)
 
         with open(path / "cluster_data.pkl", 'rb') as f:
             data = pickle.load(f)
             self.cluster_labels = data['labels']
             self.embeddings = data['embeddings']
+            self.centroid_ids = data.get('centroid_ids')
+            self.doc_keys = data.get('doc_keys', [])
+            self._hdbscan_model = data.get('hdbscan_model')
+            self._reducer = data.get('reducer')
+
+        if self.centroid_ids is not None and (path / CENTROIDS_FILE).exists():
+            self.centroids = np.load(path / CENTROIDS_FILE)
+        else:
+            self.centroids = None
@@ -0,0 +1,81 @@
+"""
+Chunk-to-document result collapsing
+Search legs score chunks; a long document matching in many chunks would
+fill a results page on its own. Collapsing groups the scored chunks by
+their document and ranks documents by an aggregate of their chunk scores
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+METHODS = ('max', 'sum', 'mean')
+
+CHUNK_DOCS_FILE = "chunk_docs.npy"
+
+
+def chunk_documents(documents: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """
+    Document number of each chunk
+
+    Chunks without a doc_id count as documents of their own.
+
+    Returns:
+        int32 array, one entry per chunk
+    """
+    numbers: Dict[str, int] = {}
+    result = np.empty(len(documents), dtype=np.int32)
+    for idx, doc in enumerate(documents):
+        doc_id = doc.get('doc_id')
+        key = ('doc', doc_id) if doc_id is not None else ('chunk', idx)
+        result[idx] = numbers.setdefault(key, len(numbers))
+    return result
+
+
+def collapse(chunk_ids: np.ndarray, scores: np.ndarray, chunk_docs: np.ndarray,
+             method: str = 'max', top_n: int = 3) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[np.ndarray]]:
+    """
+    Aggregate chunk scores per document
+
+    Args:
+        chunk_ids: Scored chunks
+        scores: Their scores
+        chunk_docs: Document number of every chunk (see chunk_documents)
+        method: 'max' (best chunk), 'sum' (all chunks) or 'mean' (mean of
+            the top_n best chunks, missing ones counting as zero)
+        top_n: Chunks kept per document (for 'mean' and in the output)
+
+    Returns:
+        (best chunk, document score, matching chunks, top chunk ids) per
+        document, best document first
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown collapse method: {method!r} (expected one of {', '.join(METHODS)})")
+
+    chunk_ids = np.asarray(chunk_ids, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+    if not len(chunk_ids):
+        return chunk_ids, scores, np.zeros(0, dtype=np.int64), []
+
+    # Group by document, best chunk first within each group
+    docs = chunk_docs[chunk_ids]
+    order = np.lexsort((chunk_ids, -scores, docs))
+    docs, scores, chunk_ids = docs[order], scores[order], chunk_ids[order]
+    starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+    counts = np.diff(np.r_[starts, len(docs)])
+    rank = np.arange(len(docs)) - np.repeat(starts, counts)
+
+    if method == 'max':
+        totals = scores[starts]
+    elif method == 'sum':
+        totals = np.add.reduceat(scores, starts)
+    else:
+        group = np.repeat(np.arange(len(starts)), counts)
+        top = rank < top_n
+        totals = np.bincount(group[top], weights=scores[top], minlength=len(starts)) / top_n
+
+    ranking = np.lexsort((chunk_ids[starts], -totals))
+    kept = chunk_ids[rank < top_n]
+    members = np.split(kept, np.cumsum(np.minimum(counts, top_n))[:-1])
+    return (chunk_ids[starts][ranking], totals[ranking], counts[ranking],
+            [members[i] for i in ranking])
@@ -0,0 +1,232 @@
+"""
+Persistent query daemon for QuickHelp
+Keeps the model and index loaded behind a loopback HTTP endpoint so that
+`cli search` / `cli ask` skip the multi-second cold start
+"""
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .index_store import IndexStore, IndexHandle
+
+
+STATE_FILE = "daemon.json"
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return str(value)
+
+
+class QueryDaemon:
+    """
+    Serves search and ask requests from a warm engine
+
+    Endpoints (JSON over HTTP on 127.0.0.1):
+        GET  /health  - daemon status
+        POST /search  - {"query", "mode", "max_results", "filters"}
+        POST /ask     - {"question", "mode"}
+    """
+
+    def __init__(self, config, index_root: str, port: int = 0):
+        """
+        Initialize daemon
+
+        Args:
+            config: Config object
+            index_root: Index root directory (as passed to `cli index --output`)
+            port: Port to bind on 127.0.0.1 (0 picks a free port)
+        """
+        self.config = config
+        self.index_root = Path(index_root).absolute()
+        self.store = IndexStore(self.index_root)
+        self.handle = IndexHandle()
+        self.port = port
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._model = None
+        self._reranker = None
+        self._router = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def state_path(self) -> Path:
+        return self.index_root / STATE_FILE
+
+    def load(self) -> bool:
+        """
+        Load the published index if it differs from the one being served
+
+        Returns:
+            Whether an index is loaded
+        """
+        from .search import HybridSearch
+        from .rag import RAGSystem
+
+        path = self.store.current()
+        if path is None:
+            return False
+
+        with self._reload_lock:
+            with self.handle.acquire() as gen:
+                if gen is not None and gen.path == path:
+                    return True
+
+            engine = HybridSearch(self.config, model=self._model, reranker=self._reranker,
+                                  router=self._router)
+            engine.load(path)
+            if engine.semantic_search is not None:
+                self._model = engine.semantic_search.model
+            self._reranker = engine.reranker
+            self._router = engine.router
+            self.handle.swap(engine, RAGSystem(self.config, engine), path=path)
+        return True
+
+    def search(self, query: str, mode: str = 'hybrid', max_results: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        self.load()
+        with self.handle.acquire() as gen:
+            if gen is None:
+                raise RuntimeError("No index found. Run 'index' command first.")
+            results = gen.search_engine.search(query, mode=mode, max_results=max_results,
+                                               filters=filters)
+            gen.search_engine.highlight(query, results)
+        # The snippet replaces the chunk text in replies
+        for result in results:
+            result['document'] = {k: v for k, v in result['document'].items() if k != 'content'}
+        return results
+
+    def ask(self, question: str, mode: str = 'hybrid') -> Dict[str, Any]:
+        self.load()
+        with self.handle.acquire() as gen:
+            if gen is None:
+                raise RuntimeError("No index found. Run 'index' command first.")
+            return gen.rag_system.ask(question, search_mode=mode)
+
+    def serve_forever(self):
+        """Bind, advertise the endpoint in the index root and serve until stopped"""
+        self.load()
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, payload: Dict[str, Any]):
+                body = json.dumps(payload, default=_json_default).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/health':
+                    routing = daemon._router.metrics() if daemon._router is not None else None
+                    self._reply(200, {'success': True, 'pid': os.getpid(),
+                                      'index_root': str(daemon.index_root), 'routing': routing})
+                else:
+                    self._reply(404, {'success': False, 'error': 'Not found'})
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    data = json.loads(self.rfile.read(length) or b'{}')
+                    if self.path == '/search':
+                        results = daemon.search(data['query'], data.get('mode', 'hybrid'),
+                                                data.get('max_results', 10), data.get('filters'))
+                        self._reply(200, {'success': True, 'results': results})
+                    elif self.path == '/ask':
+                        result = daemon.ask(data['question'], data.get('mode', 'hybrid'))
+                        self._reply(200, {'success': True, 'result': result})
+                    else:
+                        self._reply(404, {'success': False, 'error': 'Not found'})
+                except Exception as e:
+                    self._reply(500, {'success': False, 'error': str(e)})
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self.port = self.server.server_address[1]
+
+        self.index_root.mkdir(parents=True, exist_ok=True)
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump({'pid': os.getpid(), 'port': self.port}, f)
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self._remove_state()
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+    def _remove_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                if json.load(f).get('pid') != os.getpid():
+                    return
+            self.state_path.unlink()
+        except (OSError, ValueError):
+            pass
+
+
+class DaemonClient:
+    """Talks to a running QueryDaemon"""
+
+    def __init__(self, port: int, timeout: float = 60.0):
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.timeout = timeout
+
+    @classmethod
+    def connect(cls, index_root: str) -> Optional['DaemonClient']:
+        """
+        Find a live daemon serving index_root
+
+        Returns:
+            A client, or None if no daemon is running
+        """
+        state_path = Path(index_root).absolute() / STATE_FILE
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                port = int(json.load(f)['port'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+        client = cls(port)
+        try:
+            client._request('GET', '/health', timeout=0.5)
+        except (OSError, ValueError):
+            return None
+        return client
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None) -> Dict[str, Any]:
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as response:
+                body = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            body = json.loads(e.read() or b'{}')
+        if not body.get('success'):
+            raise RuntimeError(body.get('error', 'daemon request failed'))
+        return body
+
+    def search(self, query: str, mode: str = 'hybrid', max_results: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        body = self._request('POST', '/search', {'query': query, 'mode': mode,
+                                                 'max_results': max_results, 'filters': filters})
+        return body['results']
+
+    def ask(self, question: str, mode: str = 'hybrid') -> Dict[str, Any]:
+        return self._request('POST', '/ask', {'question': question, 'mode': mode})['result']
@@ -0,0 +1,202 @@
+"""
+Metadata filters for search
+Tags and frontmatter fields are kept in an inverted index (value -> bitmap
+of chunk ids) and dates in sorted arrays, so a filter turns into a set of
+chunk ids before either search leg runs
+"""
+import pickle
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from .bitmap import Bitmap
+
+FILTERS_FILE = "filters.pkl"
+
+DATE_FIELDS = ('created_at', 'updated_at', 'date')
+
+# Frontmatter strings longer than this (descriptions, summaries) are not indexed
+MAX_VALUE_LENGTH = 100
+
+
+def _timestamp(value: Any, end_of_day: bool = False) -> Optional[float]:
+    """
+    Seconds since the epoch of a date, datetime or ISO string (naive times as UTC)
+
+    Args:
+        value: Date-like value
+        end_of_day: For a plain date, return the end of that day instead of its start
+    """
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = date.fromisoformat(text) if len(text) == 10 else datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+        if end_of_day:
+            value += timedelta(days=1) - timedelta(microseconds=1)
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _normalize(value: Any) -> str:
+    return str(value).strip().lower()
+
+
+def _values(value: Any) -> List[str]:
+    """Indexable values of a metadata field (scalars or lists of scalars)"""
+    items = value if isinstance(value, (list, tuple, set)) else [value]
+    values = []
+    for item in items:
+        if isinstance(item, str):
+            if 0 < len(item.strip()) <= MAX_VALUE_LENGTH:
+                values.append(_normalize(item))
+        elif isinstance(item, (int, float, bool)):
+            values.append(_normalize(item))
+    return values
+
+
+class MetadataIndex:
+    """
+    Inverted index over chunk metadata
+
+    Filters are dicts of field -> condition, all of which must hold:
+
+        {'tags': ['raft', 'paxos'],                   # any of these tags
+         'author': 'alice',                           # frontmatter field
+         'updated_at': {'from': '2024-01-01', 'to': '2024-06-30'}}
+
+    Date fields (created_at, updated_at and frontmatter `date`) take a
+    {'from', 'to'} range, inclusive at both ends, or a single day.
+    """
+
+    def __init__(self):
+        self.num_docs = 0
+        self.fields: Dict[str, Dict[str, Bitmap]] = {}
+        # field -> (sorted timestamps, chunk ids in the same order)
+        self.dates: Dict[str, tuple] = {}
+
+    def build(self, documents: Iterable[Dict[str, Any]]):
+        """
+        Build the index
+
+        Args:
+            documents: Chunks; tags, created_at and updated_at are read from
+                their metadata and other fields from metadata['frontmatter']
+        """
+        fields: Dict[str, Dict[str, List[int]]] = {}
+        dates: Dict[str, List[tuple]] = {field: [] for field in DATE_FIELDS}
+        num_docs = 0
+
+        for idx, doc in enumerate(documents):
+            num_docs += 1
+            metadata = doc.get('metadata', {}) or {}
+            frontmatter = metadata.get('frontmatter', {}) or {}
+
+            entries = {'tags': [tag.lstrip('#') for tag in _values(metadata.get('tags', []))]}
+            for field, value in frontmatter.items():
+                if field not in DATE_FIELDS and field != 'tags':
+                    entries[field] = _values(value)
+            for field, values in entries.items():
+                postings = fields.setdefault(field, {})
+                for value in set(values):
+                    postings.setdefault(value, []).append(idx)
+
+            for field in DATE_FIELDS:
+                value = frontmatter.get(field) if field == 'date' else metadata.get(field)
+                timestamp = _timestamp(value) if value is not None else None
+                if timestamp is not None:
+                    dates[field].append((timestamp, idx))
+
+        self.num_docs = num_docs
+        self.fields = {field: {value: Bitmap.from_ids(ids) for value, ids in postings.items()}
+                       for field, postings in fields.items()}
+        self.dates = {}
+        for field, pairs in dates.items():
+            pairs.sort()
+            self.dates[field] = (np.asarray([t for t, _ in pairs], dtype=np.float64),
+                                 np.asarray([i for _, i in pairs], dtype=np.int32))
+
+    def field_values(self, field: str) -> Dict[str, int]:
+        """Value -> number of chunks for a field (e.g. for filter pickers)"""
+        return {value: len(ids) for value, ids in self.fields.get(field, {}).items()}
+
+    def select(self, filters: Optional[Dict[str, Any]]) -> Optional[Bitmap]:
+        """
+        Chunks matching every condition of a filter
+
+        Args:
+            filters: Filter dict (see class docstring)
+
+        Returns:
+            Bitmap of chunk ids, or None when there is nothing to filter on
+        """
+        result = None
+        for field, condition in (filters or {}).items():
+            if condition is None or (isinstance(condition, (str, list, dict)) and not condition):
+                continue
+            if field in DATE_FIELDS:
+                matched = self._date_ids(field, condition)
+            else:
+                matched = self._value_ids(field, condition)
+            result = matched if result is None else result & matched
+            if not result:
+                break
+        return result
+
+    def mask(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """select() as a boolean array over chunk ids, None when nothing is filtered"""
+        selected = self.select(filters)
+        return None if selected is None else selected.to_mask(self.num_docs)
+
+    def _value_ids(self, field: str, condition: Any) -> Bitmap:
+        postings = self.fields.get(field, {})
+        values = _values(condition)
+        if field == 'tags':
+            values = [value.lstrip('#') for value in values]
+        return Bitmap.union_all(postings[value] for value in values if value in postings)
+
+    def _date_ids(self, field: str, condition: Any) -> Bitmap:
+        if not isinstance(condition, dict):
+            condition = {'from': condition, 'to': condition}
+
+        timestamps, ids = self.dates.get(field, (np.zeros(0), np.zeros(0, dtype=np.int32)))
+        lo, hi = 0, len(timestamps)
+        if condition.get('from') is not None:
+            start = _timestamp(condition['from'])
+            if start is None:
+                raise ValueError(f"Invalid date for {field}: {condition['from']!r}")
+            lo = np.searchsorted(timestamps, start, side='left')
+        if condition.get('to') is not None:
+            end = _timestamp(condition['to'], end_of_day=True)
+            if end is None:
+                raise ValueError(f"Invalid date for {field}: {condition['to']!r}")
+            hi = np.searchsorted(timestamps, end, side='right')
+
+        return Bitmap.from_ids(ids[lo:hi])
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        return (Path(path) / FILTERS_FILE).exists()
+
+    def save(self, path: Union[str, Path]):
+        with open(Path(path) / FILTERS_FILE, 'wb') as f:
+            pickle.dump({'num_docs': self.num_docs, 'fields': self.fields, 'dates': self.dates}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: Union[str, Path]):
+        with open(Path(path) / FILTERS_FILE, 'rb') as f:
+            data = pickle.load(f)
+        self.num_docs = data['num_docs']
+        # Indexes written before bitmaps hold sorted id arrays
+        self.fields = {field: {value: ids if isinstance(ids, Bitmap) else Bitmap.from_ids(ids)
+                               for value, ids in postings.items()}
+                       for field, postings in data['fields'].items()}
+        self.dates = data['dates']
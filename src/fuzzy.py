@@ -0,0 +1,160 @@
+"""
+Typo-tolerant term dictionary for keyword search
+Symmetric-delete lookup (as in SymSpell): every term is indexed under the
+strings obtained by deleting up to max_edits characters, and a query term
+matches through its own deletes. Deletes are stored as sorted 64-bit hashes
+so a lookup is a handful of binary searches, then candidates are verified
+with an edit distance that counts transpositions as one edit
+"""
+import hashlib
+import itertools
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+HASHES_FILE = "fuzzy.hashes.npy"
+TERM_IDS_FILE = "fuzzy.term_ids.npy"
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def deletes(term: str, max_edits: int) -> set:
+    """The term and every string obtained by deleting up to max_edits characters"""
+    result = {term}
+    for n in range(1, min(max_edits, len(term)) + 1):
+        for positions in itertools.combinations(range(len(term)), n):
+            result.add(''.join(c for i, c in enumerate(term) if i not in positions))
+    return result
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Optimal string alignment distance (insert, delete, substitute, swap
+    adjacent characters)
+
+    Returns:
+        The distance, or max_distance + 1 once it is known to exceed max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+def auto_max_edits(term: str, max_edits: int) -> int:
+    """Fewer edits for short terms: none up to 3 characters, one up to 5"""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 5:
+        return min(1, max_edits)
+    return max_edits
+
+
+class FuzzyTermIndex:
+    """
+    Maps query terms to close vocabulary terms
+
+    Memory grows with the number of deletes per term: about (length + 1)
+    entries per term for max_edits=1, quadratically more for 2.
+    """
+
+    def __init__(self, max_edits: int = 1):
+        self.max_edits = max_edits
+        self.terms: List[str] = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.term_ids = np.zeros(0, dtype=np.int32)
+
+    def build(self, terms: Iterable[str]):
+        """
+        Build the delete index
+
+        Args:
+            terms: Vocabulary, in a stable order (term ids are positions)
+        """
+        self.terms = list(terms)
+        hashes, term_ids = [], []
+        for term_id, term in enumerate(self.terms):
+            for variant in deletes(term, self.max_edits):
+                hashes.append(_hash(variant))
+                term_ids.append(term_id)
+
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(hashes, kind='stable')
+        self.hashes = hashes[order]
+        self.term_ids = term_ids[order]
+
+    def lookup(self, term: str, max_edits: Optional[int] = None,
+               limit: int = 3, frequency: Optional[Callable[[str], int]] = None) -> List[Tuple[str, int]]:
+        """
+        Vocabulary terms within max_edits of term
+
+        Args:
+            term: Query term (lowercased)
+            max_edits: Edit budget (default: the index's, reduced for short terms)
+            limit: Maximum number of terms returned
+            frequency: Optional term -> document frequency function used to break ties
+
+        Returns:
+            (term, distance) pairs, closest (then most frequent) first
+        """
+        if max_edits is None:
+            max_edits = auto_max_edits(term, self.max_edits)
+        max_edits = min(max_edits, self.max_edits)
+        if max_edits <= 0 or not len(self.hashes):
+            return []
+
+        query = np.asarray([_hash(v) for v in deletes(term, max_edits)], dtype=np.uint64)
+        lo = np.searchsorted(self.hashes, query, side='left')
+        hi = np.searchsorted(self.hashes, query, side='right')
+        candidate_ids = set()
+        for start, end in zip(lo.tolist(), hi.tolist()):
+            candidate_ids.update(self.term_ids[start:end].tolist())
+
+        matches = []
+        for term_id in candidate_ids:
+            candidate = self.terms[term_id]
+            distance = edit_distance(term, candidate, max_edits)
+            if 0 < distance <= max_edits:
+                matches.append((candidate, distance))
+
+        frequency = frequency or (lambda t: 0)
+        matches.sort(key=lambda m: (m[1], -frequency(m[0]), m[0]))
+        return matches[:limit]
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        return (Path(path) / HASHES_FILE).exists() and (Path(path) / TERM_IDS_FILE).exists()
+
+    def save(self, path: Union[str, Path]):
+        """Save the delete index (the vocabulary itself is saved with the postings)"""
+        np.save(Path(path) / HASHES_FILE, self.hashes)
+        np.save(Path(path) / TERM_IDS_FILE, self.term_ids)
+
+    def load(self, path: Union[str, Path], terms: Sequence[str]):
+        """
+        Load an index written by save()
+
+        Args:
+            path: Directory
+            terms: The vocabulary it was built from, in the same order
+        """
+        self.terms = list(terms)
+        self.hashes = np.load(Path(path) / HASHES_FILE)
+        self.term_ids = np.load(Path(path) / TERM_IDS_FILE)
@@ -0,0 +1,227 @@
+"""
+Versioned index storage for QuickHelp
+Each build is written to its own directory and published by atomically
+switching a pointer file, so readers never observe a half-written index
+"""
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+
+
+class IndexStore:
+    """
+    On-disk layout::
+
+        <root>/
+            CURRENT            # name of the published version directory
+            versions/
+                v000001/       # documents.json, keyword_docs.pkl, semantic/...
+                v000002/
+
+    Indexes written before versioning (files directly under <root>) are still
+    readable: current() falls back to <root> when no CURRENT pointer exists.
+    """
+
+    POINTER_FILE = "CURRENT"
+    VERSIONS_DIR = "versions"
+
+    def __init__(self, root: str, keep_versions: int = 3):
+        """
+        Initialize index store
+
+        Args:
+            root: Index root directory
+            keep_versions: Number of published versions to retain on disk
+        """
+        self.root = Path(root)
+        self.keep_versions = max(1, int(keep_versions))
+
+    @property
+    def versions_path(self) -> Path:
+        return self.root / self.VERSIONS_DIR
+
+    def versions(self) -> List[Path]:
+        """List version directories, oldest first"""
+        if not self.versions_path.exists():
+            return []
+        return sorted(p for p in self.versions_path.iterdir()
+                      if p.is_dir() and p.name.startswith('v'))
+
+    def new_version(self) -> Path:
+        """
+        Create an empty directory for the next index version
+
+        Returns:
+            Path of the new (unpublished) version directory
+        """
+        self.versions_path.mkdir(parents=True, exist_ok=True)
+        existing = [int(p.name[1:]) for p in self.versions() if p.name[1:].isdigit()]
+        number = max(existing, default=0) + 1
+
+        # mkdir is atomic, so concurrent writers never share a directory
+        while True:
+            path = self.versions_path / f"v{number:06d}"
+            try:
+                path.mkdir()
+                return path
+            except FileExistsError:
+                number += 1
+
+    def publish(self, version_path: Path):
+        """
+        Atomically make a version the current one
+
+        Args:
+            version_path: Directory returned by new_version() and fully written
+        """
+        version_path = Path(version_path)
+        tmp_path = self.root / f".{self.POINTER_FILE}.{os.getpid()}.tmp"
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(version_path.name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.root / self.POINTER_FILE)
+
+        self._prune(current=version_path)
+
+    def current(self) -> Optional[Path]:
+        """
+        Resolve the directory of the published index
+
+        Returns:
+            Current version directory, the legacy root directory, or None
+        """
+        pointer = self.root / self.POINTER_FILE
+        if pointer.exists():
+            name = pointer.read_text(encoding='utf-8').strip()
+            path = self.versions_path / name
+            if name and path.exists():
+                return path
+
+        # Pre-versioning layout
+        if (self.root / "documents.json").exists() or (self.root / "keyword_docs.pkl").exists():
+            return self.root
+
+        return None
+
+    def _prune(self, current: Path):
+        """
+        Delete old versions beyond keep_versions
+
+        Only versions older than the current one are candidates: newer ones
+        may still be being written by another process.
+        """
+        versions = [p for p in self.versions() if p.name < current.name]
+        excess = len(versions) - (self.keep_versions - 1)
+        for path in versions[:max(0, excess)]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def resolve_index_path(root: str) -> Path:
+    """
+    Resolve the readable index directory under root
+
+    Args:
+        root: Index root directory
+
+    Returns:
+        The current version directory, or root itself if nothing is published
+    """
+    return IndexStore(root).current() or Path(root)
+
+
+class IndexGeneration:
+    """
+    One loaded index (search engine plus companions) with a reference count
+
+    The generation is closed once it has been retired by a swap and the last
+    reader has released it.
+    """
+
+    def __init__(self, number: int, search_engine: Any, rag_system: Any = None,
+                 indexer: Any = None, path: Optional[Path] = None):
+        self.number = number
+        self.search_engine = search_engine
+        self.rag_system = rag_system
+        self.indexer = indexer
+        self.path = path
+        self.refs = 0
+        self.retired = False
+        self.closed = False
+
+    def close(self):
+        """Release resources held by the engine"""
+        self.closed = True
+        close = getattr(self.search_engine, 'close', None)
+        if callable(close):
+            close()
+
+
+class IndexHandle:
+    """
+    Reference-counted pointer to the live index generation
+
+    Readers pin a generation for the duration of a request via acquire();
+    swap() installs a new generation without waiting for them. The lock only
+    guards a pointer read and a counter increment, so readers never wait on
+    an index build.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current: Optional[IndexGeneration] = None
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @contextmanager
+    def acquire(self) -> Iterator[Optional[IndexGeneration]]:
+        """
+        Pin the current generation
+
+        Yields:
+            The current IndexGeneration, or None if nothing is loaded
+        """
+        with self._lock:
+            gen = self._current
+            if gen is not None:
+                gen.refs += 1
+        try:
+            yield gen
+        finally:
+            if gen is not None:
+                self._release(gen)
+
+    def swap(self, search_engine: Any, rag_system: Any = None, indexer: Any = None,
+             path: Optional[Path] = None) -> IndexGeneration:
+        """
+        Install a fully built index as the current generation
+
+        Returns:
+            The new IndexGeneration
+        """
+        with self._lock:
+            self._generation += 1
+            new = IndexGeneration(self._generation, search_engine, rag_system, indexer, path)
+            old, self._current = self._current, new
+            close_old = False
+            if old is not None:
+                old.retired = True
+                close_old = old.refs == 0
+
+        if close_old:
+            old.close()
+        return new
+
+    def _release(self, gen: IndexGeneration):
+        with self._lock:
+            gen.refs -= 1
+            close = gen.retired and gen.refs == 0
+        if close:
+            gen.close()
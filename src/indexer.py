@@ -3,14 +3,15 @@ Document indexer for QuickHelp
 Handles document loading, processing, and indexing
 """
 import os
-import re
 import hashlib
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from dataclasses import dataclass, asdict
 from datetime import datetime
 import json
 
+from . import textclean
+
 try:
     import frontmatter
 except ImportError:
@@ -29,6 +30,8 @@ class Document:
     updated_at: str
     word_count: int
     tags: List[str]
+    # MinHash signature of the content (see src.minhash), None when disabled
+    minhash: Optional[List[int]] = None
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary"""
@@ -59,14 +62,20 @@ class DocumentIndexer:
         self.chunking_enabled = config.get('documents.chunking.enabled', True)
         self.chunk_size = config.get('documents.chunking.chunk_size', 500)
         self.chunk_overlap = config.get('documents.chunking.chunk_overlap', 50)
+        self.minhash_enabled = config.get('documents.near_duplicates.enabled', True)
+        self.minhash_threshold = config.get('documents.near_duplicates.threshold', 0.9)
+        self.minhash_perm = config.get('documents.near_duplicates.num_perm', 128)
+        self.skip_near_duplicates = config.get('documents.near_duplicates.skip', False)
     
-    def index_directory(self, directory: str, recursive: bool = True) -> List[Document]:
+    def index_directory(self, directory: str, recursive: bool = True,
+                        progress: Optional[Callable[[int, int], None]] = None) -> List[Document]:
         """
         Index all documents in a directory
         
         Args:
             directory: Path to directory
             recursive: Whether to search recursively
+            progress: Optional callback called as progress(files_done, total_files)
         
         Returns:
             List of indexed documents
@@ -89,18 +98,24 @@ class DocumentIndexer:
                 files.extend(directory.glob(f"*{ext}"))
         
         # Process each file
-        for file_path in files:
+        for i, file_path in enumerate(files, 1):
             try:
                 doc = self.process_file(file_path)
                 if doc:
                     documents.append(doc)
             except Exception as e:
                 print(f"Error processing {file_path}: {e}")
+            if progress:
+                progress(i, len(files))
         by_path={d.path:d for d in self.documents} # deduplicate
         for d in documents: #deduplicate
             by_path[d.path]=d  #deduplicate
         self.documents=list(by_path.values()) #deduplicate
         #self.documents.extend(documents)
+        if self.skip_near_duplicates:
+            duplicates = self.near_duplicates()
+            self.documents = [d for d in self.documents if d.id not in duplicates]
+            documents = [d for d in documents if d.id not in duplicates]
         return documents
     
     def process_file(self, file_path: Path) -> Optional[Document]:
@@ -160,7 +175,8 @@ class DocumentIndexer:
                 created_at=created_at,
                 updated_at=updated_at,
                 word_count=word_count,
-                tags=tags
+                tags=tags,
+                minhash=self._minhash(content)
             )
             
             return doc
@@ -169,21 +185,42 @@ class DocumentIndexer:
             print(f"Error processing file {file_path}: {e}")
             return None
     
+    def _minhash(self, content: str) -> Optional[List[int]]:
+        """MinHash signature stored with a document"""
+        if not self.minhash_enabled:
+            return None
+        from . import minhash  # numpy stays out of lightweight commands
+        
+        sig = minhash.signature(textclean.canonical(content), self.minhash_perm)
+        return sig.tolist() if sig is not None else None
+    
+    def near_duplicates(self) -> Dict[str, str]:
+        """
+        Documents whose content nearly repeats an earlier document's
+        
+        Returns:
+            {document id: id of the first document it duplicates}
+        """
+        from . import minhash
+        
+        signatures = []
+        for doc in self.documents:
+            sig = doc.minhash
+            if sig is None or len(sig) != self.minhash_perm:
+                # Indexed without signatures, or with another signature length
+                sig = minhash.signature(textclean.canonical(doc.content), self.minhash_perm)
+            signatures.append(sig)
+        pairs = minhash.near_duplicates(signatures, self.minhash_threshold, self.minhash_perm)
+        return {self.documents[i].id: self.documents[j].id for i, j in pairs.items()}
+    
     def _extract_title(self, content: str, file_path: Path) -> str:
         """Extract title from content or filename"""
-        # Try to find H1 heading
-        match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
-        if match:
-            return match.group(1).strip()
-        
-        # Use filename as fallback
-        return file_path.stem
+        # H1 heading, else the filename
+        return textclean.extract_title(content) or file_path.stem
     
     def _extract_tags(self, content: str) -> List[str]:
         """Extract hashtags from content"""
-        # Find #tag patterns
-        tags = re.findall(r'#(\w+)', content)
-        return list(set(tags))
+        return textclean.extract_tags(content)
     
     def _generate_id(self, file_path: Path) -> str:
         """Generate unique ID for document"""
@@ -206,7 +243,7 @@ class DocumentIndexer:
                 'doc_id': doc.id,
                 'chunk_id': 0,
                 'content': doc.content,
-                'metadata': doc.metadata
+                'metadata': self._chunk_metadata(doc)
             }]
         
         words = doc.content.split()
@@ -222,15 +259,22 @@ class DocumentIndexer:
                 'content': chunk_content,
                 'start_word': i,
                 'end_word': min(i + self.chunk_size, len(words)),
-                'metadata': {
-                    'title': doc.title,
-                    'path': doc.path,
-                    'tags': doc.tags
-                }
+                'metadata': self._chunk_metadata(doc)
             })
         
         return chunks
     
+    def _chunk_metadata(self, doc: Document) -> Dict[str, Any]:
+        """Metadata copied onto each chunk (read by search filters)"""
+        return {
+            'title': doc.title,
+            'path': doc.path,
+            'tags': doc.tags,
+            'created_at': doc.created_at,
+            'updated_at': doc.updated_at,
+            'frontmatter': self._sanitize_metadata(doc.metadata)
+        }
+    
     def save_index(self, output_path: str):
         """
         Save indexed documents to file
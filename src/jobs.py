@@ -0,0 +1,276 @@
+"""
+Background jobs for QuickHelp
+Runs long pipelines (e.g. indexing) off the request thread and tracks per-stage progress
+"""
+import json
+import os
+import threading
+import traceback
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Job:
+    """
+    A background job with named stages
+
+    Each stage tracks how many units of work are done out of a total, so
+    callers can report progress like "files parsed 12/40".
+    """
+
+    def __init__(self, kind: str, stages: List[str]):
+        """
+        Initialize job
+
+        Args:
+            kind: Job type (e.g. 'index')
+            stages: Ordered list of stage names
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.pid = os.getpid()
+        self.kind = kind
+        self.status = 'pending'  # pending, running, done, failed
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self.stages = [
+            {'name': name, 'status': 'pending', 'done': 0, 'total': 0}
+            for name in stages
+        ]
+        self._lock = threading.Lock()
+        self.on_change: Optional[Callable[['Job'], None]] = None
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self)
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        for stage in self.stages:
+            if stage['name'] == name:
+                return stage
+        raise KeyError(f"Unknown stage: {name}")
+
+    def start_stage(self, name: str, total: int = 0):
+        """Mark a stage as running with the given amount of work"""
+        with self._lock:
+            stage = self._stage(name)
+            stage['status'] = 'running'
+            stage['total'] = int(total)
+            stage['done'] = 0
+        self._changed()
+
+    def update_stage(self, name: str, done: int, total: Optional[int] = None):
+        """Report absolute progress for a stage"""
+        with self._lock:
+            stage = self._stage(name)
+            stage['status'] = 'running'
+            stage['done'] = int(done)
+            if total is not None:
+                stage['total'] = int(total)
+        self._changed()
+
+    def finish_stage(self, name: str):
+        """Mark a stage as complete"""
+        with self._lock:
+            stage = self._stage(name)
+            stage['status'] = 'done'
+            stage['done'] = max(stage['done'], stage['total'])
+        self._changed()
+
+    def progress_callback(self, name: str) -> Callable[[int, int], None]:
+        """Return a (done, total) callback bound to a stage"""
+        return lambda done, total: self.update_stage(name, done, total)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to a JSON-friendly dictionary"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'pid': self.pid,
+                'kind': self.kind,
+                'status': self.status,
+                'error': self.error,
+                'result': self.result,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+                'stages': [dict(stage) for stage in self.stages]
+            }
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ('pending', 'running')
+
+
+class JobSnapshot:
+    """Read-only view of a job persisted by another process"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.id = data['id']
+        self.kind = data['kind']
+        self.status = data['status']
+
+    @property
+    def is_active(self) -> bool:
+        if self.status not in ('pending', 'running'):
+            return False
+        # A job whose process died will never finish
+        try:
+            os.kill(self.data['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, OSError):
+            pass
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.data)
+
+
+class JobManager:
+    """
+    Runs jobs on daemon threads and keeps a bounded history of them
+
+    With a state directory, job status is also written to disk so that any
+    process serving the same index (e.g. pre-fork workers) can report it.
+    """
+
+    def __init__(self, max_history: int = 20, state_dir: Optional[str] = None):
+        """
+        Initialize job manager
+
+        Args:
+            max_history: Number of finished jobs to keep for status lookups
+            state_dir: Optional directory where job status is persisted
+        """
+        self.max_history = max_history
+        self.state_dir = Path(state_dir) if state_dir else None
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        if self.state_dir:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+
+    def submit(self, kind: str, stages: List[str],
+               target: Callable[..., Optional[Dict[str, Any]]], *args, **kwargs) -> Job:
+        """
+        Start a job in the background
+
+        Args:
+            kind: Job type
+            stages: Ordered stage names
+            target: Function called as target(job, *args, **kwargs); its return
+                value becomes the job result
+
+        Returns:
+            The submitted Job
+        """
+        job = self._new_job(kind, stages)
+        with self._lock:
+            self._register(job)
+        self._start(job, target, args, kwargs)
+        return job
+
+    def submit_if_idle(self, kind: str, stages: List[str],
+                       target: Callable[..., Optional[Dict[str, Any]]], *args, **kwargs) -> Job:
+        """
+        Start a job unless one of the same kind is running
+
+        Looking for a running job and registering the new one happen under
+        one lock, so concurrent requests in this process start one job.
+        (Jobs of other processes are only seen through the state directory.)
+
+        Args:
+            As for submit()
+
+        Returns:
+            The running job of that kind, or the submitted one
+        """
+        with self._lock:
+            job = self._find_active(kind)
+            if job is not None:
+                return job
+            job = self._new_job(kind, stages)
+            self._register(job)
+        self._start(job, target, args, kwargs)
+        return job
+
+    def _new_job(self, kind: str, stages: List[str]) -> Job:
+        job = Job(kind, stages)
+        if self.state_dir:
+            job.on_change = self._persist
+            self._persist(job)
+        return job
+
+    def _register(self, job: Job):
+        # Called with self._lock held
+        self._jobs[job.id] = job
+        self._prune()
+
+    def _start(self, job: Job, target: Callable[..., Optional[Dict[str, Any]]],
+               args: tuple, kwargs: Dict[str, Any]):
+        def run():
+            job.status = 'running'
+            job._changed()
+            try:
+                job.result = target(job, *args, **kwargs)
+                job.status = 'done'
+            except Exception as e:
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = 'failed'
+            finally:
+                job.finished_at = datetime.now().isoformat()
+                job._changed()
+
+        thread = threading.Thread(target=run, name=f"{job.kind}-job-{job.id}", daemon=True)
+        thread.start()
+
+    def get(self, job_id: str):
+        """Look up a job by id (in this process, else in the state directory)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir and job_id.isalnum():
+            job = self._load(self.state_dir / f"{job_id}.json")
+        return job
+
+    def active(self, kind: str):
+        """Return the currently running job of a kind, if any"""
+        with self._lock:
+            return self._find_active(kind)
+
+    def _find_active(self, kind: str):
+        # Called with self._lock held
+        for job in self._jobs.values():
+            if job.kind == kind and job.is_active:
+                return job
+        if self.state_dir:
+            for file_path in self.state_dir.glob("*.json"):
+                job = self._load(file_path)
+                if job is not None and job.kind == kind and job.is_active:
+                    return job
+        return None
+
+    def _persist(self, job: Job):
+        file_path = self.state_dir / f"{job.id}.json"
+        tmp_path = file_path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp_path, file_path)
+
+    def _load(self, file_path: Path) -> Optional[JobSnapshot]:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return JobSnapshot(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if not job.is_active]
+        excess = len(finished) - self.max_history
+        for job in finished[:max(0, excess)]:
+            del self._jobs[job.id]
+            if self.state_dir:
+                (self.state_dir / f"{job.id}.json").unlink(missing_ok=True)
@@ -0,0 +1,34 @@
+"""
+Deferred imports for optional heavy dependencies
+Modules like sentence_transformers, faiss, sklearn, hdbscan, openai and
+tiktoken take seconds to import, so they are only imported on first real use
+"""
+import importlib
+import threading
+from typing import Any, Dict, Optional
+
+
+_modules: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def optional_import(name: str) -> Optional[Any]:
+    """
+    Import a module the first time it is needed
+
+    Args:
+        name: Dotted module name (e.g. 'sklearn.cluster')
+
+    Returns:
+        The module, or None if it is not installed
+    """
+    if name in _modules:
+        return _modules[name]
+
+    with _lock:
+        if name not in _modules:
+            try:
+                _modules[name] = importlib.import_module(name)
+            except ImportError:
+                _modules[name] = None
+    return _modules[name]
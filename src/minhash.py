@@ -0,0 +1,148 @@
+"""
+Near-duplicate detection with MinHash and LSH banding
+A MinHash signature estimates the Jaccard similarity of two documents' word
+shingles; banding the signatures puts likely near-duplicates in a shared
+bucket, so finding them takes one pass instead of comparing every pair
+"""
+import zlib
+from functools import lru_cache
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .textclean import words as tokenize
+
+
+NUM_PERM = 128
+SHINGLE_SIZE = 3
+
+# Multiply-shift hashing: the top 32 bits of (a*x + b) mod 2**64, a odd
+_SHIFT = np.uint64(32)
+
+
+@lru_cache(maxsize=4)
+def _permutations(num_perm: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Fixed seed: signatures saved with an index must stay comparable
+    rng = np.random.RandomState(1)
+    a = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.randint(0, 1 << 63, size=num_perm, dtype=np.uint64)
+    return a[:, None], b[:, None]
+
+
+def signature(text: str, num_perm: int = NUM_PERM,
+              shingle_size: int = SHINGLE_SIZE) -> Optional[np.ndarray]:
+    """
+    MinHash signature of a text's word shingles
+
+    Words are lowercased \\w+ runs, so markdown punctuation and spacing do
+    not change the signature.
+
+    Returns:
+        (num_perm,) uint32 array, or None for a text without words
+    """
+    words = tokenize(text)
+    if not words:
+        return None
+    count = max(1, len(words) - shingle_size + 1)
+    hashes = np.fromiter(
+        (zlib.crc32(' '.join(words[i:i + shingle_size]).encode('utf-8')) for i in range(count)),
+        dtype=np.uint64, count=count)
+    a, b = _permutations(num_perm)
+    return ((a * np.unique(hashes) + b) >> _SHIFT).min(axis=1).astype(np.uint32)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(np.asarray(first) == np.asarray(second)))
+
+
+@lru_cache(maxsize=32)
+def bands_for(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows per band) for a Jaccard threshold
+
+    Minimizes the summed probability of bucketing pairs below the threshold
+    together and pairs above it apart (the S-curve 1 - (1 - s**r)**b).
+    """
+    below = np.linspace(0.0, threshold, 100)
+    above = np.linspace(threshold, 1.0, 100)
+    best, best_error = (1, num_perm), float('inf')
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        false_positive = np.mean(1 - (1 - below ** rows) ** bands) * threshold
+        false_negative = np.mean((1 - above ** rows) ** bands) * (1 - threshold)
+        if false_positive + false_negative < best_error:
+            best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+class LSHIndex:
+    """
+    Banded MinHash signatures
+
+    Each band of rows values is a bucket key; documents sharing any bucket
+    are candidates, and candidates are kept only if their estimated
+    similarity reaches the threshold.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = NUM_PERM):
+        """
+        Args:
+            threshold: Jaccard similarity from which documents are near-duplicates
+            num_perm: Signature length
+        """
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = bands_for(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _keys(self, sig: np.ndarray):
+        if len(sig) != self.num_perm:
+            raise ValueError(f"Signature has {len(sig)} values, index expects {self.num_perm}")
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: Hashable, sig: np.ndarray):
+        """Index a signature under a key"""
+        sig = np.asarray(sig, dtype=np.uint32)
+        self._signatures[key] = sig
+        for band, bucket in self._keys(sig):
+            self._buckets[band].setdefault(bucket, []).append(key)
+
+    def query(self, sig: np.ndarray) -> List[Hashable]:
+        """Keys of the indexed near-duplicates of a signature, in insertion order"""
+        sig = np.asarray(sig, dtype=np.uint32)
+        candidates = {}
+        for band, bucket in self._keys(sig):
+            for key in self._buckets[band].get(bucket, ()):
+                candidates[key] = None
+        return [key for key in candidates
+                if similarity(self._signatures[key], sig) >= self.threshold]
+
+
+def near_duplicates(signatures: Sequence[Optional[np.ndarray]], threshold: float = 0.9,
+                    num_perm: int = NUM_PERM) -> Dict[int, int]:
+    """
+    Later near-duplicates of earlier items
+
+    Args:
+        signatures: One signature (array or list) per item (None = never a duplicate)
+
+    Returns:
+        {position: position of the first item it duplicates}
+    """
+    index = LSHIndex(threshold, num_perm)
+    duplicates = {}
+    for position, sig in enumerate(signatures):
+        if sig is None:
+            continue
+        matches = index.query(sig)
+        if matches:
+            duplicates[position] = matches[0]
+        else:
+            index.add(position, sig)
+    return duplicates
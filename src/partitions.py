@@ -0,0 +1,94 @@
+"""
+Cluster-partitioned retrieval
+The centroids found by AutoClusterer partition the chunks (each chunk goes
+to its closest centroid); a query is compared against the centroids and
+only the chunks of the closest few partitions are searched, as in an IVF
+index
+"""
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from .bitmap import Bitmap
+
+
+CENTROIDS_FILE = "centroids.npy"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+
+def load_centroids(path: Union[str, Path]) -> Optional[np.ndarray]:
+    """Centroids saved with a clustering, or None if there are none"""
+    path = Path(path) / CENTROIDS_FILE
+    if not path.exists():
+        return None
+    centroids = np.load(path)
+    return centroids if len(centroids) else None
+
+
+class ClusterPartitions:
+    """
+    Chunk partitions around cluster centroids
+
+    Partitions are kept as Bitmaps, so probing p of them is a union of p
+    bitmaps that callers can intersect with a metadata filter.
+    """
+
+    def __init__(self, centroids: np.ndarray):
+        """
+        Args:
+            centroids: (clusters, dim) cluster centres in embedding space
+        """
+        self.centroids = _normalize(centroids)
+        self.labels = np.zeros(0, dtype=np.int32)
+        self.partitions = []
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.labels)
+
+    def assign(self, embeddings: np.ndarray, batch_size: int = 65536):
+        """
+        Assign every chunk to its closest centroid
+
+        Args:
+            embeddings: (chunks, dim) chunk embeddings (may be memory-mapped;
+                they are read batch by batch)
+        """
+        if embeddings.ndim != 2 or embeddings.shape[1] != self.centroids.shape[1]:
+            raise ValueError(f"Centroids have dimension {self.centroids.shape[1]}, "
+                             f"embeddings have shape {embeddings.shape}")
+        labels = np.empty(len(embeddings), dtype=np.int32)
+        for start in range(0, len(embeddings), batch_size):
+            batch = np.asarray(embeddings[start:start + batch_size], dtype=np.float32)
+            labels[start:start + len(batch)] = np.argmax(batch @ self.centroids.T, axis=1)
+        self.labels = labels
+
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        self.partitions = [Bitmap.from_ids(order[bounds[i]:bounds[i + 1]])
+                           for i in range(len(self.centroids))]
+
+    def probe(self, query_embedding: np.ndarray, n_probe: int) -> Bitmap:
+        """
+        Chunks of the n_probe partitions whose centroids are closest to a query
+
+        Args:
+            query_embedding: (dim,) or (1, dim) query embedding
+            n_probe: Number of partitions to search
+
+        Returns:
+            Bitmap of chunk ids
+        """
+        similarities = self.centroids @ _normalize(query_embedding).ravel()
+        n_probe = min(n_probe, len(similarities))
+        closest = np.argpartition(-similarities, n_probe - 1)[:n_probe]
+        return Bitmap.union_all(self.partitions[i] for i in closest)
+
+    def mask(self, query_embedding: np.ndarray, n_probe: int) -> np.ndarray:
+        """Boolean mask over all chunks of probe()"""
+        return self.probe(query_embedding, n_probe).to_mask(self.num_chunks)
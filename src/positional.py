@@ -0,0 +1,534 @@
+"""
+Positional inverted index for keyword search
+Supports quoted phrases, NEAR/k proximity and boolean AND/OR/NOT, all
+evaluated by merging sorted postings lists instead of scanning chunk text
+"""
+import math
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .postings import CompressedPostings
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+QUERY_TOKEN_PATTERN = re.compile(r'"[^"]*"?|\(|\)|NEAR/\d+|[^\s()"]+')
+OPERATORS = {'AND', 'OR', 'NOT'}
+
+# A match is a span of token positions (start, end), both inclusive
+Span = Tuple[int, int]
+# Evaluated postings: (doc_id, spans) sorted by doc_id
+Matches = List[Tuple[int, List[Span]]]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def is_structured(query: str) -> bool:
+    """
+    Whether a query uses phrase, proximity or boolean syntax
+
+    A quote counts only as part of a closed "phrase". Parentheses count
+    only with AND/OR/NOT/NEAR operators to group (which make the query
+    structured on their own), so pasted code such as foo() or (see above)
+    stays a plain search.
+    """
+    if query.count('"') >= 2:
+        return True
+    # Tokenized like the parser, so "(NOT x)" still finds its operator
+    return any(token in OPERATORS or token.startswith('NEAR/')
+               for token in QUERY_TOKEN_PATTERN.findall(query))
+
+
+class QueryParser:
+    """
+    Recursive-descent parser for keyword queries
+
+    Grammar (operators are case-sensitive, adjacency means AND):
+        or   := and ('OR' and)*
+        and  := not (['AND'] not)*
+        not  := 'NOT' not | near
+        near := atom ('NEAR/k' atom)*
+        atom := '(' or ')' | '"phrase"' | word
+    """
+
+    def __init__(self, query: str):
+        self.tokens = QUERY_TOKEN_PATTERN.findall(query)
+        self.pos = 0
+
+    def parse(self) -> Optional[tuple]:
+        nodes = []
+        while self.pos < len(self.tokens):
+            node = self._or()
+            if node is not None:
+                nodes.append(node)
+            if self._peek() == ')':  # unbalanced
+                self._next()
+        if not nodes:
+            return None
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> str:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _or(self) -> Optional[tuple]:
+        children = [self._and()]
+        while self._peek() == 'OR':
+            self._next()
+            children.append(self._and())
+        children = [c for c in children if c is not None]
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def _and(self) -> Optional[tuple]:
+        children = []
+        while True:
+            token = self._peek()
+            if token is None or token in (')', 'OR'):
+                break
+            if token == 'AND':
+                self._next()
+                continue
+            child = self._not()
+            if child is not None:
+                children.append(child)
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def _not(self) -> Optional[tuple]:
+        if self._peek() == 'NOT':
+            self._next()
+            child = self._not()
+            return ('not', child) if child is not None else None
+        return self._near()
+
+    def _near(self) -> Optional[tuple]:
+        node = self._atom()
+        while node is not None and (self._peek() or '').startswith('NEAR/'):
+            distance = int(self._next()[len('NEAR/'):])
+            right = self._atom()
+            if right is not None:
+                node = ('near', distance, node, right)
+        return node
+
+    def _atom(self) -> Optional[tuple]:
+        token = self._peek()
+        if token is None or token in (')', 'OR', 'AND'):
+            return None
+        self._next()
+
+        if token == '(':
+            node = self._or()
+            if self._peek() == ')':
+                self._next()
+            return node
+
+        if token.startswith('NEAR/'):
+            return None
+
+        terms = tokenize(token.strip('"'))
+        if not terms:
+            return None
+        return ('term', terms[0]) if len(terms) == 1 else ('phrase', terms)
+
+
+def parse_query(query: str) -> Optional[tuple]:
+    """Parse a keyword query into a tree of term/phrase/near/and/or/not nodes"""
+    return QueryParser(query).parse()
+
+
+def positive_leaves(node: Optional[tuple]) -> List[List[str]]:
+    """Terms ([term]) and phrases ([terms]) a match can contain, i.e. not under NOT"""
+    if node is None or node[0] == 'not':
+        return []
+    if node[0] == 'term':
+        return [[node[1]]]
+    if node[0] == 'phrase':
+        return [node[1]]
+    if node[0] == 'near':
+        return positive_leaves(node[2]) + positive_leaves(node[3])
+    return [leaf for child in node[1] for leaf in positive_leaves(child)]
+
+
+def _intersect(a: Matches, b: Matches, combine) -> Matches:
+    """Merge two postings lists; combine returns the doc's spans or None to drop it"""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        doc_a, doc_b = a[i][0], b[j][0]
+        if doc_a == doc_b:
+            spans = combine(a[i][1], b[j][1])
+            if spans is not None:
+                result.append((doc_a, spans))
+            i += 1
+            j += 1
+        elif doc_a < doc_b:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _union(a: Matches, b: Matches) -> Matches:
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        doc_a, doc_b = a[i][0], b[j][0]
+        if doc_a == doc_b:
+            result.append((doc_a, sorted(a[i][1] + b[j][1])))
+            i += 1
+            j += 1
+        elif doc_a < doc_b:
+            result.append(a[i])
+            i += 1
+        else:
+            result.append(b[j])
+            j += 1
+    result.extend(a[i:])
+    result.extend(b[j:])
+    return result
+
+
+def _difference(a: Matches, b: Matches) -> Matches:
+    result = []
+    j = 0
+    for doc, spans in a:
+        while j < len(b) and b[j][0] < doc:
+            j += 1
+        if j == len(b) or b[j][0] != doc:
+            result.append((doc, spans))
+    return result
+
+
+def _near(distance: int):
+    def combine(left: List[Span], right: List[Span]) -> Optional[List[Span]]:
+        spans = []
+        for l_start, l_end in left:
+            for r_start, r_end in right:
+                # Words strictly between the two spans, in either order
+                gap = max(l_start, r_start) - min(l_end, r_end) - 1
+                if gap <= distance:
+                    spans.append((min(l_start, r_start), max(l_end, r_end)))
+        return sorted(set(spans)) or None
+    return combine
+
+
+def _both(left: List[Span], right: List[Span]) -> List[Span]:
+    return sorted(left + right)
+
+
+class PositionalIndex:
+    """
+    Maps each term to its postings: the sorted ids of the chunks containing
+    it and, per chunk, the token positions where it occurs (stored as
+    CompressedPostings)
+    """
+
+    LENGTHS_FILE = "postings.lengths.npy"
+
+    def __init__(self, prune_min_postings: Optional[int] = None):
+        """
+        Args:
+            prune_min_postings: Postings per query from which rank() prunes
+                with MaxScore; None scores exhaustively.
+                analysis/benchmark_keyword_pruning.py finds exhaustive scoring
+                with an argpartition top-k about twice as fast at every query
+                size up to 100k chunks, so pruning is off unless a deployment
+                measures otherwise
+        """
+        self.prune_min_postings = prune_min_postings
+        self.postings = CompressedPostings()
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    def build(self, texts: Iterable[str]):
+        """
+        Build the index
+
+        Args:
+            texts: Chunk texts in chunk-id order
+        """
+        postings: Dict[str, Tuple[List[int], List[List[int]]]] = {}
+        doc_lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for position, term in enumerate(tokens):
+                doc_ids, positions = postings.setdefault(term, ([], []))
+                if doc_ids and doc_ids[-1] == doc_id:
+                    positions[-1].append(position)
+                else:
+                    doc_ids.append(doc_id)
+                    positions.append([position])
+
+        self.postings = CompressedPostings.build(postings, doc_lengths)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.int32)
+
+    def doc_frequency(self, term: str) -> int:
+        return self.postings.doc_frequency(term)
+
+    def term_frequencies(self) -> Iterator[Tuple[str, int]]:
+        """(term, document frequency) for the whole vocabulary"""
+        return ((term, entry[0]) for term, entry in self.postings.terms.items())
+
+    def term_matches(self, term: str) -> Matches:
+        doc_ids, positions = self.postings.decode(term)
+        return [(doc, [(p, p) for p in pos]) for doc, pos in zip(doc_ids, positions)]
+
+    def _leapfrog(self, terms: List[str]) -> Iterator[Tuple[int, Dict[str, List[int]]]]:
+        """
+        Docs containing every term, found by advancing iterators over their
+        skip pointers; positions are decoded only for those docs
+
+        Yields:
+            (doc_id, term -> positions)
+        """
+        iterators = {term: self.postings.iterator(term) for term in set(terms)}
+        if not iterators or any(it is None for it in iterators.values()):
+            return
+        order = sorted(iterators.values(), key=lambda it: it.df)  # rarest term drives
+        lead = order[0]
+
+        while lead.doc is not None:
+            target = lead.doc
+            for it in order[1:]:
+                it.advance(target)
+                if it.doc is None:
+                    return
+                if it.doc != target:
+                    lead.advance(it.doc)
+                    break
+            else:
+                yield target, {term: it.positions() for term, it in iterators.items()}
+                lead.next()
+
+    def conjunction(self, terms: List[str]) -> Matches:
+        """Docs containing every term, with the terms' positions as spans"""
+        return [(doc, sorted((p, p) for positions in by_term.values() for p in positions))
+                for doc, by_term in self._leapfrog(terms)]
+
+    def phrase(self, terms: List[str]) -> Matches:
+        """Docs containing the terms at consecutive positions"""
+        matches = []
+        for doc, by_term in self._leapfrog(terms):
+            following = [set(by_term[term]) for term in terms[1:]]
+            spans = [(p, p + len(terms) - 1) for p in by_term[terms[0]]
+                     if all(p + i + 1 in positions for i, positions in enumerate(following))]
+            if spans:
+                matches.append((doc, spans))
+        return matches
+
+    def evaluate(self, node: tuple) -> Matches:
+        """
+        Evaluate a parsed query
+
+        Returns:
+            Sorted (doc_id, spans) pairs; spans are the matched token ranges
+        """
+        kind = node[0]
+
+        if kind == 'term':
+            return self.term_matches(node[1])
+
+        if kind == 'phrase':
+            return self.phrase(node[1])
+
+        if kind == 'near':
+            return _intersect(self.evaluate(node[2]), self.evaluate(node[3]), _near(node[1]))
+
+        if kind == 'or':
+            matches = []
+            for child in node[1]:
+                matches = _union(matches, self.evaluate(child))
+            return matches
+
+        if kind == 'not':
+            return _difference(self._all(), self.evaluate(node[1]))
+
+        # 'and': plain terms are intersected with skip pointers, other
+        # operands are merged in afterwards (shortest first), then the
+        # negated ones are subtracted
+        terms = [c[1] for c in node[1] if c[0] == 'term']
+        positives = [self.evaluate(c) for c in node[1] if c[0] not in ('term', 'not')]
+        negatives = [self.evaluate(c[1]) for c in node[1] if c[0] == 'not']
+        if terms:
+            positives.append(self.conjunction(terms))
+        if positives:
+            positives.sort(key=len)
+            matches = positives[0]
+            for other in positives[1:]:
+                if not matches:
+                    break
+                matches = _intersect(matches, other, _both)
+        else:
+            matches = self._all()
+        for negative in negatives:
+            matches = _difference(matches, negative)
+        return matches
+
+    def _all(self) -> Matches:
+        return [(doc, []) for doc in range(self.num_docs)]
+
+    def search(self, query: str, max_results: int = 100,
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Boolean/phrase/proximity search
+
+        Scores follow the substring scan: matches / (chunk length + 1)
+
+        Args:
+            query: Query string
+            max_results: Maximum number of results
+            allowed: Optional boolean mask of the chunks that may be returned
+
+        Returns:
+            List of (doc_index, score) tuples
+        """
+        node = parse_query(query)
+        if node is None:
+            return []
+
+        results = []
+        for doc, spans in self.evaluate(node):
+            if allowed is not None and not allowed[doc]:
+                continue
+            hits = len(spans) or 1  # pure NOT queries have no spans
+            results.append((doc, hits / (int(self.doc_lengths[doc]) + 1)))
+
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results[:max_results]
+
+    def rank(self, terms: List[str], max_results: int = 100,
+             stats: Optional[Dict[str, int]] = None,
+             allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Ranked disjunctive search: chunks matching any term, scored by
+        sum(idf * term frequency / (chunk length + 1))
+        
+        From prune_min_postings postings on (off by default), queries are
+        evaluated with MaxScore pruning, term at a time and rarest term first, using score
+        upper bounds precomputed at index time. Once the bounds of the terms
+        left cannot lift an unseen chunk past the current k-th best score,
+        only chunks already seen that can still make the top k are looked
+        up, decoding just the blocks holding them. Otherwise every posting
+        is scored (rank_exhaustive), which measured faster.
+
+        Args:
+            terms: Query terms
+            max_results: k
+            stats: Optional dict that receives 'scored' (postings scored)
+                and 'total' (postings an exhaustive evaluation would score)
+            allowed: Optional boolean mask of the chunks that may be returned;
+                other chunks are dropped as their postings are decoded
+
+        Returns:
+            List of (doc_index, score) tuples
+        """
+        # (term, idf, upper bound), rarest first so long lists come last
+        plan = []
+        for term in set(terms):
+            df = self.postings.doc_frequency(term)
+            if df:
+                idf = math.log(1 + self.num_docs / df)
+                plan.append((term, idf, idf * self.postings.max_weight(term)))
+        plan.sort(key=lambda p: self.postings.doc_frequency(p[0]))
+        total = sum(self.postings.doc_frequency(term) for term, _, _ in plan)
+        if stats is not None:
+            stats['total'] = total
+        if not plan or max_results <= 0:
+            if stats is not None:
+                stats['scored'] = 0
+            return []
+        if self.prune_min_postings is None or total < self.prune_min_postings:
+            if stats is not None:
+                stats['scored'] = total
+            return self.rank_exhaustive(terms, max_results, allowed=allowed)
+
+        remaining = np.cumsum([bound for _, _, bound in plan][::-1])[::-1]
+        lengths = self.doc_lengths.astype(np.float64) + 1
+        scores = np.zeros(self.num_docs, dtype=np.float64)
+        seen = np.zeros(self.num_docs, dtype=bool)
+        scored = 0
+
+        for i, (term, idf, _) in enumerate(plan):
+            threshold = -1.0
+            if seen.sum() >= max_results:
+                threshold = np.partition(scores[seen], -max_results)[-max_results]
+
+            if remaining[i] > threshold:
+                docs, tfs = self.postings.decode_blocks(term)
+                if allowed is not None:
+                    keep = allowed[docs]
+                    docs, tfs = docs[keep], tfs[keep]
+                seen[docs] = True
+            else:
+                # Unseen chunks can no longer qualify; look up the candidates only
+                candidates = np.flatnonzero(seen & (scores + remaining[i] > threshold))
+                if not len(candidates):
+                    break
+                last_docs = self.postings.block_last_docs(term)
+                blocks = np.unique(np.searchsorted(last_docs, candidates))
+                docs, tfs = self.postings.decode_blocks(term, blocks[blocks < len(last_docs)])
+                keep = np.isin(docs, candidates, assume_unique=True)
+                docs, tfs = docs[keep], tfs[keep]
+
+            scores[docs] += idf * (tfs / lengths[docs])
+            scored += len(docs)
+
+        if stats is not None:
+            stats['scored'] = scored
+        hits = np.flatnonzero(seen)
+        if len(hits) > max_results:
+            hits = hits[np.argpartition(-scores[hits], max_results - 1)[:max_results]]
+        order = np.lexsort((hits, -scores[hits]))
+        return [(int(hits[j]), float(scores[hits[j]])) for j in order]
+
+    def rank_exhaustive(self, terms: List[str], max_results: int = 100,
+                        allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Score every posting of every term (rank() of small queries, and its reference)"""
+        lengths = self.doc_lengths.astype(np.float64) + 1
+        scores = np.zeros(self.num_docs, dtype=np.float64)
+        seen = np.zeros(self.num_docs, dtype=bool)
+        for term in set(terms):
+            df = self.postings.doc_frequency(term)
+            if df:
+                docs, tfs = self.postings.decode_blocks(term)
+                if allowed is not None:
+                    keep = allowed[docs]
+                    docs, tfs = docs[keep], tfs[keep]
+                scores[docs] += math.log(1 + self.num_docs / df) * (tfs / lengths[docs])
+                seen[docs] = True
+
+        hits = np.flatnonzero(seen)
+        if len(hits) > max_results > 0:
+            hits = hits[np.argpartition(-scores[hits], max_results - 1)[:max_results]]
+        order = np.lexsort((hits, -scores[hits]))[:max_results]
+        return [(int(hits[j]), float(scores[hits[j]])) for j in order]
+
+    @classmethod
+    def exists(cls, path: Union[str, Path]) -> bool:
+        return CompressedPostings.exists(path) and (Path(path) / cls.LENGTHS_FILE).exists()
+
+    def save(self, path: Union[str, Path]):
+        """Save compressed postings and chunk lengths into a directory"""
+        self.postings.save(path)
+        np.save(Path(path) / self.LENGTHS_FILE, self.doc_lengths)
+
+    def load(self, path: Union[str, Path]):
+        """Load an index written by save()"""
+        self.postings = CompressedPostings.load(path)
+        self.doc_lengths = np.load(Path(path) / self.LENGTHS_FILE)
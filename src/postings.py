@@ -0,0 +1,283 @@
+"""
+Compressed postings lists for the keyword index
+Doc ids are delta-encoded and variable-byte compressed in blocks of
+BLOCK_SIZE entries with a skip entry per block, so iterators can jump over
+whole blocks during intersection and only decode what they visit. Each
+block also records the largest tf / (chunk length + 1) it holds, from
+which per-term score upper bounds for top-k pruning are derived.
+"""
+import bisect
+import pickle
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+BLOCK_SIZE = 128
+
+DOCS_FILE = "postings.docs.bin"
+POSITIONS_FILE = "postings.positions.bin"
+SKIPS_FILE = "postings.skips.npy"
+BLOCK_MAX_FILE = "postings.blockmax.npy"
+TERMS_FILE = "postings.terms.pkl"
+
+
+def encode_varints(values: Iterable[int], out: bytearray):
+    """Append non-negative ints to out, 7 bits per byte, high bit = more bytes follow"""
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decode_varint_array(buf: np.ndarray) -> np.ndarray:
+    """Decode every varint in a uint8 array at once"""
+    last = np.flatnonzero(buf < 0x80)
+    if len(last) == len(buf):  # all single-byte values
+        return buf.astype(np.int64)
+
+    first = np.empty_like(last)
+    first[0] = 0
+    first[1:] = last[:-1] + 1
+    # Shift each byte by 7 bits per byte already seen in its value
+    group = np.repeat(np.arange(len(last)), last - first + 1)
+    shifts = 7 * (np.arange(len(buf)) - first[group])
+    return np.add.reduceat((buf & 0x7F).astype(np.int64) << shifts, first)
+
+
+class CompressedPostings:
+    """
+    Postings for all terms in two byte streams
+
+    Doc stream, per block: (doc id delta, term frequency) varint pairs
+    Position stream, per block: for each doc, its position deltas
+    Skips: one row per block (last doc id, doc stream offset, position stream offset)
+    Block max: one float per block, max tf / (chunk length + 1)
+    """
+
+    def __init__(self):
+        self.docs = b''
+        self.positions = b''
+        self.skips = np.zeros((0, 3), dtype=np.int64)
+        self.block_max = np.zeros(0, dtype=np.float64)
+        self.terms: Dict[str, Tuple[int, int, int]] = {}  # term -> (df, first block, blocks)
+
+    @classmethod
+    def build(cls, postings: Dict[str, Tuple[List[int], List[List[int]]]],
+              doc_lengths: Sequence[int]) -> 'CompressedPostings':
+        """
+        Compress postings
+
+        Args:
+            postings: term -> (sorted doc ids, positions per doc)
+            doc_lengths: Token count of each chunk
+        """
+        docs = bytearray()
+        positions = bytearray()
+        skips = []
+        block_max = []
+        terms = {}
+
+        for term, (doc_ids, doc_positions) in postings.items():
+            first_block = len(skips)
+            for start in range(0, len(doc_ids), BLOCK_SIZE):
+                block_docs = doc_ids[start:start + BLOCK_SIZE]
+                block_positions = doc_positions[start:start + BLOCK_SIZE]
+                skips.append((block_docs[-1], len(docs), len(positions)))
+                block_max.append(max(len(pos) / (doc_lengths[doc] + 1)
+                                     for doc, pos in zip(block_docs, block_positions)))
+
+                previous = doc_ids[start - 1] if start else 0
+                for doc, pos in zip(block_docs, block_positions):
+                    encode_varints((doc - previous, len(pos)), docs)
+                    previous = doc
+                    encode_varints([pos[0]] + [b - a for a, b in zip(pos, pos[1:])], positions)
+            terms[term] = (len(doc_ids), first_block, len(skips) - first_block)
+
+        store = cls()
+        store.docs = bytes(docs)
+        store.positions = bytes(positions)
+        store.skips = np.asarray(skips, dtype=np.int64).reshape(-1, 3)
+        store.block_max = np.asarray(block_max, dtype=np.float64)
+        store.terms = terms
+        return store
+
+    def doc_frequency(self, term: str) -> int:
+        entry = self.terms.get(term)
+        return entry[0] if entry else 0
+
+    def iterator(self, term: str) -> Optional['PostingsIterator']:
+        entry = self.terms.get(term)
+        return PostingsIterator(self, *entry) if entry else None
+
+    def max_weight(self, term: str) -> float:
+        """Largest tf / (chunk length + 1) of the term, 0 if unknown"""
+        entry = self.terms.get(term)
+        if entry is None:
+            return 0.0
+        _, first_block, num_blocks = entry
+        return float(self.block_max[first_block:first_block + num_blocks].max())
+
+    def block_last_docs(self, term: str) -> np.ndarray:
+        """Last doc id of each of the term's blocks"""
+        _, first_block, num_blocks = self.terms[term]
+        return self.skips[first_block:first_block + num_blocks, 0]
+
+    def decode_blocks(self, term: str, blocks: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Doc ids and term frequencies of some (default: all) of a term's blocks
+
+        Returns:
+            (doc ids, tfs) as arrays
+        """
+        _, first_block, num_blocks = self.terms[term]
+        if blocks is None:
+            # Deltas chain across blocks, so the whole list decodes in one go
+            start, end = self._block_range(first_block, num_blocks, 1)
+            pairs = decode_varint_array(self._docs_array[start:end])
+            return np.cumsum(pairs[0::2]), pairs[1::2]
+
+        blocks = np.asarray(blocks, dtype=np.int64)
+        if not len(blocks):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        # Gather the blocks' bytes into one buffer and decode them together
+        rows = first_block + blocks
+        starts = self.skips[rows, 1]
+        ends = np.where(rows + 1 < len(self.skips),
+                        self.skips[np.minimum(rows + 1, len(self.skips) - 1), 1], len(self.docs))
+        sizes = ends - starts
+        gather = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        pairs = decode_varint_array(self._docs_array[gather])
+        deltas, tfs = pairs[0::2], pairs[1::2]
+
+        # Restart the running sum at each block from the previous block's last doc
+        counts = np.minimum(BLOCK_SIZE, self.doc_frequency(term) - blocks * BLOCK_SIZE)
+        previous = np.where(blocks > 0, self.skips[np.maximum(rows - 1, 0), 0], 0)
+        totals = np.cumsum(deltas)
+        block_start = np.cumsum(counts) - counts
+        base = previous - (totals[block_start] - deltas[block_start])
+        return totals + np.repeat(base, counts), tfs
+
+    @property
+    def _docs_array(self) -> np.ndarray:
+        return np.frombuffer(self.docs, dtype=np.uint8)
+
+    def _block_range(self, row: int, count: int, column: int) -> Tuple[int, int]:
+        """Byte range of count consecutive blocks in the doc (1) or position (2) stream"""
+        data = self.docs if column == 1 else self.positions
+        start = int(self.skips[row, column])
+        end = int(self.skips[row + count, column]) if row + count < len(self.skips) else len(data)
+        return start, end
+
+    def decode(self, term: str) -> Tuple[List[int], List[List[int]]]:
+        """All doc ids and positions of a term"""
+        doc_ids, positions = [], []
+        it = self.iterator(term)
+        while it is not None and it.doc is not None:
+            doc_ids.append(it.doc)
+            positions.append(it.positions())
+            it.next()
+        return doc_ids, positions
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.docs) + len(self.positions) + self.skips.nbytes + self.block_max.nbytes
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        return all((Path(path) / name).exists()
+                   for name in (DOCS_FILE, POSITIONS_FILE, SKIPS_FILE, BLOCK_MAX_FILE, TERMS_FILE))
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / DOCS_FILE).write_bytes(self.docs)
+        (path / POSITIONS_FILE).write_bytes(self.positions)
+        np.save(path / SKIPS_FILE, self.skips)
+        np.save(path / BLOCK_MAX_FILE, self.block_max)
+        with open(path / TERMS_FILE, 'wb') as f:
+            pickle.dump(self.terms, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'CompressedPostings':
+        path = Path(path)
+        store = cls()
+        store.docs = (path / DOCS_FILE).read_bytes()
+        store.positions = (path / POSITIONS_FILE).read_bytes()
+        store.skips = np.load(path / SKIPS_FILE)
+        store.block_max = np.load(path / BLOCK_MAX_FILE)
+        with open(path / TERMS_FILE, 'rb') as f:
+            store.terms = pickle.load(f)
+        return store
+
+
+class PostingsIterator:
+    """
+    Decode-on-demand cursor over one term's postings
+
+    `doc` is the current doc id (None once exhausted). Blocks are decoded
+    when entered; positions only when asked for.
+    """
+
+    def __init__(self, store: CompressedPostings, df: int, first_block: int, num_blocks: int):
+        self.store = store
+        self.df = df
+        self.first_block = first_block
+        self.num_blocks = num_blocks
+        # Last doc id of each block, for skipping
+        self._block_last = store.skips[first_block:first_block + num_blocks, 0].tolist()
+        self.block = -1
+        self.doc: Optional[int] = None
+        self._load_block(0)
+
+    def _load_block(self, block: int):
+        self.block = block
+        self._positions = None
+        if block >= self.num_blocks:
+            self.doc = None
+            return
+
+        start, end = self.store._block_range(self.first_block + block, 1, 1)
+        pairs = decode_varint_array(self.store._docs_array[start:end])
+        previous = self._block_last[block - 1] if block else 0
+        self._docs = (np.cumsum(pairs[0::2]) + previous).tolist()
+        self._tfs = pairs[1::2].tolist()
+        self._i = 0
+        self.doc = self._docs[0]
+
+    @property
+    def tf(self) -> int:
+        return self._tfs[self._i]
+
+    def next(self):
+        """Move to the next posting"""
+        self._i += 1
+        if self._i < len(self._docs):
+            self.doc = self._docs[self._i]
+        else:
+            self._load_block(self.block + 1)
+
+    def advance(self, target: int):
+        """Move to the first posting with doc id >= target, skipping whole blocks"""
+        if self.doc is None or self.doc >= target:
+            return
+        if self._block_last[self.block] < target:
+            block = bisect.bisect_left(self._block_last, target, self.block + 1)
+            self._load_block(block)
+            if self.doc is None:
+                return
+        self._i = bisect.bisect_left(self._docs, target, self._i)
+        self.doc = self._docs[self._i]
+
+    def positions(self) -> List[int]:
+        """Token positions of the term in the current doc"""
+        if self._positions is None:
+            # Decode the whole block's positions the first time one is needed
+            start, end = self.store._block_range(self.first_block + self.block, 1, 2)
+            deltas = decode_varint_array(np.frombuffer(self.store.positions, dtype=np.uint8)[start:end])
+            bounds = np.cumsum([0] + self._tfs)
+            self._positions = [np.cumsum(deltas[a:b]).tolist() for a, b in zip(bounds[:-1], bounds[1:])]
+        return self._positions[self._i]
@@ -6,14 +6,8 @@ Supports OpenAI and DeepSeek APIs
 import os
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-import requests
 
-try:
-    import openai
-    import tiktoken
-except ImportError:
-    openai = None
-    tiktoken = None
+from .lazy import optional_import
 
 
 class RAGSystem:
@@ -41,11 +35,15 @@ class RAGSystem:
         
         # Context configuration
         self.max_context_docs = config.get('rag.max_context_documents', 5)
+        if getattr(search_engine, 'reranker', None) is not None:
+            # Reranked results put the right passage first, so fewer are needed
+            self.max_context_docs = config.get('rag.reranked_context_documents', 3)
         self.context_window = config.get('rag.context_window', 4000)
         self.include_sources = config.get('rag.include_sources', True)
         
         # Initialize API client
         if self.provider == 'openai':
+            openai = optional_import('openai')
             if openai is None:
                 raise ImportError("openai package not installed")
             
@@ -64,14 +62,26 @@ class RAGSystem:
                 print("Warning: DeepSeek API key not configured")
 
         
-        # Initialize tokenizer
-        if tiktoken:
-            try:
-                self.tokenizer = tiktoken.encoding_for_model(self.model)
-            except:
-                self.tokenizer = tiktoken.get_encoding("cl100k_base")
-        else:
-            self.tokenizer = None
+        # Tokenizer is loaded on first use
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+    
+    @property
+    def tokenizer(self):
+        if not self._tokenizer_loaded:
+            tiktoken = optional_import('tiktoken')
+            if tiktoken:
+                try:
+                    self._tokenizer = tiktoken.encoding_for_model(self.model)
+                except:
+                    self._tokenizer = tiktoken.get_encoding("cl100k_base")
+            self._tokenizer_loaded = True
+        return self._tokenizer
+    
+    @tokenizer.setter
+    def tokenizer(self, value):
+        self._tokenizer = value
+        self._tokenizer_loaded = True
     
     def ask(self, question: str, search_mode: str = 'hybrid') -> Dict[str, Any]:
         """
@@ -79,7 +89,7 @@ class RAGSystem:
         
         Args:
             question: Question to answer
-            search_mode: Search mode ('keyword', 'semantic', 'hybrid')
+            search_mode: Search mode ('keyword', 'semantic', 'hybrid', 'auto')
         
         Returns:
             Dictionary with answer, sources, and metadata
@@ -178,6 +188,7 @@ class RAGSystem:
     
     def _generate_with_openai(self, question: str, context: str) -> str:
         """Generate answer using OpenAI API"""
+        openai = optional_import('openai')
         if openai is None or not openai.api_key:
             return "OpenAI API not configured. Please set OPENAI_API_KEY environment variable."
         
@@ -247,6 +258,8 @@ Answer:"""
                 'max_tokens': self.max_tokens
             }
             
+            import requests
+            
             response = requests.post(
                 f'{self.deepseek_base_url}/chat/completions',
                 headers=headers,
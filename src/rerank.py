@@ -0,0 +1,131 @@
+"""
+Cross-encoder reranking of search results
+A cross-encoder reads query and chunk together, which ranks far better
+than comparing separate embeddings but costs a model call per pair, so
+only the top candidates are scored, in batches, within a time budget
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .lazy import optional_import
+
+
+class Reranker:
+    """
+    Reorders search results by cross-encoder relevance
+
+    Pair scores are cached (LRU) by query and chunk text, so repeated and
+    paged queries skip the model. The reranker holds no index state and
+    can be shared by every engine of a process.
+    """
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+                 max_candidates: int = 30, batch_size: int = 16,
+                 time_budget_ms: Optional[float] = 300, cache_size: int = 10000, model=None):
+        """
+        Initialize the reranker (the model is loaded on first use)
+
+        Args:
+            model_name: sentence-transformers CrossEncoder model
+            max_candidates: Results scored per query; the rest keep their order below them
+            batch_size: Pairs scored per model call
+            time_budget_ms: Stop starting new batches after this long (None = no limit)
+            cache_size: Number of (query, chunk) scores kept
+            model: Already loaded CrossEncoder to use instead of loading one
+        """
+        if model is None and optional_import('sentence_transformers') is None:
+            raise ImportError("sentence-transformers not installed")
+
+        self.model_name = model_name
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.time_budget_ms = time_budget_ms
+        self.cache_size = cache_size
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, bytes], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    sentence_transformers = optional_import('sentence_transformers')
+                    self._model = sentence_transformers.CrossEncoder(self.model_name)
+        return self._model
+
+    def _key(self, query: str, text: str) -> Tuple[str, bytes]:
+        return query, hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def _cached(self, key) -> Optional[float]:
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key, score: float):
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, results: List[Dict[str, Any]],
+               stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Reorder results by cross-encoder score
+
+        The top max_candidates results are scored (cached pairs first, then
+        uncached ones in batches until the time budget runs out). The
+        leading run of scored results is reordered best first, with the
+        model's score as 'rerank_score'; from the first unscored result on,
+        results keep their original order, so a cached score further down
+        cannot lift a result over unscored ones ranked above it.
+
+        Args:
+            query: Search query
+            results: Results of HybridSearch.search(), best first
+            stats: Optional dict that receives 'scored', 'cached' and 'elapsed_ms'
+
+        Returns:
+            Reordered results
+        """
+        start = time.perf_counter()
+        candidates = results[:self.max_candidates]
+        keys = [self._key(query, result['document'].get('content', '') or '') for result in candidates]
+        scores: List[Optional[float]] = [self._cached(key) for key in keys]
+        cached = sum(score is not None for score in scores)
+
+        pending = [i for i, score in enumerate(scores) if score is None]
+        for batch_start in range(0, len(pending), self.batch_size):
+            elapsed_ms = 1000 * (time.perf_counter() - start)
+            if self.time_budget_ms is not None and batch_start and elapsed_ms >= self.time_budget_ms:
+                break
+            batch = pending[batch_start:batch_start + self.batch_size]
+            pairs = [(query, candidates[i]['document'].get('content', '') or '') for i in batch]
+            predictions = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            for i, prediction in zip(batch, predictions):
+                scores[i] = float(prediction)
+                self._store(keys[i], scores[i])
+
+        prefix = next((i for i, score in enumerate(scores) if score is None), len(scores))
+        reordered = sorted(range(prefix), key=lambda i: (-scores[i], i))
+
+        reranked = []
+        for i in reordered:
+            result = dict(candidates[i])
+            result['rerank_score'] = scores[i]
+            reranked.append(result)
+        reranked.extend(candidates[prefix:])
+        reranked.extend(results[self.max_candidates:])
+
+        if stats is not None:
+            stats['scored'] = sum(score is not None for score in scores) - cached
+            stats['cached'] = cached
+            stats['elapsed_ms'] = 1000 * (time.perf_counter() - start)
+        return reranked
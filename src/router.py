@@ -0,0 +1,124 @@
+"""
+Per-query choice of search mode
+Identifiers, error strings, regex patterns, tag names and single known
+words are answered fully by keyword search, so 'auto' mode only pays for a query
+embedding when the query reads like natural language
+"""
+import re
+import threading
+from typing import Any, Callable, Container, Dict, Tuple
+
+from .positional import is_structured, tokenize
+
+
+# Regex syntax that does not occur in prose: escapes, .* / .+ / .?,
+# character classes and anchors next to a word. A lone *, | or $ does
+# ("raft | paxos", "$5 plan")
+PATTERN_PATTERN = re.compile(r'\\[dwsbDWSB.]|\.[*+?]|\[\^?[^\]\s]+\]|^\^\w|\w\$$')
+IDENTIFIER_PATTERN = re.compile(r'''^(?:
+    \w+(?:(?:::|[./:#@-])\w+)+    # dotted, path, kebab: os.path, a::b, HTTP-404
+  | \w*_\w*                       # snake_case, _private
+  | \w*[a-z][A-Z]\w*              # camelCase, KeyError
+  | [A-Z][A-Z0-9]{2,}             # constants and errnos: ECONNREFUSED
+  | (?=\w*\d)(?=\w*[^\W\d])\w+    # mixed letters and digits: e1001, 0x1f
+)$''', re.VERBOSE)
+# Punctuation around tokens of pasted error strings ("KeyError: 'id'")
+STRIP_CHARS = '\'"`,;:()<>'
+
+
+def is_identifier(token: str) -> bool:
+    """Whether a token looks like code rather than a word"""
+    return bool(IDENTIFIER_PATTERN.match(token.strip(STRIP_CHARS)))
+
+
+class QueryRouter:
+    """
+    Classifies queries and counts the decisions
+
+    Routing is a handful of string checks and dictionary lookups; the
+    semantic leg is skipped for queries it is unlikely to improve:
+
+        structured   quotes, NEAR/k or AND/OR/NOT
+        pattern      regex syntax such as .* or \\d
+        identifier   at least half the tokens look like code
+        tag          the query is a tag name
+        short        a single word (up to max_keyword_terms), in the vocabulary
+
+    Everything else runs hybrid (reason 'long' or 'vocabulary_miss').
+    The router holds no index state and can be shared across engines, so
+    its metrics cover the life of the process.
+    """
+
+    def __init__(self, max_keyword_terms: int = 1):
+        """
+        Initialize the router
+
+        Args:
+            max_keyword_terms: Longest in-vocabulary query sent to keyword search only
+        """
+        self.max_keyword_terms = max_keyword_terms
+        self._lock = threading.Lock()
+        self._queries = 0
+        self._modes: Dict[str, Dict[str, float]] = {}
+        self._reasons: Dict[str, int] = {}
+
+    def route(self, query: str, doc_frequency: Callable[[str], int],
+              tags: Container[str] = (), semantic: bool = True) -> Tuple[str, str]:
+        """
+        Choose the search mode for a query
+
+        Args:
+            query: Search query
+            doc_frequency: Number of chunks containing a term (0 = unknown term)
+            tags: Known tag names, lowercased
+            semantic: Whether a semantic leg is available
+
+        Returns:
+            (mode, reason)
+        """
+        if not semantic:
+            return 'keyword', 'no_semantic'
+        if is_structured(query):
+            return 'keyword', 'structured'
+        if PATTERN_PATTERN.search(query):
+            return 'keyword', 'pattern'
+
+        tokens = query.split()
+        if tokens and 2 * sum(map(is_identifier, tokens)) >= len(tokens):
+            return 'keyword', 'identifier'
+        if query.strip().lower() in tags:
+            return 'keyword', 'tag'
+
+        terms = tokenize(query)
+        if not terms:
+            return 'keyword', 'no_terms'
+        if not all(doc_frequency(term) for term in terms):
+            return 'hybrid', 'vocabulary_miss'
+        if len(terms) <= self.max_keyword_terms:
+            return 'keyword', 'short'
+        return 'hybrid', 'long'
+
+    def record(self, mode: str, reason: str, elapsed_ms: float):
+        """Count a routing decision and the time the routed search took"""
+        with self._lock:
+            self._queries += 1
+            totals = self._modes.setdefault(mode, {'count': 0, 'total_ms': 0.0})
+            totals['count'] += 1
+            totals['total_ms'] += elapsed_ms
+            self._reasons[reason] = self._reasons.get(reason, 0) + 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Routing decisions so far
+
+        Returns:
+            {'queries': n, 'modes': {mode: {'count', 'avg_ms'}}, 'reasons': {reason: count}}
+        """
+        with self._lock:
+            return {
+                'queries': self._queries,
+                'modes': {mode: {'count': int(totals['count']),
+                                 'avg_ms': round(totals['total_ms'] / totals['count'], 3)}
+                          for mode, totals in self._modes.items()},
+                'reasons': dict(self._reasons),
+            }
@@ -3,64 +3,216 @@ Hybrid search engine combining keyword and semantic search
 Inspired by Cursor.com's scalable search architecture
 """
 import re
+import time
 import numpy as np
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Callable
 from pathlib import Path
 import pickle
 
-try:
-    from sentence_transformers import SentenceTransformer
-    from rank_bm25 import BM25Okapi
-    import faiss
-except ImportError:
-    SentenceTransformer = None
-    BM25Okapi = None
-    faiss = None
+from .lazy import optional_import
+from .storage import save_chunks, load_chunks, has_chunks
+from .trigram import TrigramIndex, literal_query
+from .positional import PositionalIndex, is_structured, parse_query, positive_leaves, tokenize
+from .fuzzy import FuzzyTermIndex
+from .suggest import Suggester
+from .filters import MetadataIndex
+from .collapse import CHUNK_DOCS_FILE, METHODS, chunk_documents, collapse as collapse_chunks
+from .snippets import closest_sentences, make_snippet, match_spans
+from .rerank import Reranker
+from .router import QueryRouter
+from .partitions import ClusterPartitions
 
 
 class KeywordSearch:
     """
     Grep-style keyword search
     Fast and scalable for exact matching
+    
+    Single-word queries match as substrings. Multi-word queries are answered
+    from a positional index: plain words are ranked by how many of them a
+    chunk contains, while quoted phrases, NEAR/k and AND/OR/NOT are evaluated
+    as boolean queries (case-insensitively). Words missing from the
+    vocabulary are expanded to close terms (typos such as "Lamprot").
     """
     
-    def __init__(self, case_sensitive: bool = False):
+    def __init__(self, case_sensitive: bool = False, fuzzy: bool = True,
+                 max_edits: int = 1, max_expansions: int = 3,
+                 prune_min_postings: Optional[int] = None):
         """
         Initialize keyword search
         
         Args:
             case_sensitive: Whether to perform case-sensitive search
+            fuzzy: Whether to expand unknown words to close vocabulary terms
+            max_edits: Maximum edit distance of an expansion
+            max_expansions: Maximum number of expansions per word
+            prune_min_postings: Postings per ranked query from which MaxScore
+                pruning is used (None: always score exhaustively)
         """
         self.case_sensitive = case_sensitive
+        self.fuzzy = fuzzy
+        self.max_edits = max_edits
+        self.max_expansions = max_expansions
+        self.prune_min_postings = prune_min_postings
         self.documents = []
+        self.trigram_index = None
+        self.positional_index = None
+        self.fuzzy_index = None
     
-    def index(self, documents: List[Dict[str, Any]]):
+    def index(self, documents: List[Dict[str, Any]], index_path: Optional[str] = None):
         """
         Index documents for keyword search
         
         Args:
             documents: List of document chunks
+            index_path: Directory holding indexes written by save(), loaded
+                instead of being rebuilt when present
         """
         self.documents = documents
+        self.trigram_index = TrigramIndex()
+        if index_path is not None and (Path(index_path) / "trigrams.pkl").exists():
+            self.trigram_index.load(Path(index_path) / "trigrams.pkl")
+        else:
+            self.trigram_index.build(self._texts())
+        
+        self.positional_index = PositionalIndex(self.prune_min_postings)
+        if index_path is not None and PositionalIndex.exists(index_path):
+            self.positional_index.load(index_path)
+        else:
+            self.positional_index.build(self._texts())
+        
+        self.fuzzy_index = None
+        if self.fuzzy:
+            vocabulary = list(self.positional_index.postings.terms)
+            self.fuzzy_index = FuzzyTermIndex(max_edits=self.max_edits)
+            if index_path is not None and FuzzyTermIndex.exists(index_path):
+                self.fuzzy_index.load(index_path, vocabulary)
+            else:
+                self.fuzzy_index.build(vocabulary)
+    
+    def save(self, path: str):
+        """
+        Save the trigram and positional indexes
+        
+        Args:
+            path: Directory to save to
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        if self.trigram_index is not None:
+            self.trigram_index.save(path / "trigrams.pkl")
+        if self.positional_index is not None:
+            self.positional_index.save(path)
+        if self.fuzzy_index is not None:
+            self.fuzzy_index.save(path)
+    
+    def _indexed(self, index) -> bool:
+        return index is not None and index.num_docs == len(self.documents)
     
-    def search(self, query: str, max_results: int = 100) -> List[Tuple[int, float]]:
+    def expand_terms(self, terms: List[str]) -> List[str]:
+        """
+        Replace words missing from the vocabulary with close vocabulary terms
+        
+        Args:
+            terms: Lowercased query words
+        
+        Returns:
+            Known words plus the expansions of unknown ones
+        """
+        if self.fuzzy_index is None or self.positional_index is None:
+            return terms
+        
+        frequency = self.positional_index.doc_frequency
+        expanded = []
+        for term in terms:
+            if frequency(term):
+                expanded.append(term)
+                continue
+            matches = self.fuzzy_index.lookup(term, limit=self.max_expansions, frequency=frequency)
+            expanded.extend(match for match, _ in matches)
+        return expanded
+    
+    def match_pattern(self, query: str) -> Optional["re.Pattern"]:
+        """
+        Regex finding what made a chunk match a query, for highlighting
+        
+        Covers the substring of single-word queries, the words (and typo
+        expansions) of multi-word queries, and the terms and phrases of
+        structured queries that are not negated.
+        
+        Args:
+            query: Search query
+        
+        Returns:
+            Compiled pattern, or None if the query has nothing to highlight
+        """
+        if is_structured(query):
+            leaves = positive_leaves(parse_query(query))
+        else:
+            leaves = [[term] for term in self.expand_terms(tokenize(query))]
+        
+        # Longest alternatives first so phrases win over their words
+        words = sorted({r'\W+'.join(map(re.escape, leaf)) for leaf in leaves}, key=len, reverse=True)
+        alternatives = [r'(?i:(?<!\w)' + word + r'(?!\w))' for word in words]
+        if not is_structured(query) and len(query.split()) == 1:
+            literal = re.escape(query.strip())
+            alternatives.insert(0, literal if self.case_sensitive else '(?i:' + literal + ')')
+        return re.compile('|'.join(alternatives)) if alternatives else None
+    
+    def _content(self, idx: int) -> str:
+        """Chunk text, without decoding metadata when chunks are memory-mapped"""
+        text = getattr(self.documents, 'text', None)
+        if text is not None:
+            return text(idx)
+        return self.documents[idx]['content']
+    
+    def _texts(self):
+        return (self._content(idx) for idx in range(len(self.documents)))
+    
+    def _candidates(self, candidates, allowed: Optional[np.ndarray]):
+        """Trigram candidates (None = every chunk) restricted to a filter mask"""
+        if allowed is None:
+            return range(len(self.documents)) if candidates is None else candidates
+        if candidates is None:
+            return np.flatnonzero(allowed)
+        candidates = np.asarray(candidates, dtype=np.int64)
+        return candidates[allowed[candidates]]
+    
+    def search(self, query: str, max_results: int = 100,
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
         """
         Search for documents matching query
         
         Args:
             query: Search query
             max_results: Maximum number of results
+            allowed: Optional boolean mask of the chunks that may match
+                (a metadata filter), applied before scanning or scoring
         
         Returns:
             List of (doc_index, score) tuples
         """
+        if self._indexed(self.positional_index):
+            if is_structured(query):
+                return self.positional_index.search(query, max_results, allowed=allowed)
+            if len(query.split()) > 1:
+                return self.positional_index.rank(self.expand_terms(tokenize(query)), max_results,
+                                                  allowed=allowed)
+        
         if not self.case_sensitive:
             query = query.lower()
         
+        # Only scan chunks containing the query's trigrams
+        candidates = None
+        if self._indexed(self.trigram_index):
+            candidates = self.trigram_index.evaluate(literal_query([query.lower()]))
+        candidates = self._candidates(candidates, allowed)
+        
         results = []
         
-        for idx, doc in enumerate(self.documents):
-            content = doc['content']
+        for idx in candidates:
+            idx = int(idx)
+            content = self._content(idx)
             if not self.case_sensitive:
                 content = content.lower()
             
@@ -72,17 +224,26 @@ class KeywordSearch:
                 score = occurrences / (len(content.split()) + 1)
                 results.append((idx, score))
         
+        if not results and self._indexed(self.positional_index):
+            # Nothing matched verbatim: retry with typo corrections
+            terms = tokenize(query)
+            expanded = self.expand_terms(terms)
+            if expanded != terms:
+                return self.positional_index.rank(expanded, max_results, allowed=allowed)
+        
         # Sort by score
         results.sort(key=lambda x: x[1], reverse=True)
         return results[:max_results]
     
-    def regex_search(self, pattern: str, max_results: int = 100) -> List[Tuple[int, float]]:
+    def regex_search(self, pattern: str, max_results: int = 100,
+                     allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
         """
         Search using regex pattern
         
         Args:
             pattern: Regex pattern
             max_results: Maximum number of results
+            allowed: Optional boolean mask of the chunks that may match
         
         Returns:
             List of (doc_index, score) tuples
@@ -92,10 +253,17 @@ class KeywordSearch:
         except re.error:
             return []
         
+        # Only run the regex on chunks containing its required trigrams
+        candidates = None
+        if self._indexed(self.trigram_index):
+            candidates = self.trigram_index.candidates(pattern)
+        candidates = self._candidates(candidates, allowed)
+        
         results = []
         
-        for idx, doc in enumerate(self.documents):
-            content = doc['content']
+        for idx in candidates:
+            idx = int(idx)
+            content = self._content(idx)
             matches = regex.findall(content)
             
             if matches:
@@ -112,27 +280,55 @@ class SemanticSearch:
     Provides context-aware similarity matching
     """
     
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    # Filters keeping at most 1/SUBSET_SCAN_FRACTION of the chunks are
+    # answered by scoring the subset directly instead of through the index
+    SUBSET_SCAN_FRACTION = 4
+    
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 batch_size: int = 64, model=None):
         """
         Initialize semantic search
         
         Args:
             model_name: Name of sentence transformer model
+            batch_size: Number of chunks encoded per batch
+            model: Already loaded SentenceTransformer to share instead of loading one
         """
-        if SentenceTransformer is None:
-            raise ImportError("sentence-transformers not installed")
-        
-        self.model = SentenceTransformer(model_name)
+        if model is None:
+            sentence_transformers = optional_import('sentence_transformers')
+            if sentence_transformers is None:
+                raise ImportError("sentence-transformers not installed")
+            model = sentence_transformers.SentenceTransformer(model_name)
+        
+        self.model = model
+        self.batch_size = batch_size
         self.faiss_index = None
         self.documents = []
         self.embeddings = None
+        # (query, embedding) of the last query, reused when one query is
+        # both routed to partitions and searched
+        self._last_query = None
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Normalized (1, dim) float32 embedding of a query
+        """
+        last = self._last_query
+        if last is not None and last[0] == query:
+            return last[1]
+        embedding = np.asarray(self.model.encode([query]), dtype=np.float32)
+        embedding /= np.linalg.norm(embedding, axis=1, keepdims=True) + 1e-12
+        self._last_query = (query, embedding)
+        return embedding
     
-    def index(self, documents: List[Dict[str, Any]]):
+    def index(self, documents: List[Dict[str, Any]],
+              progress: Optional[Callable[[int, int], None]] = None):
         """
         Index documents for semantic search
         
         Args:
             documents: List of document chunks
+            progress: Optional callback called as progress(chunks_embedded, total_chunks)
         """
         self.documents = documents
         
@@ -141,9 +337,20 @@ class SemanticSearch:
         
         # Generate embeddings
         print(f"Generating embeddings for {len(texts)} documents...")
-        self.embeddings = self.model.encode(texts, show_progress_bar=True)
+        if progress is None:
+            self.embeddings = self.model.encode(texts, show_progress_bar=True)
+        else:
+            # Encode batch by batch so callers can observe progress
+            batches = []
+            progress(0, len(texts))
+            for start in range(0, len(texts), self.batch_size):
+                batch = texts[start:start + self.batch_size]
+                batches.append(self.model.encode(batch, show_progress_bar=False))
+                progress(start + len(batch), len(texts))
+            self.embeddings = np.vstack(batches) if batches else np.zeros((0, 0), dtype='float32')
         
         # Create FAISS index
+        faiss = optional_import('faiss')
         if faiss:
             dimension = self.embeddings.shape[1]
             self.faiss_index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
@@ -154,7 +361,8 @@ class SemanticSearch:
         
         print(f"Indexed {len(documents)} documents")
     
-    def search(self, query: str, top_k: int = 20, threshold: float = 0.0) -> List[Tuple[int, float]]:
+    def search(self, query: str, top_k: int = 20, threshold: float = 0.0,
+               allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
         """
         Search for semantically similar documents
         
@@ -162,6 +370,8 @@ class SemanticSearch:
             query: Search query
             top_k: Number of results to return
             threshold: Minimum similarity threshold
+            allowed: Optional boolean mask of the chunks that may be returned
+                (a metadata filter), applied inside the nearest-neighbour search
         
         Returns:
             List of (doc_index, similarity_score) tuples
@@ -169,25 +379,56 @@ class SemanticSearch:
         if self.faiss_index is None:
             return []
         
-        # Encode query
-        query_embedding = self.model.encode([query])
-        faiss.normalize_L2(query_embedding)
+        query_embedding = self.encode_query(query)
         
         # Search in FAISS index
-        scores, indices = self.faiss_index.search(query_embedding, top_k)
+        if allowed is None:
+            scores, indices = self.faiss_index.search(query_embedding, top_k)
+        else:
+            scores, indices = self._filtered_search(query_embedding, top_k, allowed)
         
         # Filter by threshold and return results
         results = []
         for idx, score in zip(indices[0], scores[0]):
-            if score >= threshold:
+            if idx >= 0 and score >= threshold:
                 results.append((int(idx), float(score)))
         
         return results
     
+    def _filtered_search(self, query_embedding: np.ndarray, top_k: int,
+                         allowed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest neighbours among the allowed chunks only
+        
+        Small subsets are scored directly against their embeddings; larger
+        ones go through FAISS with a bitmap ID selector so the index skips
+        the other vectors.
+        """
+        ids = np.flatnonzero(allowed)
+        if not len(ids):
+            return np.zeros((1, 0), dtype=np.float32), np.zeros((1, 0), dtype=np.int64)
+        
+        if self.embeddings is not None and len(ids) * self.SUBSET_SCAN_FRACTION <= len(allowed):
+            similarities = np.asarray(self.embeddings[ids], dtype=np.float32) @ query_embedding[0]
+            k = min(top_k, len(ids))
+            best = np.argpartition(-similarities, k - 1)[:k]
+            best = best[np.argsort(-similarities[best], kind='stable')]
+            return similarities[best][None, :], ids[best][None, :]
+        
+        faiss = optional_import('faiss')
+        
+        bitmap = np.packbits(allowed, bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+        return self.faiss_index.search(query_embedding, top_k,
+                                       params=faiss.SearchParameters(sel=selector))
+    
     def save(self, path: str):
         """
         Save index and embeddings to disk
         
+        Documents are not written here; HybridSearch stores the chunks once
+        for both search legs.
+        
         Args:
             path: Directory to save to
         """
@@ -196,34 +437,42 @@ class SemanticSearch:
         
         # Save FAISS index
         if self.faiss_index:
+            faiss = optional_import('faiss')
             faiss.write_index(self.faiss_index, str(path / "faiss.index"))
         
-        # Save embeddings and documents
-        with open(path / "embeddings.pkl", 'wb') as f:
-            pickle.dump({
-                'embeddings': self.embeddings,
-                'documents': self.documents
-            }, f)
+        # Save embeddings as a plain array so they can be memory-mapped
+        np.save(path / "embeddings.npy", np.ascontiguousarray(self.embeddings, dtype=np.float32))
     
-    def load(self, path: str):
+    def load(self, path: str, use_mmap: bool = False):
         """
         Load index and embeddings from disk
         
         Args:
             path: Directory to load from
+            use_mmap: Map the FAISS index and embeddings read-only so that
+                processes serving the same index share their pages
         """
         path = Path(path)
         
         # Load FAISS index
         index_path = path / "faiss.index"
-        if index_path.exists():
-            self.faiss_index = faiss.read_index(str(index_path))
-        
-        # Load embeddings and documents
-        with open(path / "embeddings.pkl", 'rb') as f:
-            data = pickle.load(f)
-            self.embeddings = data['embeddings']
-            self.documents = data['documents']
+        faiss = optional_import('faiss')
+        if index_path.exists() and faiss:
+            if use_mmap:
+                flags = faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0) \
+                    | getattr(faiss, 'IO_FLAG_READ_ONLY', 0)
+                self.faiss_index = faiss.read_index(str(index_path), flags)
+            else:
+                self.faiss_index = faiss.read_index(str(index_path))
+        
+        # Load embeddings (and documents, for indexes written before chunk storage)
+        if (path / "embeddings.npy").exists():
+            self.embeddings = np.load(path / "embeddings.npy", mmap_mode='r' if use_mmap else None)
+        else:
+            with open(path / "embeddings.pkl", 'rb') as f:
+                data = pickle.load(f)
+                self.embeddings = data['embeddings']
+                self.documents = data['documents']
 
 
 class HybridSearch:
@@ -232,75 +481,300 @@ class HybridSearch:
     Routes queries intelligently for optimal performance
     """
     
-    def __init__(self, config):
+    def __init__(self, config, model=None, reranker=None, router=None):
         """
         Initialize hybrid search
         
         Args:
             config: Config object
+            model: Already loaded SentenceTransformer to share (e.g. across
+                index generations) instead of loading a new one
+            reranker: Reranker to share instead of creating one
+            router: QueryRouter to share (its metrics then span engines)
         """
         self.config = config
+        self.use_mmap = config.get('index.mmap', True)
         
         # Initialize keyword search
         case_sensitive = config.get('search.keyword.case_sensitive', False)
-        self.keyword_search = KeywordSearch(case_sensitive=case_sensitive)
+        self.keyword_search = KeywordSearch(
+            case_sensitive=case_sensitive,
+            fuzzy=config.get('search.keyword.fuzzy.enabled', True),
+            max_edits=config.get('search.keyword.fuzzy.max_edits', 1),
+            max_expansions=config.get('search.keyword.fuzzy.max_expansions', 3),
+            prune_min_postings=config.get('search.keyword.prune_min_postings'))
         
         # Initialize semantic search
         if config.get('search.semantic.enabled', True):
             try:
                 model_name = config.get('search.semantic.model', 
                                        'sentence-transformers/all-MiniLM-L6-v2')
-                self.semantic_search = SemanticSearch(model_name=model_name)
+                batch_size = config.get('search.semantic.batch_size', 64)
+                self.semantic_search = SemanticSearch(model_name=model_name,
+                                                      batch_size=batch_size,
+                                                      model=model)
             except ImportError:
                 print("Warning: sentence-transformers not available, semantic search disabled")
                 self.semantic_search = None
         else:
             self.semantic_search = None
         
+        # Initialize the optional cross-encoder rerank stage
+        self.reranker = reranker
+        if self.reranker is None and config.get('search.rerank.enabled', False):
+            try:
+                self.reranker = Reranker(
+                    model_name=config.get('search.rerank.model', 'cross-encoder/ms-marco-MiniLM-L-6-v2'),
+                    max_candidates=config.get('search.rerank.max_candidates', 30),
+                    batch_size=config.get('search.rerank.batch_size', 16),
+                    time_budget_ms=config.get('search.rerank.time_budget_ms', 300),
+                    cache_size=config.get('search.rerank.cache_size', 10000))
+            except ImportError:
+                print("Warning: sentence-transformers not available, reranking disabled")
+        
+        self.router = router or QueryRouter(
+            max_keyword_terms=config.get('search.router.max_keyword_terms', 1))
+        
+        self.suggester = Suggester()
+        self.metadata_index = MetadataIndex()
+        self.chunk_docs = np.zeros(0, dtype=np.int32)
+        self.partitions: Optional[ClusterPartitions] = None
+        
         # Weights for hybrid scoring
         self.keyword_weight = config.get('search.hybrid.keyword_weight', 0.4)
         self.semantic_weight = config.get('search.hybrid.semantic_weight', 0.6)
     
-    def index(self, documents: List[Dict[str, Any]]):
+    def index(self, documents: List[Dict[str, Any]],
+              progress: Optional[Callable[[int, int], None]] = None):
         """
         Index documents for both keyword and semantic search
         
         Args:
             documents: List of document chunks
+            progress: Optional callback called as progress(chunks_embedded, total_chunks)
         """
         print(f"Indexing {len(documents)} documents...")
         
         # Index for keyword search
         self.keyword_search.index(documents)
+        self._build_suggester(documents)
+        self.metadata_index = MetadataIndex()
+        self.metadata_index.build(documents)
+        self.chunk_docs = chunk_documents(documents)
+        self.partitions = None
         
         # Index for semantic search
         if self.semantic_search:
-            self.semantic_search.index(documents)
+            self.semantic_search.index(documents, progress=progress)
+        elif progress:
+            progress(len(documents), len(documents))
         
         print("Indexing complete!")
     
-    def search(self, query: str, mode: str = 'hybrid', max_results: int = 20) -> List[Dict[str, Any]]:
+    def _build_suggester(self, documents):
+        self.suggester = Suggester()
+        self.suggester.build(documents, self.keyword_search.positional_index.term_frequencies(),
+                             max_terms=self.config.get('search.suggest.max_terms', 5000))
+    
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """
+        Typeahead completions from titles, tags and frequent terms
+        
+        Args:
+            prefix: Text typed so far
+            limit: Maximum number of suggestions
+        
+        Returns:
+            List of {'text', 'kind'} dicts
+        """
+        return self.suggester.suggest(prefix, limit)
+    
+    def search(self, query: str, mode: str = 'hybrid', max_results: int = 20,
+               filters: Optional[Dict[str, Any]] = None,
+               collapse=None, rerank: Optional[bool] = None,
+               n_probe: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Search documents using specified mode
         
         Args:
             query: Search query
-            mode: Search mode ('keyword', 'semantic', 'hybrid')
+            mode: Search mode ('keyword', 'semantic', 'hybrid', or 'auto' to
+                let the router pick one per query; see QueryRouter)
             max_results: Maximum number of results
+            filters: Optional metadata filter, e.g. {'tags': ['raft'],
+                'updated_at': {'from': '2024-01-01'}} (see MetadataIndex)
+            collapse: Return one result per document instead of per chunk:
+                'max', 'sum' or 'mean' (aggregate of chunk scores), True for
+                the configured method, False for chunks; None uses the
+                search.collapse config
+            rerank: Reorder the top candidates with the cross-encoder
+                (None: whenever a reranker is configured)
+            n_probe: Only search the chunks of the n_probe clusters closest
+                to the query (see set_partitions(); 0 searches everything,
+                None uses search.partitions.n_probe)
         
         Returns:
             List of search results with scores
         """
+        allowed = self.metadata_index.mask(filters)
+        if allowed is not None and not allowed.any():
+            return []
+        
+        start = time.perf_counter()
+        reason = None
+        if mode == 'auto':
+            mode, reason = self.route(query)
+        
+        if n_probe is None:
+            n_probe = self.config.get('search.partitions.n_probe', 0)
+        # Queries routed to keyword search alone are not worth an embedding
+        if n_probe and self.partitions is not None and self.semantic_search \
+                and not (reason is not None and mode == 'keyword'):
+            allowed = self._probe(query, n_probe, allowed)
+            if not allowed.any():
+                return []
+        
+        final_results = max_results
+        reranking = self.reranker is not None and rerank is not False
+        if reranking:
+            # Retrieve enough candidates for the reranker to choose from
+            max_results = max(max_results, self.reranker.max_candidates)
+        
+        method = self._collapse_method(collapse)
+        limit = max_results
+        if method is not None:
+            # Over-fetch chunks so enough distinct documents remain
+            limit = max_results * self.config.get('search.collapse.overfetch', 4)
+        
         if mode == 'keyword':
-            return self._keyword_search(query, max_results)
+            results = self._keyword_search(query, limit, allowed)
         elif mode == 'semantic':
-            return self._semantic_search(query, max_results)
+            results = self._semantic_search(query, limit, allowed)
         else:  # hybrid
-            return self._hybrid_search(query, max_results)
+            results = self._hybrid_search(query, limit, allowed)
+        
+        if method is not None:
+            results = self._collapse(results, method, max_results)
+        if reranking:
+            results = self.reranker.rerank(query, results)
+        if reason is not None:
+            self.router.record(mode, reason, 1000 * (time.perf_counter() - start))
+        return results[:final_results]
+    
+    def set_partitions(self, centroids: Optional[np.ndarray]):
+        """
+        Partition the chunks around cluster centroids for n_probe searches
+        
+        Args:
+            centroids: (clusters, dim) centroids from AutoClusterer (None
+                drops the partitions)
+        
+        Raises:
+            ValueError: If the centroids do not match the chunk embeddings
+        """
+        if centroids is None or self.semantic_search is None or self.semantic_search.embeddings is None:
+            self.partitions = None
+            return
+        partitions = ClusterPartitions(centroids)
+        partitions.assign(self.semantic_search.embeddings)
+        self.partitions = partitions
     
-    def _keyword_search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+    def _probe(self, query: str, n_probe: int, allowed: Optional[np.ndarray]) -> np.ndarray:
+        """Filter mask narrowed to the chunks of the closest partitions"""
+        probed = self.partitions.mask(self.semantic_search.encode_query(query), n_probe)
+        return probed if allowed is None else probed & allowed
+    
+    def route(self, query: str) -> Tuple[str, str]:
+        """
+        Search mode 'auto' picks for a query
+        
+        Returns:
+            (mode, reason), see QueryRouter.route()
+        """
+        positional = self.keyword_search.positional_index
+        doc_frequency = positional.doc_frequency if positional is not None else (lambda term: 0)
+        return self.router.route(query, doc_frequency, tags=self.metadata_index.fields.get('tags', {}),
+                                 semantic=self.semantic_search is not None)
+    
+    def highlight(self, query: str, results: List[Dict[str, Any]],
+                  length: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Add a query-aware 'snippet' and its 'highlights' to each result
+        
+        The snippet is the window of the chunk with the most keyword
+        matches; with search.snippets.semantic_sentences, the first few
+        semantic hits without any are centred on the sentence most similar
+        to the query, which is highlighted.
+        
+        Args:
+            query: The query the results came from
+            results: Results of search()
+            length: Snippet length in characters (default search.snippets.length)
+        
+        Returns:
+            The same result dicts, with 'snippet' and 'highlights' ([start, end]
+            offsets into the snippet) set
+        """
+        length = length or self.config.get('search.snippets.length', 300)
+        pattern = self.keyword_search.match_pattern(query)
+        
+        texts = [result['document'].get('content', '') or '' for result in results]
+        spans = [match_spans(text, pattern) for text in texts]
+        
+        # Semantic hits without keyword matches among the top few: find their
+        # closest sentence (one sentence-embedding batch per search, so off
+        # by default and never for keyword results)
+        focus = [None] * len(results)
+        top = self.config.get('search.snippets.semantic_sentences_top', 3)
+        unmatched = [i for i, found in enumerate(spans[:top])
+                     if not len(found) and results[i].get('search_type') != 'keyword']
+        if unmatched and self.semantic_search and self.config.get('search.snippets.semantic_sentences', False):
+            closest = closest_sentences(self.semantic_search.model, query, [texts[i] for i in unmatched])
+            for i, span in zip(unmatched, closest):
+                focus[i] = span
+        
+        for result, text, found, centre in zip(results, texts, spans, focus):
+            snippet, highlights = make_snippet(text, found, length, focus=centre)
+            result['snippet'] = snippet
+            result['highlights'] = [list(span) for span in highlights]
+        return results
+    
+    def _collapse_method(self, collapse) -> Optional[str]:
+        if collapse is None:
+            collapse = self.config.get('search.collapse.enabled', False)
+        if collapse is True:
+            collapse = self.config.get('search.collapse.method', 'max')
+        if not collapse:
+            return None
+        if collapse not in METHODS:
+            raise ValueError(f"Unknown collapse method: {collapse!r} (expected one of {', '.join(METHODS)})")
+        return collapse
+    
+    def _collapse(self, results: List[Dict[str, Any]], method: str,
+                  max_results: int) -> List[Dict[str, Any]]:
+        """Group chunk results by document, keeping each document's best chunk"""
+        if len(self.chunk_docs) != len(self.keyword_search.documents):
+            self.chunk_docs = chunk_documents(self.keyword_search.documents)
+        
+        by_chunk = {result['doc_index']: result for result in results}
+        best, scores, counts, members = collapse_chunks(
+            np.fromiter(by_chunk, dtype=np.int64, count=len(by_chunk)),
+            np.fromiter((r['score'] for r in by_chunk.values()), dtype=np.float64, count=len(by_chunk)),
+            self.chunk_docs, method, self.config.get('search.collapse.top_n', 3))
+        
+        collapsed = []
+        for i in range(min(max_results, len(best))):
+            result = dict(by_chunk[int(best[i])])
+            result['score'] = float(scores[i])
+            result['matched_chunks'] = int(counts[i])
+            result['chunk_indices'] = members[i].tolist()
+            collapsed.append(result)
+        return collapsed
+    
+    def _keyword_search(self, query: str, max_results: int,
+                        allowed: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
         """Perform keyword-only search"""
-        results = self.keyword_search.search(query, max_results)
+        results = self.keyword_search.search(query, max_results, allowed=allowed)
         
         return [
             {
@@ -312,13 +786,14 @@ class HybridSearch:
             for idx, score in results
         ]
     
-    def _semantic_search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+    def _semantic_search(self, query: str, max_results: int,
+                         allowed: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
         """Perform semantic-only search"""
         if not self.semantic_search:
             return []
         
         threshold = self.config.get('search.semantic.similarity_threshold', 0.6)
-        results = self.semantic_search.search(query, max_results, threshold)
+        results = self.semantic_search.search(query, max_results, threshold, allowed=allowed)
         
         return [
             {
@@ -330,34 +805,29 @@ class HybridSearch:
             for idx, score in results
         ]
     
-    def _hybrid_search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+    def _hybrid_search(self, query: str, max_results: int,
+                       allowed: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
         """Perform hybrid search combining both methods"""
         # Get results from both searches
-        keyword_results = self.keyword_search.search(query, max_results * 2)
+        keyword_results = self.keyword_search.search(query, max_results * 2, allowed=allowed)
         
         if self.semantic_search:
-            semantic_results = self.semantic_search.search(query, max_results * 2)
+            semantic_results = self.semantic_search.search(query, max_results * 2, allowed=allowed)
         else:
             semantic_results = []
         
-        # Combine scores
-        combined_scores = {}
-        
-        # Add keyword scores
-        for idx, score in keyword_results:
-            combined_scores[idx] = self.keyword_weight * score
-        
-        # Add semantic scores
-        for idx, score in semantic_results:
-            if idx in combined_scores:
-                combined_scores[idx] += self.semantic_weight * score
-            else:
-                combined_scores[idx] = self.semantic_weight * score
+        # Combine scores: weighted sum per chunk over both result lists
+        ids = np.asarray([idx for idx, _ in keyword_results] + [idx for idx, _ in semantic_results],
+                         dtype=np.int64)
+        weighted = np.asarray([self.keyword_weight * score for _, score in keyword_results] +
+                              [self.semantic_weight * score for _, score in semantic_results],
+                              dtype=np.float64)
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=weighted, minlength=len(unique_ids))
         
         # Sort by combined score
-        sorted_results = sorted(combined_scores.items(), 
-                              key=lambda x: x[1], 
-                              reverse=True)[:max_results]
+        order = np.lexsort((unique_ids, -totals))[:max_results]
+        sorted_results = [(int(unique_ids[i]), float(totals[i])) for i in order]
         
         # Format results
         return [
@@ -375,9 +845,12 @@ class HybridSearch:
         path = Path(path)
         path.mkdir(parents=True, exist_ok=True)
         
-        # Save keyword documents
-        with open(path / "keyword_docs.pkl", 'wb') as f:
-            pickle.dump(self.keyword_search.documents, f)
+        # Save chunks once, in a memory-mappable layout shared by both legs
+        save_chunks(self.keyword_search.documents, path)
+        self.keyword_search.save(path)
+        self.suggester.save(path)
+        self.metadata_index.save(path)
+        np.save(path / CHUNK_DOCS_FILE, self.chunk_docs)
         
         # Save semantic index
         if self.semantic_search:
@@ -387,11 +860,34 @@ class HybridSearch:
         """Load search indices"""
         path = Path(path)
         
-        # Load keyword documents
-        with open(path / "keyword_docs.pkl", 'rb') as f:
-            docs = pickle.load(f)
-            self.keyword_search.index(docs)
+        # Load chunks (pickled in indexes written before chunk storage)
+        if has_chunks(path):
+            docs = load_chunks(path, use_mmap=self.use_mmap)
+        else:
+            with open(path / "keyword_docs.pkl", 'rb') as f:
+                docs = pickle.load(f)
+        self.keyword_search.index(docs, index_path=path)
+        if Suggester.exists(path):
+            self.suggester.load(path)
+        else:
+            self._build_suggester(docs)
+        self.metadata_index = MetadataIndex()
+        if MetadataIndex.exists(path):
+            self.metadata_index.load(path)
+        else:
+            self.metadata_index.build(docs)
+        if (path / CHUNK_DOCS_FILE).exists():
+            self.chunk_docs = np.load(path / CHUNK_DOCS_FILE)
+        else:
+            self.chunk_docs = chunk_documents(docs)
         
         # Load semantic index
         if self.semantic_search and (path / "semantic").exists():
-            self.semantic_search.load(path / "semantic")
+            self.semantic_search.load(path / "semantic", use_mmap=self.use_mmap)
+            self.semantic_search.documents = docs
+    
+    def close(self):
+        """Release memory-mapped index files"""
+        close = getattr(self.keyword_search.documents, 'close', None)
+        if callable(close):
+            close()
@@ -0,0 +1,113 @@
+"""
+Pre-fork WSGI server for QuickHelp
+The parent process loads the model and index once, then forks worker
+processes that accept on a shared socket; read-only pages (model weights,
+memory-mapped index files) stay shared between workers via copy-on-write
+"""
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+
+def _limit_torch_threads(threads: int):
+    """Avoid every worker spawning one BLAS/torch thread per core"""
+    torch = sys.modules.get('torch')
+    if torch is not None and threads:
+        torch.set_num_threads(threads)
+
+
+def _run_worker(app, host: str, port: int, sock: socket.socket,
+                threaded: bool, torch_threads: int):
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _limit_torch_threads(torch_threads)
+
+    server = make_server(host, port, app, threaded=threaded, fd=sock.fileno())
+    server.serve_forever()
+
+
+def serve_prefork(app, host: str = '127.0.0.1', port: int = 5000, workers: int = 2,
+                  threaded: bool = False, torch_threads: int = 1,
+                  before_fork: Optional[Callable[[], None]] = None):
+    """
+    Serve a WSGI app from several forked worker processes
+
+    Args:
+        app: WSGI application (already holding its loaded model and index)
+        host: Interface to bind
+        port: Port to bind
+        workers: Number of worker processes
+        threaded: Whether each worker also handles requests on threads
+        torch_threads: Intra-op threads per worker for torch, if loaded
+        before_fork: Optional hook run in the parent right before forking
+    """
+    if not hasattr(os, 'fork'):
+        print("Warning: os.fork is not available on this platform; serving from one process")
+        app.run(host=host, port=port, threaded=True)
+        return
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    if before_fork:
+        before_fork()
+
+    # Move everything allocated so far out of the GC's reach so collections in
+    # the workers do not touch (and thereby copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    children: Dict[int, int] = {}
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, host, port, sock, threaded, torch_threads)
+            finally:
+                os._exit(0)
+        children[pid] = slot
+
+    for slot in range(workers):
+        spawn(slot)
+
+    print(f"✓ Serving on http://{host}:{port} with {workers} worker processes")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Supervise: restart workers that die unexpectedly
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"Worker {pid} exited; restarting")
+            time.sleep(0.5)
+            spawn(slot)
+
+    sock.close()
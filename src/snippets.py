@@ -0,0 +1,140 @@
+"""
+Query-aware snippets for search results
+A snippet is the window of a chunk holding the most query matches (or,
+for semantic hits without any, the sentence closest to the query), with
+the match offsets inside it for highlighting
+"""
+import re
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+SENTENCE_PATTERN = re.compile(r'[^.!?\n]+(?:[.!?]+|\n|$)')
+ELLIPSIS = '...'
+
+Span = Tuple[int, int]
+
+
+def match_spans(text: str, pattern: Optional[re.Pattern]) -> np.ndarray:
+    """(start, end) character offsets of every match, as an (n, 2) array"""
+    if pattern is None:
+        return np.zeros((0, 2), dtype=np.int64)
+    spans = [m.span() for m in pattern.finditer(text) if m.end() > m.start()]
+    return np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+
+
+def sentences(text: str, limit: int = 50) -> List[Span]:
+    """Character spans of the first limit sentences (or lines) of a text"""
+    spans = []
+    for match in SENTENCE_PATTERN.finditer(text):
+        start, end = match.span()
+        # Trim surrounding whitespace
+        start += len(match.group()) - len(match.group().lstrip())
+        end -= len(match.group()) - len(match.group().rstrip())
+        if end > start:
+            spans.append((start, end))
+            if len(spans) >= limit:
+                break
+    return spans
+
+
+def best_window(spans: np.ndarray, text_length: int, length: int) -> Span:
+    """
+    The length-character window holding the most matches
+
+    Every match start is tried as the window start (a searchsorted over the
+    sorted starts counts the matches that fit); the winning window is then
+    centred on the matches it holds.
+    """
+    if text_length <= length:
+        return 0, text_length
+    if not len(spans):
+        return 0, length
+
+    starts, ends = spans[:, 0], spans[:, 1]
+    last = np.searchsorted(ends, starts + length, side='right')
+    counts = last - np.arange(len(starts))
+    first = int(np.argmax(counts))
+    covered_start, covered_end = int(starts[first]), int(ends[max(first, int(last[first]) - 1)])
+
+    slack = max(0, length - (covered_end - covered_start))
+    start = max(0, min(covered_start - slack // 2, text_length - length))
+    return start, start + length
+
+
+def _snap(text: str, start: int, end: int) -> Span:
+    """Move window edges off the middle of words"""
+    if start > 0 and not text[start - 1].isspace():
+        space = text.find(' ', start, min(end, start + 20))
+        if space != -1:
+            start = space + 1
+    if end < len(text) and not text[end].isspace():
+        space = text.rfind(' ', max(start, end - 20), end)
+        if space != -1:
+            end = space
+    return start, end
+
+
+def make_snippet(text: str, spans: np.ndarray, length: int = 300,
+                 focus: Optional[Span] = None) -> Tuple[str, List[Span]]:
+    """
+    Cut a snippet and translate highlight offsets into it
+
+    Args:
+        text: Chunk text
+        spans: Match spans in text, sorted by start
+        length: Snippet length in characters (before ellipses)
+        focus: Span to centre the window on when there are no matches
+            (e.g. the sentence most similar to the query)
+
+    Returns:
+        (snippet, highlight spans relative to the snippet)
+    """
+    if len(spans):
+        start, end = best_window(spans, len(text), length)
+    elif focus is not None:
+        slack = max(0, length - (focus[1] - focus[0]))
+        start = max(0, min(focus[0] - slack // 2, len(text) - length))
+        end = min(len(text), start + length)
+        spans = np.asarray([focus], dtype=np.int64)
+    else:
+        start, end = 0, min(len(text), length)
+    start, end = _snap(text, start, end)
+
+    prefix = ELLIPSIS if start > 0 else ''
+    suffix = ELLIPSIS if end < len(text) else ''
+    snippet = prefix + text[start:end] + suffix
+
+    highlights = []
+    for span_start, span_end in spans.tolist():
+        span_start, span_end = max(span_start, start), min(span_end, end)
+        if span_end > span_start:
+            highlights.append((span_start - start + len(prefix), span_end - start + len(prefix)))
+    return snippet, highlights
+
+
+def closest_sentences(model, query: str, texts: Sequence[str],
+                      max_sentences: int = 50) -> List[Optional[Span]]:
+    """
+    For each text, the span of its sentence most similar to the query
+
+    All sentences of all texts are encoded in a single batch.
+    """
+    per_text = [sentences(text, max_sentences) for text in texts]
+    flat = [text[a:b] for text, spans in zip(texts, per_text) for a, b in spans]
+    if not flat:
+        return [None] * len(texts)
+
+    embeddings = np.asarray(model.encode([query] + flat, show_progress_bar=False), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+    similarities = embeddings[1:] @ embeddings[0]
+
+    result, offset = [], 0
+    for spans in per_text:
+        if spans:
+            result.append(spans[int(np.argmax(similarities[offset:offset + len(spans)]))])
+        else:
+            result.append(None)
+        offset += len(spans)
+    return result
@@ -0,0 +1,142 @@
+"""
+Memory-mappable chunk storage for QuickHelp
+Chunk text and metadata are written as flat files plus offset arrays so that
+several server processes can map the same pages instead of each unpickling
+its own copy
+"""
+import json
+import mmap
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Sequence, Union
+
+import numpy as np
+
+
+TEXT_FILE = "chunk_text.bin"
+TEXT_OFFSETS_FILE = "chunk_text.offsets.npy"
+META_FILE = "chunk_meta.jsonl"
+META_OFFSETS_FILE = "chunk_meta.offsets.npy"
+
+
+def _json_default(value):
+    """Serialize frontmatter dates the same way DocumentIndexer does"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def save_chunks(documents: Sequence[Dict[str, Any]], path: Union[str, Path]):
+    """
+    Write chunks as a UTF-8 text blob plus a JSON-lines metadata file
+
+    Args:
+        documents: List of document chunks (each with a 'content' key)
+        path: Directory to write to
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    text_offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    meta_offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+
+    with open(path / TEXT_FILE, 'wb') as text_f, open(path / META_FILE, 'wb') as meta_f:
+        for i, doc in enumerate(documents):
+            text = (doc.get('content', '') or '').encode('utf-8')
+            text_f.write(text)
+            text_offsets[i + 1] = text_offsets[i] + len(text)
+
+            meta = {k: v for k, v in doc.items() if k != 'content'}
+            line = json.dumps(meta, ensure_ascii=False, default=_json_default).encode('utf-8') + b'\n'
+            meta_f.write(line)
+            meta_offsets[i + 1] = meta_offsets[i] + len(line)
+
+    np.save(path / TEXT_OFFSETS_FILE, text_offsets)
+    np.save(path / META_OFFSETS_FILE, meta_offsets)
+
+
+def has_chunks(path: Union[str, Path]) -> bool:
+    """Whether a chunk store exists in the directory"""
+    return (Path(path) / TEXT_FILE).exists() and (Path(path) / META_FILE).exists()
+
+
+def load_chunks(path: Union[str, Path], use_mmap: bool = True) -> Sequence[Dict[str, Any]]:
+    """
+    Load chunks written by save_chunks()
+
+    Args:
+        path: Directory to load from
+        use_mmap: Map the files read-only instead of decoding everything up front
+
+    Returns:
+        A MappedChunks sequence, or a plain list of chunk dicts
+    """
+    chunks = MappedChunks(path)
+    if use_mmap:
+        return chunks
+    try:
+        return list(chunks)
+    finally:
+        chunks.close()
+
+
+def _map_file(file_path: Path):
+    """Map a file read-only; empty files cannot be mapped and give b''"""
+    if file_path.stat().st_size == 0:
+        return b''
+    with open(file_path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MappedChunks(Sequence):
+    """
+    Read-only sequence of chunk dicts backed by memory-mapped files
+
+    Pages are shared between every process that maps the same index version,
+    and chunks are decoded only when accessed.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open a chunk store
+
+        Args:
+            path: Directory written by save_chunks()
+        """
+        path = Path(path)
+        self.path = path
+        self._text = _map_file(path / TEXT_FILE)
+        self._meta = _map_file(path / META_FILE)
+        self._text_offsets = np.load(path / TEXT_OFFSETS_FILE, mmap_mode='r')
+        self._meta_offsets = np.load(path / META_OFFSETS_FILE, mmap_mode='r')
+
+    def __len__(self) -> int:
+        return len(self._text_offsets) - 1
+
+    def text(self, idx: int) -> str:
+        """Decode only the text of a chunk"""
+        start, end = int(self._text_offsets[idx]), int(self._text_offsets[idx + 1])
+        return self._text[start:end].decode('utf-8')
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+
+        start, end = int(self._meta_offsets[idx]), int(self._meta_offsets[idx + 1])
+        doc = json.loads(self._meta[start:end].decode('utf-8'))
+        doc['content'] = self.text(idx)
+        return doc
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self):
+        """Unmap the files"""
+        for mapped in (self._text, self._meta):
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
@@ -0,0 +1,135 @@
+"""
+Prefix suggestions for search-box typeahead
+Titles, tags and frequent index terms are kept in one sorted array of
+lowercased keys; a prefix maps to a contiguous range found by binary search
+and the best-weighted entries of that range are returned
+"""
+import bisect
+import math
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+
+SUGGEST_FILE = "suggest.pkl"
+
+# Kinds, in the order they win ties
+KINDS = ('title', 'tag', 'term')
+KIND_BOOST = {'title': 2.0, 'tag': 1.5, 'term': 1.0}
+
+
+class Suggester:
+    """
+    Sorted-array prefix index
+
+    Each suggestion is stored under its full lowercased text and, for
+    multi-word titles, under the text from every later word on, so "clock"
+    completes "Lamport Clock".
+    """
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.entry_ids = np.zeros(0, dtype=np.int32)
+        self.entries: List[Tuple[str, str]] = []  # (text, kind)
+        self.weights = np.zeros(0, dtype=np.float32)
+
+    def build(self, documents: Iterable[Dict[str, Any]],
+              terms: Iterable[Tuple[str, int]] = (), max_terms: int = 5000):
+        """
+        Build the index
+
+        Args:
+            documents: Chunks (title and tags are read from their metadata
+                and counted once per document path)
+            terms: (term, document frequency) pairs from the keyword index
+            max_terms: Number of most frequent terms to include
+        """
+        counts: Dict[Tuple[str, str], int] = {}
+        seen = set()
+        for doc in documents:
+            metadata = doc.get('metadata', {}) or {}
+            # Chunks of one document share its title and tags
+            source = metadata.get('path') or doc.get('doc_id')
+            if source is not None:
+                if source in seen:
+                    continue
+                seen.add(source)
+            title = metadata.get('title')
+            if isinstance(title, str) and title.strip():
+                key = (title.strip(), 'title')
+                counts[key] = counts.get(key, 0) + 1
+            for tag in metadata.get('tags', []) or []:
+                if isinstance(tag, str) and tag:
+                    key = (tag, 'tag')
+                    counts[key] = counts.get(key, 0) + 1
+
+        frequent = sorted(((t, df) for t, df in terms if len(t) > 2 and not t.isdigit()),
+                          key=lambda x: x[1], reverse=True)[:max_terms]
+        known = {text.lower() for text, _ in counts}
+        for term, df in frequent:
+            if term not in known:
+                counts[(term, 'term')] = df
+
+        entries = list(counts)
+        weights = np.asarray([KIND_BOOST[kind] * math.log1p(counts[(text, kind)])
+                              for text, kind in entries], dtype=np.float32)
+
+        keyed = []
+        for entry_id, (text, kind) in enumerate(entries):
+            words = text.lower().split()
+            for start in range(len(words) if kind == 'title' else 1):
+                keyed.append((' '.join(words[start:]), entry_id))
+        keyed.sort()
+
+        self.entries = entries
+        self.weights = weights
+        self.keys = [key for key, _ in keyed]
+        self.entry_ids = np.asarray([entry_id for _, entry_id in keyed], dtype=np.int32)
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """
+        Completions of a prefix
+
+        Args:
+            prefix: Text typed so far
+            limit: Maximum number of suggestions
+
+        Returns:
+            [{'text', 'kind'}] best first
+        """
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix or not self.keys:
+            return []
+
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + '\uffff', lo)
+        if lo == hi:
+            return []
+
+        ids = np.unique(self.entry_ids[lo:hi])
+        if len(ids) > limit:
+            ids = ids[np.argpartition(-self.weights[ids], limit - 1)[:limit]]
+        ranked = sorted(ids.tolist(), key=lambda i: (-self.weights[i],
+                                                     KINDS.index(self.entries[i][1]),
+                                                     self.entries[i][0]))
+        return [{'text': self.entries[i][0], 'kind': self.entries[i][1]} for i in ranked]
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        return (Path(path) / SUGGEST_FILE).exists()
+
+    def save(self, path: Union[str, Path]):
+        with open(Path(path) / SUGGEST_FILE, 'wb') as f:
+            pickle.dump({'keys': self.keys, 'entry_ids': self.entry_ids,
+                         'entries': self.entries, 'weights': self.weights}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: Union[str, Path]):
+        with open(Path(path) / SUGGEST_FILE, 'rb') as f:
+            data = pickle.load(f)
+        self.keys = data['keys']
+        self.entry_ids = data['entry_ids']
+        self.entries = data['entries']
+        self.weights = data['weights']
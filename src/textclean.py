@@ -0,0 +1,111 @@
+"""
+Markdown text normalization shared by the indexer, the clusterer and
+near-duplicate detection
+Patterns are compiled once and each cleaning is a single regex pass;
+results are kept per content hash, so a document version is cleaned once
+however many consumers ask for it
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+
+TITLE_PATTERN = re.compile(r'^#\s+(.+)$', re.MULTILINE)
+TAG_PATTERN = re.compile(r'#(\w+)')
+WORD_PATTERN = re.compile(r'\w+')
+
+FRONTMATTER_PATTERN = re.compile(r'^---.*?---\s*', re.S)
+# Markdown syntax, one alternative per construct; the replacement depends
+# on which group matched. The lookahead skips positions no construct can
+# start at without trying each alternative
+MARKDOWN_PATTERN = re.compile(r'''(?=[`\[\#*+\ \t-])(?:
+    (?P<fence>```.*?```)                      # fenced code
+  | (?P<code>`[^`]+`)                         # inline code
+  | \[(?P<link>[^\]]+)\]\([^)]+\)             # [text](url)
+  | \[\[(?P<wiki>[^\]]+)\]\]                  # [[wiki link]]
+  | (?P<prefix>^[ \t]*(?:\#{1,6}|[-*+])[ \t]*)   # heading marks and bullets
+)''', re.S | re.M | re.X)
+TIMESTAMP_PATTERN = re.compile(r'''\b(?:
+    20\d{2}[-/]\d{1,2}[-/]\d{1,2}(?:[T\s]\d{1,2}:\d{2}(?::\d{2})?)?   # dates, ISO timestamps
+  | \d{1,2}:\d{2}(?::\d{2})?                                          # times
+  | \d{10,13}                                                         # unix timestamps
+)\b''', re.X)
+# Whitespace runs other than a lone space (those need no replacing)
+WHITESPACE_PATTERN = re.compile(r'\s{2,}|[^\S ]')
+
+# Cleaned texts kept (per kind of cleaning)
+CACHE_SIZE = 4096
+
+_cache: "OrderedDict[tuple, str]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _markdown_replacement(match: re.Match) -> str:
+    if match.group('link') is not None:
+        return match.group('link')
+    if match.group('wiki') is not None:
+        return match.group('wiki')
+    return '' if match.group('prefix') is not None else ' '
+
+
+def _memoized(kind: str, text: str, clean: Callable[[str], str]) -> str:
+    key = (kind, hashlib.md5(text.encode('utf-8')).digest())
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    result = clean(text)
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def _clean_markdown(text: str) -> str:
+    text = FRONTMATTER_PATTERN.sub('', text, count=1)
+    text = MARKDOWN_PATTERN.sub(_markdown_replacement, text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def _canonical(text: str) -> str:
+    text = TIMESTAMP_PATTERN.sub(' ', clean_markdown(text))
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+
+def clean_markdown(text: str) -> str:
+    """Text without frontmatter, code, link targets and heading/bullet marks, on one line"""
+    return _memoized('markdown', text, _clean_markdown) if text else ""
+
+
+def canonical(text: str) -> str:
+    """
+    clean_markdown() without timestamp-like tokens (dates, times, unix
+    times), so re-indexed copies with new timestamps compare equal
+    """
+    return _memoized('canonical', text, _canonical) if text else ""
+
+
+def strip_timestamps(text: str) -> str:
+    """Remove timestamp-like tokens from already cleaned text"""
+    if not text:
+        return ""
+    return WHITESPACE_PATTERN.sub(' ', TIMESTAMP_PATTERN.sub(' ', text)).strip()
+
+
+def extract_title(content: str) -> str:
+    """Text of the first H1 heading, or '' without one"""
+    match = TITLE_PATTERN.search(content)
+    return match.group(1).strip() if match else ""
+
+
+def extract_tags(content: str) -> List[str]:
+    """Distinct #hashtags"""
+    return list(set(TAG_PATTERN.findall(content)))
+
+
+def words(text: str) -> List[str]:
+    """Lowercased \\w+ tokens"""
+    return WORD_PATTERN.findall(text.lower()) if text else []
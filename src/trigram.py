@@ -0,0 +1,238 @@
+"""
+Trigram index for regex search
+Extracts the literal substrings a regex requires, turns them into an AND/OR
+query over trigrams and narrows the chunks a regex has to be run against
+(the approach of Google Code Search and zoekt)
+"""
+import itertools
+import pickle
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+
+# Query nodes: ('all',) matches everything, ('and', [...]), ('or', [...]),
+# ('tri', 'abc') requires a single trigram
+ALL = ('all',)
+
+# Bounds on the sets of exact strings tracked while analyzing a regex
+MAX_EXACT_STRINGS = 16
+MAX_CLASS_SIZE = 4
+
+
+def trigrams(text: str) -> List[str]:
+    """All distinct trigrams of a string"""
+    return list({text[i:i + 3] for i in range(len(text) - 2)})
+
+
+def _and(nodes: List[tuple]) -> tuple:
+    nodes = [n for n in nodes if n != ALL]
+    flat = []
+    for node in nodes:
+        flat.extend(node[1] if node[0] == 'and' else [node])
+    if not flat:
+        return ALL
+    return flat[0] if len(flat) == 1 else ('and', flat)
+
+
+def _or(nodes: List[tuple]) -> tuple:
+    if not nodes or any(n == ALL for n in nodes):
+        return ALL
+    flat = []
+    for node in nodes:
+        flat.extend(node[1] if node[0] == 'or' else [node])
+    return flat[0] if len(flat) == 1 else ('or', flat)
+
+
+def literal_query(strings: Iterable[str]) -> tuple:
+    """OR over strings of the AND of each string's trigrams"""
+    alternatives = []
+    for s in strings:
+        if len(s) < 3:
+            return ALL
+        alternatives.append(_and([('tri', t) for t in trigrams(s)]))
+    return _or(alternatives)
+
+
+def _analyze(items) -> Tuple[Optional[List[str]], tuple]:
+    """
+    Analyze a parsed regex sequence
+
+    Returns:
+        (exact, query): exact is the finite set of strings the sequence matches
+        (or None if unknown/too large); query must hold for any match
+    """
+    query = ALL
+    exact: Optional[List[str]] = ['']
+
+    for op, arg in items:
+        item_exact, item_query = _analyze_item(op, arg)
+
+        if item_exact is not None and exact is not None:
+            product = [a + b for a, b in itertools.product(exact, item_exact)]
+            if len(product) <= MAX_EXACT_STRINGS:
+                exact = product
+                continue
+            # Too many combinations: keep what is known so far and restart
+            query = _and([query, literal_query(exact)])
+            exact = item_exact
+            continue
+
+        if exact is not None:
+            query = _and([query, literal_query(exact)])
+        query = _and([query, item_query])
+        exact = item_exact
+
+    return exact, query
+
+
+def _analyze_item(op, arg) -> Tuple[Optional[List[str]], tuple]:
+    c = sre_constants
+
+    if op == c.LITERAL:
+        return [chr(arg).lower()], ALL
+
+    if op == c.AT:
+        return [''], ALL
+
+    if op == c.IN:
+        chars = set()
+        for item_op, item_arg in arg:
+            if item_op != c.LITERAL:
+                return None, ALL
+            chars.add(chr(item_arg).lower())
+        if len(chars) <= MAX_CLASS_SIZE:
+            return sorted(chars), ALL
+        return None, ALL
+
+    if op == c.SUBPATTERN:
+        exact, query = _analyze(arg[-1])
+        return exact, query
+
+    if op == c.BRANCH:
+        results = [_analyze(alt) for alt in arg[1]]
+        if all(exact is not None for exact, _ in results):
+            strings = sorted({s for exact, _ in results for s in exact})
+            if len(strings) <= MAX_EXACT_STRINGS:
+                return strings, _or([q for _, q in results])
+        return None, _or([_and([q, literal_query(e) if e is not None else ALL])
+                          for e, q in results])
+
+    if op in (c.MAX_REPEAT, c.MIN_REPEAT, getattr(c, 'POSSESSIVE_REPEAT', None)):
+        min_count, max_count, sub = arg
+        if min_count == 0:
+            return None, ALL
+        exact, query = _analyze(sub)
+        if min_count == 1 and max_count == 1:
+            return exact, query
+        if exact is not None:
+            query = _and([query, literal_query(exact)])
+        return None, query
+
+    # ANY, NOT_LITERAL, CATEGORY, GROUPREF, lookarounds, ...
+    return None, ALL
+
+
+def regex_query(pattern: str) -> tuple:
+    """
+    Build the trigram query a regex implies
+
+    Args:
+        pattern: Regular expression
+
+    Returns:
+        Query tree; ALL when no literal of three or more characters is required
+    """
+    parsed = sre_parse.parse(pattern)
+    exact, query = _analyze(list(parsed))
+    if exact is not None:
+        query = _and([query, literal_query(exact)])
+    return query
+
+
+class TrigramIndex:
+    """
+    Maps each trigram of the (lowercased) chunk text to the sorted ids of the
+    chunks containing it
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, np.ndarray] = {}
+        self.num_docs = 0
+
+    def build(self, texts: Iterable[str]):
+        """
+        Build the index
+
+        Args:
+            texts: Chunk texts in chunk-id order
+        """
+        lists: Dict[str, List[int]] = {}
+        num_docs = 0
+        for doc_id, text in enumerate(texts):
+            for tri in trigrams(text.lower()):
+                lists.setdefault(tri, []).append(doc_id)
+            num_docs += 1
+
+        self.num_docs = num_docs
+        self.postings = {tri: np.asarray(ids, dtype=np.int32) for tri, ids in lists.items()}
+
+    def evaluate(self, query: tuple) -> Optional[np.ndarray]:
+        """
+        Evaluate a query tree
+
+        Returns:
+            Sorted candidate chunk ids, or None when every chunk is a candidate
+        """
+        kind = query[0]
+        if kind == 'all':
+            return None
+        if kind == 'tri':
+            return self.postings.get(query[1], np.empty(0, dtype=np.int32))
+
+        results = [self.evaluate(child) for child in query[1]]
+        if kind == 'and':
+            known = [r for r in results if r is not None]
+            if not known:
+                return None
+            known.sort(key=len)  # intersect smallest lists first
+            result = known[0]
+            for other in known[1:]:
+                if not len(result):
+                    break
+                result = np.intersect1d(result, other, assume_unique=True)
+            return result
+
+        # 'or'
+        if any(r is None for r in results):
+            return None
+        return np.unique(np.concatenate(results)) if results else np.empty(0, dtype=np.int32)
+
+    def candidates(self, pattern: str) -> Optional[np.ndarray]:
+        """
+        Chunks that can possibly match a regex
+
+        Returns:
+            Sorted chunk ids, or None if the regex has no usable literals
+        """
+        return self.evaluate(regex_query(pattern))
+
+    def save(self, path: str):
+        """Save postings to a single file"""
+        with open(path, 'wb') as f:
+            pickle.dump({'num_docs': self.num_docs, 'postings': self.postings}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: str):
+        """Load postings written by save()"""
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        self.num_docs = data['num_docs']
+        self.postings = data['postings']
@@ -49,6 +49,44 @@ document.getElementById('searchQuery')?.addEventListener('keypress', (e) => {
     if (e.key === 'Enter') performSearch();
 });
 
+// Typeahead: completions come from /api/suggest, not the search engine
+let suggestTimer = null;
+let suggestRequest = 0;
+
+document.getElementById('searchQuery')?.addEventListener('input', (e) => {
+    clearTimeout(suggestTimer);
+    const prefix = e.target.value.trim();
+    suggestTimer = setTimeout(() => loadSuggestions(prefix), 80);
+});
+
+async function loadSuggestions(prefix) {
+    const list = document.getElementById('searchSuggestions');
+    if (!list) return;
+    
+    const request = ++suggestRequest;
+    if (prefix.length < 2) {
+        list.replaceChildren();
+        return;
+    }
+    
+    try {
+        const response = await fetch(`/api/suggest?q=${encodeURIComponent(prefix)}&limit=8`);
+        const data = await response.json();
+        
+        // Ignore answers to prefixes the user has already typed past
+        if (request !== suggestRequest || !data.success) return;
+        
+        list.replaceChildren(...data.suggestions.map(s => {
+            const option = document.createElement('option');
+            option.value = s.text;
+            option.label = s.kind;
+            return option;
+        }));
+    } catch (error) {
+        console.error('Error loading suggestions:', error);
+    }
+}
+
 // API Functions
 async function loadStats() {
     try {
@@ -106,11 +144,29 @@ async function performSearch() {
     }
 }
 
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+// Snippet text with its [start, end) highlight spans wrapped in <mark>
+function highlightSnippet(text, highlights) {
+    let html = '';
+    let last = 0;
+    (highlights || []).forEach(([start, end]) => {
+        html += escapeHtml(text.slice(last, start)) + '<mark>' + escapeHtml(text.slice(start, end)) + '</mark>';
+        last = end;
+    });
+    return html + escapeHtml(text.slice(last));
+}
+
 function displaySearchResults(results, container) {
     let html = `<h3>Found ${results.length} results:</h3>`;
     
     results.forEach((result, index) => {
         const tags = result.tags.map(tag => `<span class="tag">#${tag}</span>`).join('');
+        const sections = result.matched_chunks > 1 ? ` &middot; ${result.matched_chunks} matching sections` : '';
         
         html += `
             <div class="result-item">
@@ -118,9 +174,9 @@ function displaySearchResults(results, container) {
                     ${index + 1}. ${result.title}
                     <span class="result-score">${(result.score * 100).toFixed(1)}%</span>
                 </div>
-                <div class="result-content">${result.content}</div>
+                <div class="result-content">${highlightSnippet(result.content, result.highlights)}</div>
                 <div class="result-meta">
-                    <small>${result.path}</small><br>
+                    <small>${result.path}${sections}</small><br>
                     ${tags}
                 </div>
             </div>
@@ -268,8 +324,6 @@ async function indexDocuments() {
         return;
     }
     
-    showLoading(true);
-    
     try {
         const response = await fetch('/api/index', {
             method: 'POST',
@@ -279,46 +333,97 @@ async function indexDocuments() {
         
         const data = await response.json();
         
-        showLoading(false);
+        if (!data.success) {
+            showMessage(resultsDiv, data.message || data.error, 'error');
+            return;
+        }
+        
+        // Indexing runs in the background; poll its progress
+        pollIndexJob(data.status_url, resultsDiv);
+        
+    } catch (error) {
+        showMessage(resultsDiv, 'Error indexing documents: ' + error.message, 'error');
+    }
+}
+
+const INDEX_STAGE_LABELS = {
+    files_parsed: 'Files parsed',
+    chunks_embedded: 'Chunks embedded',
+    index_written: 'Index written'
+};
+
+async function pollIndexJob(statusUrl, resultsDiv) {
+    try {
+        const response = await fetch(statusUrl);
+        const data = await response.json();
         
         if (!data.success) {
             showMessage(resultsDiv, data.message || data.error, 'error');
             return;
         }
         
-        let html = `
-            <div class="message message-success">
-                <strong>✓ Success!</strong><br>
-                ${data.message}
-            </div>
-        `;
+        const job = data.job;
         
-        if (data.stats) {
-            html += `
-                <div class="result-item">
-                    <h4>Statistics:</h4>
-                    <ul style="margin-left: 20px; margin-top: 10px;">
-                        <li>Total Documents: ${data.stats.total_documents}</li>
-                        <li>Total Words: ${data.stats.total_words.toLocaleString()}</li>
-                        <li>Average Words per Document: ${data.stats.avg_words_per_doc.toFixed(1)}</li>
-                        <li>Unique Tags: ${data.stats.unique_tags}</li>
-                        <li>Formats: ${data.stats.formats.join(', ')}</li>
-                    </ul>
-                </div>
-            `;
+        if (job.status === 'failed') {
+            showMessage(resultsDiv, 'Indexing failed: ' + job.error, 'error');
+            return;
         }
         
-        resultsDiv.innerHTML = html;
+        if (job.status === 'done') {
+            displayIndexResult(job.result, resultsDiv);
+            loadStats();
+            return;
+        }
         
-        // Reload stats
-        loadStats();
+        displayIndexProgress(job, resultsDiv);
+        setTimeout(() => pollIndexJob(statusUrl, resultsDiv), 500);
         
     } catch (error) {
-        showLoading(false);
-        showMessage(resultsDiv, 'Error indexing documents: ' + error.message, 'error');
+        showMessage(resultsDiv, 'Error checking indexing progress: ' + error.message, 'error');
     }
 }
 
+function displayIndexProgress(job, container) {
+    let html = '<div class="result-item"><h4>Indexing in progress...</h4>';
+    html += '<ul style="margin-left: 20px; margin-top: 10px;">';
+    
+    job.stages.forEach(stage => {
+        const label = INDEX_STAGE_LABELS[stage.name] || stage.name;
+        const icon = stage.status === 'done' ? '✓' : stage.status === 'running' ? '…' : '·';
+        const count = stage.total > 0 ? ` (${stage.done}/${stage.total})` : '';
+        html += `<li>${icon} ${label}${count}</li>`;
+    });
+    
+    html += '</ul></div>';
+    container.innerHTML = html;
+}
+
+function displayIndexResult(result, container) {
+    let html = `
+        <div class="message message-success">
+            <strong>✓ Success!</strong><br>
+            ${result.message}
+        </div>
+    `;
+    
+    if (result.stats) {
+        html += `
+            <div class="result-item">
+                <h4>Statistics:</h4>
+                <ul style="margin-left: 20px; margin-top: 10px;">
+                    <li>Total Documents: ${result.stats.total_documents}</li>
+                    <li>Total Words: ${result.stats.total_words.toLocaleString()}</li>
+                    <li>Average Words per Document: ${result.stats.avg_words_per_doc.toFixed(1)}</li>
+                    <li>Unique Tags: ${result.stats.unique_tags}</li>
+                    <li>Formats: ${result.stats.formats.join(', ')}</li>
+                </ul>
+            </div>
+        `;
+    }
+    
+    container.innerHTML = html;
+}
+
 // Helper Functions
 function showLoading(show) {
     const overlay = document.getElementById('loadingOverlay');
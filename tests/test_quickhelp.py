@@ -5,6 +5,7 @@ import unittest
 from pathlib import Path
 import tempfile
 import shutil
+import time
 
 from src.config import Config
 from src.indexer import DocumentIndexer, Document
@@ -125,6 +126,982 @@ class TestSearch(unittest.TestCase):
         self.assertEqual(len(results), 2)  # Two docs with emails
 
 
+class TestTrigramIndex(unittest.TestCase):
+    """Test trigram narrowing of regex search"""
+    
+    def setUp(self):
+        from src.trigram import TrigramIndex
+        
+        self.docs = [
+            'Lamport clocks order events',
+            'HDBSCAN with cosine distance',
+            'raft leader election',
+            'Raft log replication',
+        ]
+        self.index = TrigramIndex()
+        self.index.build(self.docs)
+    
+    def test_literal_extraction(self):
+        from src.trigram import regex_query, ALL
+        
+        self.assertEqual(regex_query(r'\w+@\w+\.\w+'), ALL)
+        self.assertEqual(regex_query('ab'), ALL)
+        self.assertNotEqual(regex_query('hdbscan.*cosine'), ALL)
+    
+    def test_candidates(self):
+        self.assertEqual(list(self.index.candidates('hdbscan.*cosine')), [1])
+        self.assertEqual(list(self.index.candidates('[Rr]aft (leader|log)')), [2, 3])
+        self.assertEqual(list(self.index.candidates('(?i)lamport\\s+clock')), [0])
+        self.assertEqual(len(self.index.candidates('paxos')), 0)
+        self.assertIsNone(self.index.candidates('.*'))
+    
+    def test_regex_search_matches_full_scan(self):
+        from src.search import KeywordSearch
+        
+        search = KeywordSearch()
+        search.index([{'content': text} for text in self.docs])
+        for pattern in ['raft', 'r[a-z]ft', 'clocks?', '(leader|log) \\w+']:
+            narrowed = search.regex_search(pattern)
+            search.trigram_index = None
+            self.assertEqual(narrowed, search.regex_search(pattern))
+            search.index(search.documents)
+
+
+class TestPositionalIndex(unittest.TestCase):
+    """Test phrase, proximity and boolean keyword queries"""
+    
+    def setUp(self):
+        from src.search import KeywordSearch
+        
+        self.search = KeywordSearch()
+        self.search.index([
+            {'content': 'Raft leader election in raft clusters'},
+            {'content': 'Paxos leader election'},
+            {'content': 'The Lamport clock orders events'},
+            {'content': 'Raft log replication and leader lease'},
+        ])
+    
+    def _ids(self, query):
+        return sorted(idx for idx, _ in self.search.search(query))
+    
+    def test_phrase(self):
+        self.assertEqual(self._ids('"leader election"'), [0, 1])
+        self.assertEqual(self._ids('"election leader"'), [])
+    
+    def test_near(self):
+        self.assertEqual(self._ids('raft NEAR/1 leader'), [0])
+        self.assertEqual(self._ids('raft NEAR/3 leader'), [0, 3])
+    
+    def test_boolean(self):
+        self.assertEqual(self._ids('leader AND NOT paxos'), [0, 3])
+        self.assertEqual(self._ids('(paxos OR lamport) NOT clock'), [1])
+        self.assertEqual(self._ids('NOT raft'), [1, 2])
+    
+    def test_parentheses_without_operators(self):
+        from src.positional import is_structured
+
+        self.search.index(self.search.documents + [{'content': 'Call lease() to renew the leader lease'}])
+        self.assertFalse(is_structured('lease()'))
+        self.assertFalse(is_structured('(see raft)'))
+        self.assertFalse(is_structured('say "hi'))
+        self.assertTrue(is_structured('(NOT raft)'))
+        self.assertEqual(self._ids('lease()'), [4])
+    
+    def test_multi_word_ranking(self):
+        results = self.search.search('raft election')
+        self.assertEqual(results[0][0], 0)
+        self.assertEqual(sorted(idx for idx, _ in results), [0, 1, 3])
+
+
+class TestCompressedPostings(unittest.TestCase):
+    """Test varint-compressed postings and skip pointers"""
+    
+    def setUp(self):
+        from src.postings import CompressedPostings
+        
+        # Long enough to span several blocks
+        self.raw = {
+            'even': (list(range(0, 1000, 2)), [[i % 7, 300 + i] for i in range(500)]),
+            'rare': ([3, 400, 999], [[0], [5, 6, 70000], [1]]),
+        }
+        self.store = CompressedPostings.build(self.raw, [10] * 1000)
+    
+    def test_round_trip(self):
+        from src.postings import CompressedPostings
+        
+        for term, postings in self.raw.items():
+            self.assertEqual(self.store.decode(term), postings)
+        
+        temp_dir = tempfile.mkdtemp()
+        try:
+            self.store.save(temp_dir)
+            self.assertTrue(CompressedPostings.exists(temp_dir))
+            loaded = CompressedPostings.load(temp_dir)
+            self.assertEqual(loaded.decode('rare'), self.raw['rare'])
+        finally:
+            shutil.rmtree(temp_dir)
+    
+    def test_advance(self):
+        it = self.store.iterator('even')
+        it.advance(801)
+        self.assertEqual(it.doc, 802)
+        self.assertEqual(it.positions(), [401 % 7, 701])
+        it.advance(5000)
+        self.assertIsNone(it.doc)
+        self.assertIsNone(self.store.iterator('missing'))
+    
+    def test_conjunction(self):
+        from src.positional import PositionalIndex
+        
+        index = PositionalIndex()
+        index.build(['a b'] * 300 + ['b c'] * 300 + ['c a b'])
+        self.assertEqual([doc for doc, _ in index.conjunction(['c', 'a'])], [600])
+        self.assertEqual([doc for doc, _ in index.phrase(['a', 'b'])][-2:], [299, 600])
+    
+    def test_pruned_rank_matches_exhaustive(self):
+        from src.positional import PositionalIndex
+        
+        texts = [' '.join(f"w{(i * j) % 97}" for j in range(1, 40)) for i in range(600)]
+        index = PositionalIndex()
+        index.build(texts)
+        # Exhaustive unless pruning is switched on
+        stats = {}
+        index.rank(['w1', 'w2'], 5, stats=stats)
+        self.assertEqual(stats['scored'], stats['total'])
+        
+        index.prune_min_postings = 0
+        for terms in (['w1', 'w2', 'w50'], ['w0', 'w96'], ['w3', 'missing']):
+            stats = {}
+            pruned = index.rank(terms, 5, stats=stats)
+            exhaustive = index.rank_exhaustive(terms, 5)
+            self.assertEqual([round(s, 9) for _, s in pruned], [round(s, 9) for _, s in exhaustive])
+            self.assertLessEqual(stats['scored'], stats['total'])
+
+    def test_prune_setting(self):
+        from src.search import HybridSearch
+
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        config.set('search.keyword.prune_min_postings', 0)
+        search = HybridSearch(config)
+        search.index([{'content': 'raft leader election'}, {'content': 'paxos'}])
+        self.assertEqual(search.keyword_search.positional_index.prune_min_postings, 0)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            search.keyword_search.save(tmpdir)
+            search.keyword_search.index(search.keyword_search.documents, index_path=tmpdir)
+        self.assertEqual(search.keyword_search.positional_index.prune_min_postings, 0)
+
+
+class TestFuzzyTerms(unittest.TestCase):
+    """Test typo-tolerant keyword search"""
+    
+    def test_edit_distance(self):
+        from src.fuzzy import edit_distance
+        
+        self.assertEqual(edit_distance('lamprot', 'lamport', 2), 1)  # swap
+        self.assertEqual(edit_distance('clustr', 'cluster', 2), 1)
+        self.assertEqual(edit_distance('raft', 'paxos', 1), 2)
+    
+    def test_lookup(self):
+        from src.fuzzy import FuzzyTermIndex
+        
+        index = FuzzyTermIndex(max_edits=1)
+        index.build(['hdbscan', 'lamport', 'clock', 'clocks', 'raft'])
+        self.assertEqual(index.lookup('hdbscna'), [('hdbscan', 1)])
+        self.assertEqual([t for t, _ in index.lookup('clockk')], ['clock', 'clocks'])
+        self.assertEqual(index.lookup('raf'), [])  # too short to correct
+    
+    def test_keyword_search_corrects_typos(self):
+        from src.search import KeywordSearch
+        
+        search = KeywordSearch()
+        search.index([
+            {'content': 'The Lamport clock orders events'},
+            {'content': 'HDBSCAN with cosine distance'},
+        ])
+        self.assertEqual([idx for idx, _ in search.search('Lamprot clock')], [0])
+        self.assertEqual([idx for idx, _ in search.search('hdbscna')], [1])
+        
+        strict = KeywordSearch(fuzzy=False)
+        strict.index(search.documents)
+        self.assertEqual(strict.search('hdbscna'), [])
+
+
+class TestSuggester(unittest.TestCase):
+    """Test typeahead suggestions"""
+    
+    def test_suggest(self):
+        from src.suggest import Suggester
+        
+        docs = [
+            {'content': '', 'metadata': {'title': 'Lamport Clock', 'tags': ['distributed']}},
+            {'content': '', 'metadata': {'title': 'Lamport Clock', 'tags': ['distributed']}},
+            {'content': '', 'metadata': {'title': 'Raft Consensus', 'tags': ['raft']}},
+        ]
+        suggester = Suggester()
+        suggester.build(docs, [('lambda', 1), ('raft', 2), ('distributed', 2)])
+        
+        self.assertEqual(suggester.suggest('lam')[0], {'text': 'Lamport Clock', 'kind': 'title'})
+        self.assertIn({'text': 'lambda', 'kind': 'term'}, suggester.suggest('lam'))
+        self.assertEqual(suggester.suggest('clo'), [{'text': 'Lamport Clock', 'kind': 'title'}])
+        # Terms that are also tags are suggested once
+        self.assertEqual([s['text'] for s in suggester.suggest('ra')], ['Raft Consensus', 'raft'])
+        self.assertEqual(suggester.suggest('zzz'), [])
+        self.assertEqual(len(suggester.suggest('l', limit=1)), 1)
+    
+    def test_weights_count_documents(self):
+        from src.suggest import Suggester
+        
+        # One long note split into many chunks does not outrank two notes
+        docs = [{'content': '', 'metadata': {'title': 'Paxos Notes', 'path': 'paxos.md'}}] * 10
+        docs += [{'content': '', 'metadata': {'title': 'Paxos Made Simple', 'path': f'{i}.md'}}
+                 for i in range(2)]
+        suggester = Suggester()
+        suggester.build(docs)
+        self.assertEqual([s['text'] for s in suggester.suggest('paxos')],
+                         ['Paxos Made Simple', 'Paxos Notes'])
+
+
+class TestBitmap(unittest.TestCase):
+    """Test roaring-style bitmap sets"""
+
+    def test_matches_python_sets(self):
+        import numpy as np
+        from src.bitmap import Bitmap
+
+        rng = np.random.default_rng(0)
+        # Sparse and dense containers, spread over several 2^16 key ranges
+        for size_a, size_b in [(50, 30000), (20000, 20000), (0, 100), (150000, 5)]:
+            a = rng.integers(0, 200000, size_a)
+            b = rng.integers(0, 200000, size_b)
+            set_a, set_b = set(a.tolist()), set(b.tolist())
+            bitmap_a, bitmap_b = Bitmap.from_ids(a), Bitmap.from_ids(b)
+
+            self.assertEqual(len(bitmap_a), len(set_a))
+            self.assertEqual((bitmap_a & bitmap_b).to_array().tolist(), sorted(set_a & set_b))
+            self.assertEqual((bitmap_a | bitmap_b).to_array().tolist(), sorted(set_a | set_b))
+            self.assertEqual((bitmap_a - bitmap_b).to_array().tolist(), sorted(set_a - set_b))
+            probe = rng.integers(0, 200000, 100)
+            self.assertEqual(bitmap_a.contains(probe).tolist(), [x in set_a for x in probe.tolist()])
+
+    def test_mask_round_trip(self):
+        import numpy as np
+        from src.bitmap import Bitmap
+
+        mask = np.zeros(70000, dtype=bool)
+        mask[[0, 5, 65535, 65536, 69999]] = True
+        bitmap = Bitmap.from_mask(mask)
+        self.assertEqual(list(bitmap), [0, 5, 65535, 65536, 69999])
+        self.assertTrue(np.array_equal(bitmap.to_mask(70000), mask))
+        self.assertEqual(len(Bitmap.range(70000) - bitmap), 69995)
+        self.assertFalse(Bitmap.from_ids([]))
+
+
+class TestMetadataFilters(unittest.TestCase):
+    """Test metadata filtering"""
+
+    def setUp(self):
+        from src.filters import MetadataIndex
+
+        self.docs = [
+            {'content': 'raft leader election', 'metadata': {
+                'tags': ['raft'], 'updated_at': '2024-01-10T09:00:00',
+                'frontmatter': {'author': 'Alice', 'date': '2023-12-01'}}},
+            {'content': 'raft log replication', 'metadata': {
+                'tags': ['raft', 'consensus'], 'updated_at': '2024-03-05T18:30:00',
+                'frontmatter': {'author': 'bob'}}},
+            {'content': 'paxos leader', 'metadata': {
+                'tags': ['paxos'], 'updated_at': '2024-06-30T23:00:00'}},
+        ]
+        self.index = MetadataIndex()
+        self.index.build(self.docs)
+
+    def _ids(self, filters):
+        return self.index.mask(filters).nonzero()[0].tolist()
+
+    def test_mask(self):
+        self.assertIsNone(self.index.mask(None))
+        self.assertEqual(self._ids({'tags': 'raft'}), [0, 1])
+        self.assertEqual(self._ids({'tags': ['#consensus', 'paxos']}), [1, 2])
+        self.assertEqual(self._ids({'tags': 'raft', 'author': 'alice'}), [0])
+        self.assertEqual(self._ids({'author': 'carol'}), [])
+        self.assertEqual(self._ids({'updated_at': {'from': '2024-02-01'}}), [1, 2])
+        self.assertEqual(self._ids({'updated_at': {'to': '2024-06-30'}}), [0, 1, 2])
+        self.assertEqual(self._ids({'updated_at': '2024-03-05'}), [1])
+        self.assertEqual(self._ids({'date': {'to': '2023-12-31'}}), [0])
+        with self.assertRaises(ValueError):
+            self.index.mask({'updated_at': {'from': 'last week'}})
+
+    def test_keyword_prefilter(self):
+        from src.search import KeywordSearch
+
+        search = KeywordSearch()
+        search.index(self.docs)
+        paxos = self.index.mask({'tags': 'paxos'})
+        self.assertEqual([idx for idx, _ in search.search('leader', allowed=paxos)], [2])
+        self.assertEqual([idx for idx, _ in search.search('raft leader', allowed=paxos)], [2])
+        self.assertEqual(search.search('"leader election"', allowed=paxos), [])
+        self.assertEqual([idx for idx, _ in search.regex_search('l.g', allowed=paxos)], [])
+
+    def test_semantic_prefilter(self):
+        import numpy as np
+        from src.lazy import optional_import
+        from src.search import SemanticSearch
+
+        if optional_import('faiss') is None:
+            self.skipTest("faiss not installed")
+
+        class Encoder:
+            """Stands in for a sentence-transformers model (bag of letters)"""
+            def encode(self, texts, **kwargs):
+                return np.asarray([[t.count(c) for c in 'abcdefghijklmnopqrstuvwxyz'] for t in texts],
+                                  dtype=np.float32)
+
+        search = SemanticSearch(model=Encoder())
+        search.index([{'content': f"{word} {i}"} for i in range(40)
+                      for word in ('raft', 'paxos')])
+        allowed = np.zeros(80, dtype=bool)
+        allowed[1::2] = True  # every paxos chunk: scanned through the FAISS selector
+        self.assertTrue(all(idx % 2 == 1 for idx, _ in search.search('raft', 5, allowed=allowed)))
+        allowed[:] = False
+        allowed[[2, 3]] = True  # small subset: scored directly
+        self.assertEqual([idx for idx, _ in search.search('raft', 5, allowed=allowed)], [2, 3])
+
+
+class TestResultCollapsing(unittest.TestCase):
+    """Test chunk-to-document collapsing"""
+
+    def test_aggregates(self):
+        import numpy as np
+        from src.collapse import chunk_documents, collapse
+
+        chunk_docs = chunk_documents([{'doc_id': 'a'}, {'doc_id': 'a'}, {'doc_id': 'b'}, {}, {'doc_id': 'a'}])
+        self.assertEqual(chunk_docs.tolist(), [0, 0, 1, 2, 0])
+
+        chunks, scores = np.array([0, 1, 2, 3, 4]), np.array([0.5, 0.4, 0.7, 0.1, 0.3])
+        best, totals, counts, members = collapse(chunks, scores, chunk_docs, 'max')
+        self.assertEqual(best.tolist(), [2, 0, 3])
+        self.assertEqual(counts.tolist(), [1, 3, 1])
+        self.assertEqual(members[1].tolist(), [0, 1, 4])
+
+        best, totals, _, _ = collapse(chunks, scores, chunk_docs, 'sum')
+        self.assertEqual(best.tolist(), [0, 2, 3])
+        self.assertAlmostEqual(totals[0], 1.2)
+
+        best, totals, _, members = collapse(chunks, scores, chunk_docs, 'mean', top_n=2)
+        self.assertEqual(best.tolist(), [0, 2, 3])
+        self.assertAlmostEqual(totals[0], 0.45)
+        self.assertEqual(members[0].tolist(), [0, 1])
+
+        with self.assertRaises(ValueError):
+            collapse(chunks, scores, chunk_docs, 'median')
+
+    def test_hybrid_search_collapses(self):
+        from src.search import HybridSearch
+
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        search = HybridSearch(config)
+        search.index([
+            {'doc_id': 'raft', 'content': 'raft leader election'},
+            {'doc_id': 'raft', 'content': 'raft log replication'},
+            {'doc_id': 'paxos', 'content': 'paxos compared with raft'},
+        ])
+
+        chunks = search.search('raft', mode='keyword', collapse=False)
+        self.assertEqual(len(chunks), 3)
+        documents = search.search('raft', mode='keyword', collapse='max')
+        self.assertEqual([r['document']['doc_id'] for r in documents], ['raft', 'paxos'])
+        self.assertEqual(documents[0]['matched_chunks'], 2)
+        self.assertEqual(len(search.search('raft', mode='keyword', max_results=1, collapse=True)), 1)
+        # Chunks unless a request opts in (search.collapse.enabled is off)
+        self.assertEqual(search.search('raft', mode='keyword'), chunks)
+
+
+class TestSnippets(unittest.TestCase):
+    """Test query-aware snippets and highlights"""
+
+    def test_window_covers_matches(self):
+        from src.snippets import make_snippet, match_spans
+        import re
+
+        text = ' '.join(['filler'] * 100) + ' raft leader raft log ' + ' '.join(['filler'] * 100)
+        spans = match_spans(text, re.compile(r'raft'))
+        snippet, highlights = make_snippet(text, spans, length=80)
+        self.assertTrue(snippet.startswith('...') and snippet.endswith('...'))
+        self.assertEqual([snippet[a:b] for a, b in highlights], ['raft', 'raft'])
+        self.assertLessEqual(len(snippet), 86)
+
+        short, highlights = make_snippet('raft', match_spans('raft', re.compile('raft')))
+        self.assertEqual((short, highlights), ('raft', [(0, 4)]))
+
+    def test_keyword_highlights(self):
+        from src.search import HybridSearch
+
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        search = HybridSearch(config)
+        search.index([{'content': 'Raft uses leader election. Paxos has no leader election.'}])
+
+        for query, expected in [('leader', ['leader', 'leader']),
+                                ('"leader election" NOT zab', ['leader election', 'leader election']),
+                                ('raft electoin', ['Raft', 'election', 'election'])]:
+            result = search.highlight(query, search.search(query, mode='keyword'))[0]
+            self.assertEqual([result['snippet'][a:b] for a, b in result['highlights']], expected)
+
+    def test_sentence_focus_limited(self):
+        from unittest import mock
+        from src.search import HybridSearch
+
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        search = HybridSearch(config)
+        search.semantic_search = mock.Mock()
+        search.semantic_search.model.encode.side_effect = lambda texts, **_: [[1.0, 0.0]] * len(texts)
+        hits = [{'document': {'content': f'Sentence {i}. Another one.'}, 'search_type': 'semantic'}
+                for i in range(5)]
+
+        # Off by default
+        search.highlight('consensus', [dict(hit) for hit in hits])
+        search.semantic_search.model.encode.assert_not_called()
+
+        # On: only the top results, and never keyword results
+        config.set('search.snippets.semantic_sentences', True)
+        config.set('search.snippets.semantic_sentences_top', 2)
+        results = [dict(hit) for hit in hits]
+        results[0]['search_type'] = 'keyword'
+        search.highlight('consensus', results)
+        encoded = search.semantic_search.model.encode.call_args[0][0]
+        self.assertEqual(encoded, ['consensus', 'Sentence 1.', 'Another one.'])
+        self.assertEqual([len(r['highlights']) for r in results], [0, 1, 0, 0, 0])
+
+
+class TestReranker(unittest.TestCase):
+    """Test the cross-encoder rerank stage"""
+
+    class Model:
+        """Stands in for a CrossEncoder: relevance = occurrences of the query"""
+        def __init__(self):
+            self.pairs = 0
+
+        def predict(self, pairs, **kwargs):
+            self.pairs += len(pairs)
+            return [text.count(query) for query, text in pairs]
+
+    def _results(self, texts):
+        return [{'doc_index': i, 'score': 1.0, 'document': {'content': text}} for i, text in enumerate(texts)]
+
+    def test_rerank_and_cache(self):
+        from src.rerank import Reranker
+
+        model = self.Model()
+        reranker = Reranker(model=model, max_candidates=3, batch_size=2, time_budget_ms=None)
+        results = self._results(['raft', 'raft raft raft', 'paxos', 'raft raft raft raft'])
+        stats = {}
+        reranked = reranker.rerank('raft', results, stats=stats)
+        # Only the first three are candidates; the fourth keeps its place
+        self.assertEqual([r['doc_index'] for r in reranked], [1, 0, 2, 3])
+        self.assertEqual(reranked[0]['rerank_score'], 3.0)
+        self.assertEqual(stats['scored'], 3)
+
+        reranker.rerank('raft', results, stats=stats)
+        self.assertEqual((stats['scored'], stats['cached'], model.pairs), (0, 3, 3))
+
+    def test_time_budget(self):
+        from src.rerank import Reranker
+
+        reranker = Reranker(model=self.Model(), batch_size=2, time_budget_ms=0)
+        reranked = reranker.rerank('raft', self._results(['paxos', 'raft', 'raft raft', 'raft raft raft']))
+        # The first batch is always scored, later ones are over budget
+        self.assertEqual([r['doc_index'] for r in reranked], [1, 0, 2, 3])
+        self.assertNotIn('rerank_score', reranked[2])
+
+        # A cached score after an unscored result does not move it up
+        reranker = Reranker(model=self.Model(), batch_size=1, time_budget_ms=0)
+        reranker.rerank('raft', self._results(['raft raft raft']))
+        reranked = reranker.rerank('raft', self._results(['paxos', 'raft', 'raft raft', 'raft raft raft']))
+        self.assertEqual([r['doc_index'] for r in reranked], [0, 1, 2, 3])
+        self.assertEqual([('rerank_score' in r) for r in reranked], [True, False, False, False])
+
+    def test_hybrid_search_reranks(self):
+        from src.rerank import Reranker
+        from src.search import HybridSearch
+
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        search = HybridSearch(config, reranker=Reranker(model=self.Model()))
+        search.index([{'content': 'raft ' * 3 + 'filler ' * 50}, {'content': 'raft consensus'}])
+        self.assertEqual([r['doc_index'] for r in search.search('raft', mode='keyword', rerank=False)], [1, 0])
+        self.assertEqual([r['doc_index'] for r in search.search('raft', mode='keyword')], [0, 1])
+        self.assertEqual([r['doc_index'] for r in search.search('raft', mode='keyword', max_results=1)], [0])
+
+
+class TestQueryRouter(unittest.TestCase):
+    """Test the per-query mode choice of 'auto' search"""
+
+    def test_route(self):
+        from src.router import QueryRouter
+
+        router = QueryRouter()
+        vocabulary = {'raft', 'leader', 'election', 'how', 'does', 'work', 'paxos', 'why'}
+        route = lambda query, **kwargs: router.route(query, lambda term: term in vocabulary, **kwargs)
+
+        self.assertEqual(route('"leader election"'), ('keyword', 'structured'))
+        self.assertEqual(route('lead.*ion'), ('keyword', 'pattern'))
+        self.assertEqual(route('[Rr]aft'), ('keyword', 'pattern'))
+        self.assertEqual(route('parse_config'), ('keyword', 'identifier'))
+        self.assertEqual(route("KeyError: 'term'"), ('keyword', 'identifier'))
+        self.assertEqual(route('ECONNREFUSED'), ('keyword', 'identifier'))
+        self.assertEqual(route('Distributed Systems', tags={'distributed systems'}), ('keyword', 'tag'))
+        self.assertEqual(route('raft'), ('keyword', 'short'))
+        # Plain questions of known words still get the semantic leg
+        self.assertEqual(route('why paxos?'), ('hybrid', 'long'))
+        self.assertEqual(route('raft leader'), ('hybrid', 'long'))
+        self.assertEqual(route('raft | paxos'), ('hybrid', 'long'))
+        self.assertEqual(QueryRouter(max_keyword_terms=2).route('raft leader', vocabulary.__contains__),
+                         ('keyword', 'short'))
+        self.assertEqual(route('how does raft leader election work'), ('hybrid', 'long'))
+        self.assertEqual(route('consensus'), ('hybrid', 'vocabulary_miss'))
+        self.assertEqual(route('consensus', semantic=False), ('keyword', 'no_semantic'))
+
+    def test_auto_mode_skips_encoding(self):
+        import numpy as np
+        from src.lazy import optional_import
+        from src.search import HybridSearch, SemanticSearch
+
+        if optional_import('faiss') is None:
+            self.skipTest("faiss not installed")
+
+        class Encoder:
+            """Stands in for a sentence-transformers model, counting encoded queries"""
+            def __init__(self):
+                self.queries = 0
+
+            def encode(self, texts, **kwargs):
+                self.queries += len(texts) == 1
+                return np.asarray([[t.count(c) for c in 'abcdefghijklmnopqrstuvwxyz'] for t in texts],
+                                  dtype=np.float32)
+
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        search = HybridSearch(config)
+        search.semantic_search = SemanticSearch(model=Encoder())
+        search.index([{'content': 'raft leader election'}, {'content': 'paxos ballots'}])
+        encoder = search.semantic_search.model
+
+        self.assertEqual([r['doc_index'] for r in search.search('raft', mode='auto')], [0])
+        self.assertEqual(encoder.queries, 0)
+        search.search('how are leaders chosen', mode='auto')
+        self.assertEqual(encoder.queries, 1)
+
+        metrics = search.router.metrics()
+        self.assertEqual(metrics['queries'], 2)
+        self.assertEqual(metrics['reasons'], {'short': 1, 'vocabulary_miss': 1})
+        self.assertEqual(metrics['modes']['keyword']['count'], 1)
+
+
+class TestClusterPartitions(unittest.TestCase):
+    """Test search restricted to the clusters closest to the query"""
+
+    def test_probe(self):
+        import numpy as np
+        from src.partitions import ClusterPartitions
+
+        partitions = ClusterPartitions(np.array([[1, 0], [0, 1]], dtype=np.float32))
+        partitions.assign(np.array([[1, 0.1], [0.2, 1], [0.9, 0], [0, 3]], dtype=np.float32))
+        self.assertEqual(partitions.labels.tolist(), [0, 1, 0, 1])
+        self.assertEqual(partitions.mask(np.array([0.1, 1]), 1).tolist(), [False, True, False, True])
+        self.assertEqual(partitions.probe(np.array([1, 0]), 2).to_array().tolist(), [0, 1, 2, 3])
+        with self.assertRaises(ValueError):
+            partitions.assign(np.zeros((2, 3), dtype=np.float32))
+
+    def test_centroids_from_clustering(self):
+        import numpy as np
+        from src.clustering import AutoClusterer
+
+        config = Config()
+        config.set('clustering.algorithm', 'kmeans')
+        config.set('clustering.max_clusters', 2)
+        config.set('clustering.auto_naming', False)
+        embeddings = np.array([[1, 0], [0.9, 0.1], [1, 0.2], [0, 1], [0.1, 0.9], [0.2, 1]], dtype=np.float32)
+        clusterer = AutoClusterer(config)
+        clusterer.fit([{'content': f'note {i}', 'metadata': {'path': f'{i}.md'}} for i in range(6)],
+                      embeddings=embeddings)
+
+        self.assertEqual(clusterer.centroids.shape, (2, 2))
+        similar = clusterer.find_similar_clusters(0, top_k=2)
+        self.assertIn(0, similar[0]['cluster']['doc_indices'])
+        self.assertGreater(similar[0]['similarity'], similar[1]['similarity'])
+
+    def test_hybrid_search_probes_partitions(self):
+        import numpy as np
+        from src.lazy import optional_import
+        from src.search import HybridSearch, SemanticSearch
+
+        if optional_import('faiss') is None:
+            self.skipTest("faiss not installed")
+
+        class Encoder:
+            """Stands in for a sentence-transformers model: (has 'raft', has 'paxos')"""
+            def encode(self, texts, **kwargs):
+                return np.asarray([['raft' in t, 'paxos' in t or 'ballot' in t] for t in texts],
+                                  dtype=np.float32) + 0.01
+
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        config.set('search.semantic.similarity_threshold', 0.0)
+        search = HybridSearch(config)
+        search.semantic_search = SemanticSearch(model=Encoder())
+        search.index([{'content': 'raft log'}, {'content': 'paxos ballot'},
+                      {'content': 'raft leader log'}, {'content': 'paxos log'}])
+        search.set_partitions(np.array([[1, 0], [0, 1]], dtype=np.float32))
+
+        everything = [r['doc_index'] for r in search.search('log', mode='keyword', collapse=False)]
+        self.assertEqual(sorted(everything), [0, 2, 3])
+        probed = [r['doc_index'] for r in search.search('raft log', mode='hybrid', collapse=False, n_probe=1)]
+        self.assertEqual(sorted(probed), [0, 2])
+        probed = [r['doc_index'] for r in search.search('paxos ballot', mode='semantic', collapse=False, n_probe=1)]
+        self.assertEqual(sorted(probed), [1, 3])
+
+
+class TestIncrementalClustering(unittest.TestCase):
+    """Test assigning new documents to existing clusters"""
+
+    def setUp(self):
+        import numpy as np
+
+        self.config = Config()
+        self.config.set('clustering.algorithm', 'kmeans')
+        self.config.set('clustering.max_clusters', 2)
+        self.config.set('clustering.auto_naming', False)
+        self.config.set('clustering.recluster_threshold', 2)
+        self.docs = [{'content': f'note {i}', 'metadata': {'path': f'{i}.md'}} for i in range(6)]
+        self.embeddings = np.array([[1, 0], [0.9, 0.1], [1, 0.2], [0, 1], [0.1, 0.9], [0.2, 1]],
+                                   dtype=np.float32)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_assign_and_refit(self):
+        import numpy as np
+        from src.clustering import AutoClusterer
+
+        clusterer = AutoClusterer(self.config)
+        clusterer.fit(self.docs, embeddings=self.embeddings)
+        labels = clusterer.assign([{'content': 'new', 'metadata': {'path': 'new.md'}}],
+                                  embeddings=np.array([[0, 2]], dtype=np.float32))
+        self.assertEqual(labels[0], clusterer.cluster_labels[3])
+        self.assertEqual(clusterer.pending_documents, 1)
+        self.assertFalse(clusterer.needs_recluster())
+        clusterer.save(self.temp_dir)
+
+        # The pending count survives a restart; known documents are not new
+        clusterer = AutoClusterer(self.config)
+        clusterer.load(self.temp_dir)
+        self.assertEqual(clusterer.pending_documents, 1)
+        corpus = self.docs + [{'content': 'new', 'metadata': {'path': 'new.md'}}]
+        embeddings = np.vstack([self.embeddings, [[0, 2]]]).astype(np.float32)
+        result = clusterer.update(corpus, embeddings=embeddings)
+        self.assertEqual((result['assigned'], result['reclustered']), (0, False))
+
+        # A second new document reaches recluster_threshold
+        corpus.append({'content': 'newer', 'metadata': {'path': 'newer.md'}})
+        embeddings = np.vstack([embeddings, [[2, 0]]]).astype(np.float32)
+        result = clusterer.update(corpus, embeddings=embeddings)
+        self.assertEqual((result['assigned'], result['reclustered']), (1, True))
+        self.assertEqual(clusterer.pending_documents, 0)
+        self.assertEqual(len(clusterer.doc_keys), 8)
+
+    def test_refit_with_another_algorithm(self):
+        import numpy as np
+        from src.clustering import AutoClusterer
+
+        self.config.set('clustering.algorithm', 'hdbscan')
+        self.config.set('clustering.min_cluster_size', 2)
+        clusterer = AutoClusterer(self.config)
+        clusterer.fit(self.docs, embeddings=self.embeddings)
+        self.assertIsNotNone(clusterer._hdbscan_model)
+
+        # A kmeans refit must not keep predicting with the old HDBSCAN model
+        clusterer.algorithm = 'kmeans'
+        clusterer.fit(self.docs, embeddings=self.embeddings)
+        self.assertIsNone(clusterer._hdbscan_model)
+        clusterer.save(self.temp_dir)
+        clusterer = AutoClusterer(self.config)
+        clusterer.load(self.temp_dir)
+        self.assertIsNone(clusterer._hdbscan_model)
+        labels = clusterer.assign([{'content': 'new', 'metadata': {'path': 'new.md'}}],
+                                  embeddings=np.array([[0, 2]], dtype=np.float32))
+        self.assertEqual(labels[0], clusterer.cluster_labels[3])
+
+    def test_unlike_documents_are_uncategorized(self):
+        import numpy as np
+        from src.clustering import AutoClusterer
+
+        self.config.set('clustering.assign_min_similarity', 0.9)
+        clusterer = AutoClusterer(self.config)
+        clusterer.fit(self.docs, embeddings=self.embeddings)
+        labels = clusterer.assign([{'content': 'between', 'metadata': {'path': 'x.md'}}],
+                                  embeddings=np.array([[1, 1]], dtype=np.float32))
+        self.assertEqual(labels.tolist(), [-1])
+        self.assertEqual(clusterer.clusters[-1]['name'], "Uncategorized")
+        self.assertGreater(clusterer.drift, 0)
+
+
+class TestScalableClustering(unittest.TestCase):
+    """Test the batch-wise and sparse clustering backends"""
+
+    def test_backends_separate_topics(self):
+        import numpy as np
+        from src.clustering import AutoClusterer
+
+        # Three topics, stored one after another as folders would be
+        rng = np.random.RandomState(0)
+        embeddings = np.vstack([rng.randn(40, 8) * 0.05 + np.eye(8)[i] for i in range(3)]).astype(np.float32)
+        docs = [{'content': f'note {i}', 'metadata': {'path': f'{i}.md'}} for i in range(120)]
+
+        for algorithm in ('minibatch_kmeans', 'birch', 'hierarchical'):
+            config = Config()
+            config.set('clustering.algorithm', algorithm)
+            config.set('clustering.max_clusters', 3)
+            config.set('clustering.auto_naming', False)
+            config.set('clustering.minibatch_kmeans.batch_size', 16)
+            config.set('clustering.birch.batch_size', 16)
+            config.set('clustering.hierarchical.connectivity_min_documents', 50)
+            clusterer = AutoClusterer(config)
+            clusterer.fit(docs, embeddings=embeddings)
+            labels = np.asarray(clusterer.cluster_labels)
+            self.assertEqual(len(set(labels[i * 40] for i in range(3))), 3, algorithm)
+            for i in range(3):
+                self.assertEqual(len(set(labels[i * 40:(i + 1) * 40])), 1, algorithm)
+
+
+class TestAcceleratedHdbscan(unittest.TestCase):
+    """Test HDBSCAN on reduced embeddings and on a precomputed kNN graph"""
+
+    def test_reduce_and_knn_graph(self):
+        import numpy as np
+        from src.lazy import optional_import
+        from src.clustering import AutoClusterer
+
+        if optional_import('hdbscan') is None or optional_import('faiss') is None:
+            self.skipTest("hdbscan or faiss not installed")
+
+        rng = np.random.RandomState(0)
+        embeddings = np.vstack([rng.randn(30, 64) * 0.03 + np.eye(64)[i] for i in range(3)]).astype(np.float32)
+        docs = [{'content': f'note {i}', 'metadata': {'path': f'{i}.md'}} for i in range(90)]
+
+        for options in ({'reduce': 'pca', 'n_components': 8}, {'knn_graph': True, 'n_neighbors': 10},
+                        {'reduce': 'pca', 'n_components': 8, 'knn_graph': True, 'n_neighbors': 10}):
+            config = Config()
+            config.set('clustering.auto_naming', False)
+            for key, value in options.items():
+                config.set(f'clustering.hdbscan.{key}', value)
+            clusterer = AutoClusterer(config)
+            result = clusterer.fit(docs, embeddings=embeddings)
+
+            labels = np.asarray(clusterer.cluster_labels)
+            topics = [set(labels[i * 30:(i + 1) * 30].tolist()) for i in range(3)]
+            self.assertTrue(all(len(topic) == 1 and -1 not in topic for topic in topics), options)
+            self.assertEqual(len(set.union(*topics)), 3, options)
+            for phase in ('reduce', 'knn_graph'):
+                self.assertEqual(phase in result['timings'], phase in options, options)
+
+            # New documents are projected like the fitted ones
+            new = clusterer.assign([{'content': 'new', 'metadata': {'path': 'new.md'}}],
+                                   embeddings=embeddings[:1] + 0.01)
+            self.assertEqual(new[0], labels[0], options)
+
+    def test_reduced_points_are_unit_length(self):
+        import numpy as np
+        from src.clustering import AutoClusterer
+
+        clusterer = AutoClusterer(Config())
+        points = clusterer._reduce(np.random.RandomState(0).randn(20, 16).astype(np.float32), 'pca')
+        self.assertTrue(np.allclose(np.linalg.norm(points, axis=1), 1, atol=1e-5))
+
+
+class TestClusterNaming(unittest.TestCase):
+    """Test TF-IDF cluster keywords"""
+
+    def test_keywords_match_per_cluster_means(self):
+        import numpy as np
+        from src.clustering import AutoClusterer
+
+        topics = ['raft leader election log replication consensus',
+                  'paxos ballot acceptor proposer quorum',
+                  'lamport clock event ordering causality']
+        rng = np.random.RandomState(0)
+        docs = [{'content': ' '.join(rng.choice(topics[i % 3].split(), 20)),
+                 'metadata': {'path': f'{i}.md', 'title': f'Note {i}'}} for i in range(60)]
+        embeddings = np.array([np.eye(3)[i % 3] + rng.randn(3) * 0.01 for i in range(60)], dtype=np.float32)
+
+        config = Config()
+        config.set('clustering.algorithm', 'kmeans')
+        config.set('clustering.max_clusters', 3)
+        clusterer = AutoClusterer(config)
+        clusterer.fit(docs, embeddings=embeddings)
+
+        X, vocab, excluded = clusterer._tfidf()
+        for cluster in clusterer.clusters:
+            mean = np.asarray(X[cluster['doc_indices']].mean(axis=0)).ravel()
+            mean[excluded] = 0
+            expected = {vocab[i] for i in np.flatnonzero(mean >= np.sort(mean)[-5])}
+            self.assertTrue(set(cluster['keywords'][:5]) <= expected)
+
+        # Reclustering the same documents reuses the fitted TF-IDF matrix
+        clusterer.algorithm = 'hierarchical'
+        clusterer.fit(docs, embeddings=embeddings)
+        self.assertIs(clusterer._tfidf()[0], X)
+
+
+class TestTextClean(unittest.TestCase):
+    """Test shared markdown normalization"""
+
+    NOTE = ("---\ntitle: Raft\n---\n# Raft notes\n\n- see [the paper](https://raft.github.io) "
+            "and [[Paxos]]\n```python\nprint('x')\n```\nRun `make` at 2026-01-07T12:34:56 #consensus")
+
+    def test_clean(self):
+        from src import textclean
+
+        self.assertEqual(textclean.clean_markdown(self.NOTE),
+                         "Raft notes see the paper and Paxos Run at 2026-01-07T12:34:56 #consensus")
+        self.assertEqual(textclean.canonical(self.NOTE),
+                         "Raft notes see the paper and Paxos Run at #consensus")
+        self.assertEqual(textclean.extract_title(self.NOTE), "Raft notes")
+        self.assertEqual(textclean.extract_tags(self.NOTE), ['consensus'])
+
+    def test_cleaned_once_per_version(self):
+        from unittest import mock
+        from src import textclean
+        from src.clustering import AutoClusterer
+
+        doc = {'content': self.NOTE + ' (edited)', 'metadata': {'title': 'Raft', 'path': 'raft.md'}}
+        clusterer = AutoClusterer(Config())
+        with mock.patch.object(textclean, '_clean_markdown', wraps=textclean._clean_markdown) as clean:
+            clusterer._dedupe_documents([doc])
+            clusterer._build_embedding_text(doc)
+            clusterer._build_naming_text(doc)
+            self.assertEqual(clean.call_count, 1)
+            textclean.clean_markdown(doc['content'] + ' again')
+            self.assertEqual(clean.call_count, 2)
+
+
+class TestNearDuplicates(unittest.TestCase):
+    """Test MinHash/LSH near-duplicate detection"""
+
+    def setUp(self):
+        import numpy as np
+
+        rng = np.random.RandomState(0)
+        words = [f'word{i}' for i in range(2000)]
+        self.notes = [' '.join(rng.choice(words, 200)) for _ in range(4)]
+        edited = self.notes[0].split()
+        edited[50], edited[150] = 'changed', 'edited'
+        # An edited copy of note 0 and the distinct notes 1-3
+        self.notes.append(' '.join(edited))
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_lsh(self):
+        from src.minhash import signature, similarity, near_duplicates
+
+        signatures = [signature(note) for note in self.notes]
+        self.assertGreater(similarity(signatures[0], signatures[4]), 0.8)
+        self.assertLess(similarity(signatures[0], signatures[1]), 0.1)
+        self.assertEqual(near_duplicates(signatures + [None], threshold=0.8), {4: 0})
+
+    def test_indexer(self):
+        for i, note in enumerate(self.notes):
+            (Path(self.temp_dir) / f'note{i}.md').write_text(f'# Note {i}\n\n{note}')
+
+        config = Config()
+        config.set('documents.near_duplicates.threshold', 0.8)
+        indexer = DocumentIndexer(config)
+        indexer.index_directory(self.temp_dir)
+        by_path = {Path(doc.path).name: doc.id for doc in indexer.documents}
+        self.assertEqual(indexer.near_duplicates(), {by_path['note4.md']: by_path['note0.md']})
+
+        config.set('documents.near_duplicates.skip', True)
+        indexer = DocumentIndexer(config)
+        indexer.index_directory(self.temp_dir)
+        self.assertEqual(len(indexer.documents), 4)
+
+    def test_clustering_dedupe(self):
+        from src.clustering import AutoClusterer
+
+        config = Config()
+        config.set('clustering.dedup_threshold', 0.8)
+        docs = [{'content': note, 'metadata': {'path': f'note{i}.md'}}
+                for i, note in enumerate(self.notes)]
+        kept = AutoClusterer(config)._dedupe_documents(docs)
+        self.assertEqual([doc['metadata']['path'] for doc in kept],
+                         ['note0.md', 'note1.md', 'note2.md', 'note3.md'])
+
+
+class TestFitCache(unittest.TestCase):
+    """Test the on-disk cache of clustering results"""
+
+    def setUp(self):
+        import numpy as np
+
+        rng = np.random.RandomState(0)
+        self.docs = [{'content': f'note {i} about topic {i % 3}',
+                      'metadata': {'path': f'{i}.md', 'title': f'Note {i}', 'tags': []}}
+                     for i in range(30)]
+        self.embeddings = np.array([np.eye(3)[i % 3] + rng.randn(3) * 0.01 for i in range(30)],
+                                   dtype=np.float32)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _fit(self, algorithm, max_entries=8, max_clusters=3):
+        from src.clustering import AutoClusterer
+        from src.cluster_cache import FitCache
+
+        config = Config()
+        config.set('clustering.algorithm', algorithm)
+        config.set('clustering.max_clusters', max_clusters)
+        clusterer = AutoClusterer(config)
+        clusterer.fit_cache = FitCache(self.temp_dir, max_entries)
+        return clusterer, clusterer.fit(self.docs, embeddings=self.embeddings)
+
+    def test_repeated_fit_is_cached(self):
+        from unittest import mock
+        from src.clustering import AutoClusterer
+
+        _, first = self._fit('kmeans')
+        self._fit('hierarchical')
+        with mock.patch.object(AutoClusterer, '_kmeans_cluster') as kmeans:
+            clusterer, again = self._fit('kmeans')
+        kmeans.assert_not_called()
+        self.assertFalse(first['cached'])
+        self.assertTrue(again['cached'])
+        self.assertEqual(again['labels'].tolist(), first['labels'].tolist())
+        self.assertEqual([c['name'] for c in again['clusters']], [c['name'] for c in first['clusters']])
+        self.assertEqual(len(again['clusters'][0]['documents']), again['clusters'][0]['size'])
+        # A cached fit can take new documents like a computed one
+        self.assertEqual(len(clusterer.assign(self.docs[:2], self.embeddings[:2])), 2)
+
+        # Other parameters or other documents are another entry
+        self.assertFalse(self._fit('kmeans', max_clusters=2)[1]['cached'])
+        self.docs[0]['content'] += ' edited'
+        self.assertFalse(self._fit('kmeans')[1]['cached'])
+
+    def test_least_recently_used_evicted(self):
+        self._fit('kmeans', max_entries=2)
+        self._fit('hierarchical', max_entries=2)
+        self._fit('kmeans', max_entries=2)
+        cache = self._fit('birch', max_entries=2)[0].fit_cache
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(self._fit('kmeans', max_entries=2)[1]['cached'])
+        self.assertFalse(self._fit('hierarchical', max_entries=2)[1]['cached'])
+
+
 class TestClustering(unittest.TestCase):
     """Test clustering functionality"""
     
@@ -182,6 +1159,320 @@ class TestRAG(unittest.TestCase):
         self.assertIn('AI Doc', context)
 
 
+class TestJobs(unittest.TestCase):
+    """Test background job tracking"""
+    
+    def test_job_progress_and_result(self):
+        from src.jobs import JobManager
+        
+        def work(job, n):
+            job.start_stage('parse', total=n)
+            for i in range(n):
+                job.update_stage('parse', i + 1)
+            job.finish_stage('parse')
+            return {'count': n}
+        
+        manager = JobManager()
+        job = manager.submit('index', ['parse', 'write'], work, 3)
+        
+        for _ in range(100):
+            if not job.is_active:
+                break
+            time.sleep(0.01)
+        
+        status = manager.get(job.id).to_dict()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['result'], {'count': 3})
+        self.assertEqual(status['stages'][0]['done'], 3)
+        self.assertEqual(status['stages'][1]['status'], 'pending')
+    
+    def test_failed_job(self):
+        from src.jobs import JobManager
+        
+        def work(job):
+            raise ValueError('boom')
+        
+        manager = JobManager()
+        job = manager.submit('index', ['parse'], work)
+        
+        for _ in range(100):
+            if not job.is_active:
+                break
+            time.sleep(0.01)
+        
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'boom')
+        self.assertIsNone(manager.active('index'))
+    
+    def test_submit_if_idle(self):
+        import threading
+        from src.jobs import JobManager
+        
+        release = threading.Event()
+        manager = JobManager()
+        results = []
+        
+        def request():
+            results.append(manager.submit_if_idle('index', ['parse'], lambda job: release.wait(5)))
+        
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({job.id for job in results}), 1)
+        
+        release.set()
+        for _ in range(100):
+            if not results[0].is_active:
+                break
+            time.sleep(0.01)
+        self.assertNotEqual(manager.submit_if_idle('index', ['parse'], lambda job: None).id,
+                            results[0].id)
+
+
+class TestIndexStore(unittest.TestCase):
+    """Test versioned index directories and generation swapping"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_publish_switches_current(self):
+        from src.index_store import IndexStore
+        
+        store = IndexStore(self.temp_dir, keep_versions=2)
+        self.assertIsNone(store.current())
+        
+        first = store.new_version()
+        (first / "documents.json").write_text("{}")
+        self.assertIsNone(store.current())  # not published yet
+        store.publish(first)
+        self.assertEqual(store.current(), first)
+        
+        for _ in range(3):
+            store.publish(store.new_version())
+        
+        self.assertEqual(len(store.versions()), 2)
+        self.assertFalse(first.exists())
+    
+    def test_prune_keeps_newer_unpublished_versions(self):
+        from src.index_store import IndexStore
+        
+        store = IndexStore(self.temp_dir, keep_versions=1)
+        older = store.new_version()
+        building = store.new_version()  # another process is still writing it
+        store.publish(older)
+        self.assertTrue(building.exists())
+        store.publish(store.new_version())
+        self.assertEqual(store.versions(), [store.current()])
+    
+    def test_legacy_layout(self):
+        from src.index_store import resolve_index_path
+        
+        (Path(self.temp_dir) / "documents.json").write_text("{}")
+        self.assertEqual(resolve_index_path(self.temp_dir), Path(self.temp_dir))
+    
+    def test_handle_defers_close_until_released(self):
+        from src.index_store import IndexHandle
+        
+        closed = []
+        
+        class Engine:
+            def __init__(self, name):
+                self.name = name
+            
+            def close(self):
+                closed.append(self.name)
+        
+        handle = IndexHandle()
+        handle.swap(Engine('old'))
+        
+        with handle.acquire() as gen:
+            handle.swap(Engine('new'))
+            self.assertEqual(gen.search_engine.name, 'old')
+            self.assertEqual(closed, [])
+        
+        self.assertEqual(closed, ['old'])
+        with handle.acquire() as gen:
+            self.assertEqual(gen.search_engine.name, 'new')
+
+
+class TestChunkStorage(unittest.TestCase):
+    """Test memory-mapped chunk storage"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_round_trip(self):
+        from src.storage import save_chunks, load_chunks
+        
+        docs = [
+            {'doc_id': 'a', 'chunk_id': 0, 'content': 'Héllo wörld', 'metadata': {'tags': ['x']}},
+            {'doc_id': 'b', 'chunk_id': 0, 'content': '', 'metadata': {}},
+        ]
+        save_chunks(docs, self.temp_dir)
+        
+        mapped = load_chunks(self.temp_dir, use_mmap=True)
+        self.assertEqual(len(mapped), 2)
+        self.assertEqual(mapped[0], docs[0])
+        self.assertEqual(mapped.text(0), 'Héllo wörld')
+        self.assertEqual(list(mapped), docs)
+        mapped.close()
+        
+        self.assertEqual(load_chunks(self.temp_dir, use_mmap=False), docs)
+    
+    def test_keyword_search_over_saved_index(self):
+        from src.search import HybridSearch
+        
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        engine = HybridSearch(config)
+        engine.index([
+            {'content': 'raft leader election', 'metadata': {'title': 'Raft'}},
+            {'content': 'paxos proposers', 'metadata': {'title': 'Paxos'}},
+        ])
+        engine.save(self.temp_dir)
+        
+        loaded = HybridSearch(config)
+        loaded.load(self.temp_dir)
+        results = loaded.search('raft', mode='keyword')
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['document']['metadata']['title'], 'Raft')
+        loaded.close()
+
+
+class TestQueryDaemon(unittest.TestCase):
+    """Test the warm query daemon and its client"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_search_through_daemon(self):
+        import threading
+        from src.search import HybridSearch
+        from src.index_store import IndexStore
+        from src.daemon import QueryDaemon, DaemonClient
+        
+        config = Config()
+        config.set('search.semantic.enabled', False)
+        
+        store = IndexStore(self.temp_dir)
+        version = store.new_version()
+        engine = HybridSearch(config)
+        engine.index([{'content': 'lamport clocks order events', 'metadata': {'title': 'Clocks'}}])
+        engine.save(version)
+        store.publish(version)
+        
+        self.assertIsNone(DaemonClient.connect(self.temp_dir))
+        
+        daemon = QueryDaemon(config, self.temp_dir, port=0)
+        thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        thread.start()
+        try:
+            for _ in range(100):
+                client = DaemonClient.connect(self.temp_dir)
+                if client is not None:
+                    break
+                time.sleep(0.02)
+            
+            self.assertIsNotNone(client)
+            results = client.search('lamport', mode='keyword')
+            self.assertEqual(len(results), 1)
+            self.assertEqual(results[0]['document']['metadata']['title'], 'Clocks')
+            self.assertEqual(results[0]['snippet'], 'lamport clocks order events')
+            self.assertEqual(results[0]['highlights'], [[0, 7]])
+            # The CLI shows daemon-side errors and falls back only when unreachable
+            with self.assertRaises(RuntimeError):
+                client._request('GET', '/missing')
+        finally:
+            daemon.shutdown()
+            thread.join(timeout=5)
+        
+        self.assertIsNone(DaemonClient.connect(self.temp_dir))
+        with self.assertRaises(OSError):
+            client.search('lamport', mode='keyword')
+
+
+class TestImportBudget(unittest.TestCase):
+    """Lightweight CLI commands must not import the heavy ML stack"""
+    
+    HEAVY_MODULES = [
+        'torch', 'sentence_transformers', 'faiss', 'sklearn', 'hdbscan',
+        'openai', 'tiktoken', 'numpy', 'requests'
+    ]
+    MAX_IMPORT_SECONDS = 1.5
+    
+    def setUp(self):
+        from src.index_store import IndexStore
+        
+        # A small published index, so `stats` loads and reports real documents
+        self.temp_dir = tempfile.mkdtemp()
+        notes = Path(self.temp_dir) / "notes"
+        notes.mkdir()
+        (notes / "clocks.md").write_text("# Lamport Clocks\n\nLogical clocks order events. #distributed")
+        (notes / "raft.md").write_text("# Raft\n\nLeader election and log replication. #consensus")
+        indexer = DocumentIndexer(Config())
+        indexer.index_directory(str(notes))
+        store = IndexStore(str(Path(self.temp_dir) / "index"))
+        version = store.new_version()
+        indexer.save_index(version / "documents.json")
+        store.publish(version)
+        self.index_path = str(store.root)
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def _run_cli(self, args):
+        import json
+        import subprocess
+        import sys
+        
+        code = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "from src import cli\n"
+            "elapsed = time.perf_counter() - start\n"
+            f"sys.argv = ['cli'] + {args!r}\n"
+            "try:\n"
+            "    cli.cli(standalone_mode=False)\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            f"heavy = [m for m in {self.HEAVY_MODULES!r} if m in sys.modules]\n"
+            "print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))\n"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=str(Path(__file__).parent.parent),
+            capture_output=True, text=True, check=True
+        ).stdout
+        report = json.loads(output.strip().splitlines()[-1])
+        report['output'] = output
+        return report
+    
+    def test_help(self):
+        report = self._run_cli(['--help'])
+        self.assertEqual(report['heavy'], [])
+        self.assertLess(report['elapsed'], self.MAX_IMPORT_SECONDS)
+    
+    def test_stats(self):
+        report = self._run_cli(['stats', '--index-path', self.index_path])
+        self.assertIn('Total Documents', report['output'])
+        self.assertIn('Lamport Clocks', report['output'])
+        for module in ('faiss', 'torch', 'sentence_transformers'):
+            self.assertNotIn(module, report['heavy'])
+        self.assertEqual(report['heavy'], [])
+        self.assertLess(report['elapsed'], self.MAX_IMPORT_SECONDS)
+
+
 def run_tests():
     """Run all tests"""
     unittest.main(argv=[''], exit=False, verbosity=2)